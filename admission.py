@@ -0,0 +1,64 @@
+"""
+Контроль допуску до кімнат під час підключення WebSocket
+
+Налаштування кімнат (таблиця rooms) тримаються в пам'яті: завантажуються при старті, перечитуються
+раз на ADMISSION_REFRESH_INTERVAL і одразу після зміни через API - підключення не робить запитів до БД.
+Ліміти:
+    rooms.max_users        - клієнтів у кімнаті (кімнати без запису - ROOM_DEFAULT_MAX_USERS, 0 - без обмеження)
+    MAX_CONNECTIONS        - усіх з'єднань сервера
+Відхилений клієнт отримує код закриття REFUSE_CLOSE_CODE і причину {"reason": ..., "retry_after": ...}
+з випадковим розкидом, щоб клієнти переповненої кімнати не поверталися одночасно.
+"""
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import config
+from logger import get_logger
+
+log = get_logger("admission")
+
+
+class RoomSettingsCache:
+    """Налаштування кімнат з таблиці rooms у пам'яті"""
+
+    def __init__(self):
+        self.rooms: Dict[str, dict] = {}
+
+    async def load(self, db):
+        """Перечитування таблиці (помилка БД залишає попередні налаштування)"""
+        try:
+            rooms = await db.get_rooms()
+        except Exception as e:
+            log.error("❌ Помилка завантаження налаштувань кімнат: %s", e)
+            return
+        self.rooms = {room["id"]: room for room in rooms}
+        log.debug("Завантажено налаштування кімнат: %d", len(self.rooms))
+
+    def get(self, room_id: str) -> Optional[dict]:
+        return self.rooms.get(room_id)
+
+    def max_users(self, room_id: str) -> int:
+        room = self.rooms.get(room_id)
+        if room is None or room["max_users"] is None:
+            return config.ROOM_DEFAULT_MAX_USERS
+        return room["max_users"]
+
+    async def run(self, db, interval: float = None):
+        """Фонова задача: періодичне перечитування (зміни в БД в обхід API)"""
+        interval = interval or config.ADMISSION_REFRESH_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            await self.load(db)
+
+
+room_settings = RoomSettingsCache()
+
+
+def check(room_id: str, room_size: int, total_connections: int) -> Optional[Tuple[str, float]]:
+    """Перевірка лімітів: (причина, базова затримка повтору) або None - підключення дозволено"""
+    if config.MAX_CONNECTIONS and total_connections >= config.MAX_CONNECTIONS:
+        return "server_full", config.ADMISSION_RETRY_AFTER
+    max_users = room_settings.max_users(room_id)
+    if max_users and room_size >= max_users:
+        return "room_full", config.ADMISSION_RETRY_AFTER
+    return None
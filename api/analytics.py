@@ -0,0 +1,110 @@
+"""
+Аналітика подій малювання
+
+Лічильники приватної кімнати (room_id=, group_by=room_id) видно лише з її токеном сесії.
+
+Запити читають лише агрегати event_rollup_minute / event_rollup_hour, які оновлюються при збереженні
+події (інтервал - за часом отримання сервером, а не за годинником клієнта), тож вартість запиту залежить від кількості інтервалів, а не від кількості подій.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+import auth
+import config
+from database import Database, ROLLUP_DIMENSIONS
+
+router = APIRouter()
+db = Database()
+
+GRANULARITY_SECONDS = {"minute": 60, "hour": 3600}
+
+
+def _local(moment: Optional[datetime]) -> Optional[datetime]:
+    # Мітки агрегатів - час отримання подій у локальному часі сервера (datetime.now())
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def _time_range(start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    start, end = _local(start), _local(end)
+    end = end or datetime.now()
+    start = start or end - timedelta(seconds=config.ANALYTICS_DEFAULT_RANGE)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start має бути раніше за end")
+    return start, end
+
+
+def _group_by(group_by: Optional[str]) -> Tuple[str, ...]:
+    columns = tuple(column.strip() for column in group_by.split(",") if column.strip()) if group_by else ()
+    unknown = [column for column in columns if column not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Невідомі поля group_by: {', '.join(unknown)} (доступні: {', '.join(ROLLUP_DIMENSIONS)})"
+        )
+    return tuple(dict.fromkeys(columns))
+
+
+def _visible(rows: List[dict], request: Request) -> List[dict]:
+    """Рядки з розбивкою по кімнатах без приватних кімнат, до яких у запиту немає доступу"""
+    return [row for row in rows if "room_id" not in row or auth.has_room_access(row["room_id"], request)]
+
+
+@router.get("/events")
+async def get_event_series(
+    request: Request,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = Query("auto", regex="^(auto|minute|hour)$"),
+    room_id: Optional[str] = None,
+    group_by: Optional[str] = Query(None, description="Через кому: room_id, platform, drawing_type, action"),
+):
+    """Кількість подій по хвилинах або годинах за [start, end) (інтервал, що містить end, включається)"""
+    if room_id is not None:
+        auth.require_room_access(room_id, request)
+    start, end = _time_range(start, end)
+    columns = _group_by(group_by)
+    span = (end - start).total_seconds()
+    if granularity == "auto":
+        granularity = "minute" if span <= config.ANALYTICS_MINUTE_MAX_RANGE else "hour"
+    if span / GRANULARITY_SECONDS[granularity] > config.ANALYTICS_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail="Забагато інтервалів: звузьте діапазон або збільште granularity")
+
+    series = _visible(await db.get_event_rollups(granularity, start, end, room_id, columns), request)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "granularity": granularity,
+        "room_id": room_id,
+        "group_by": list(columns),
+        "series": series,
+        "total": sum(point["count"] for point in series)
+    }
+
+
+@router.get("/summary")
+async def get_event_summary(
+    request: Request,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    room_id: Optional[str] = None,
+    group_by: Optional[str] = Query(None, description="Через кому: room_id, platform, drawing_type, action"),
+):
+    """Підсумок подій за [start, end) з точністю до хвилини"""
+    if room_id is not None:
+        auth.require_room_access(room_id, request)
+    start, end = _time_range(start, end)
+    columns = _group_by(group_by)
+
+    totals = _visible(await db.get_event_totals(start, end, room_id, columns), request)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "room_id": room_id,
+        "group_by": list(columns),
+        "totals": totals,
+        "total": sum(row["count"] for row in totals)
+    }
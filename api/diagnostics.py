@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+
+from loop_watchdog import watchdog
+
+router = APIRouter()
+
+@router.get("/loop")
+async def get_loop_status():
+    """Поточна затримка циклу подій"""
+    return {
+        "lag": round(watchdog.last_lag, 4),
+        "stall_threshold": watchdog.threshold,
+        "stalls_recorded": len(watchdog.stalls)
+    }
+
+@router.get("/stalls")
+async def get_stalls(limit: int = 20):
+    """Останні блокування циклу подій зі стеком та обробником"""
+    stalls = watchdog.recent_stalls()[:limit]
+    return {
+        "stall_threshold": watchdog.threshold,
+        "stalls": stalls,
+        "count": len(stalls)
+    }
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import List, Dict, Any
 import json
 from datetime import datetime
@@ -6,9 +6,20 @@ from datetime import datetime
 from database import Database
 from models.drawing_event import DrawingEvent
 from websocket_handler import ConnectionManager
+from logger import get_logger
+from metrics import messages_in
+import tracing
+import capture
+import auth
+import rate_limit
+import jobs
+from room_directory import room_directory
+from snapshots import room_snapshots
 
-router = APIRouter()
+# Усі маршрути - дані кімнати: приватна кімната - лише з токеном сесії
+router = APIRouter(dependencies=[Depends(auth.require_room_access)])
 db = Database()
+log = get_logger("events")
 
 # Тут буде передаватися менеджер з'єднань з main.py
 manager: ConnectionManager = None
@@ -19,18 +30,27 @@ def set_connection_manager(connection_manager: ConnectionManager):
     manager = connection_manager
 
 @router.post("/{room_id}")
-async def create_drawing_event(room_id: str, event: DrawingEvent):
+async def create_drawing_event(room_id: str, event: DrawingEvent, request: Request):
     """Створення нової події малювання"""
+    messages_in.inc(room_id, "drawing_event", "rest")
+    room_directory.activity(room_id)
+    rate_limit.enforce_rest(room_id, request)
+    capture.record_message(0, capture.ENDPOINT_REST, room_id, event.json())
+    with tracing.trace("rest.drawing_event", room=room_id, event_id=event.event_id):
+        return await _create_drawing_event(room_id, event)
+
+async def _create_drawing_event(room_id: str, event: DrawingEvent):
     # Зберігаємо подію в базі даних
     result = await db.save_drawing_event(room_id, event)
     
     if not result:
         raise HTTPException(status_code=409, detail=f"Подія з ID {event.event_id} вже існує")
+    room_snapshots.invalidate(room_id)
     
     # Виводимо детальну інформацію
-    print(f"✅ Збережено подію малювання: {event.event_id}")
-    print(f"📊 Тип: {event.drawing_type}, дія: {event.action}, платформа: {event.platform}")
-    print(f"🌐 Дані: {event.data}")
+    log.info("✅ Збережено подію малювання: %s (тип: %s, дія: %s, платформа: %s)",
+             event.event_id, event.drawing_type, event.action, event.platform)
+    log.debug("🌐 Дані: %s", event.data)
     
     # Відправляємо подію всім учасникам кімнати через WebSocket
     if manager:
@@ -46,7 +66,7 @@ async def create_drawing_event(room_id: str, event: DrawingEvent):
             "data": event.data if isinstance(event.data, dict) else event.data.dict()
         }
         
-        print(f"📡 Транслюємо подію: {event.event_id}")
+        log.debug("📡 Транслюємо подію: %s", event.event_id)
         await manager.broadcast_to_room(room_id, message)
     
     return {
@@ -56,15 +76,14 @@ async def create_drawing_event(room_id: str, event: DrawingEvent):
     }
 
 @router.get("/{room_id}")
-async def get_room_events(room_id: str):
-    """Отримання всіх подій малювання в кімнаті"""
-    events = await db.get_room_events(room_id)
-    
-    return {
-        "room_id": room_id,
-        "events": events,
-        "count": len(events)
-    }
+async def get_room_events(room_id: str, request: Request):
+    """Отримання всіх подій малювання в кімнаті (з ETag: без змін у кімнаті - 304)"""
+    async def build():
+        # Знімок великої кімнати кодується в пулі процесів (jobs.py)
+        return await jobs.build_snapshot(db, "events", room_id)
+    
+    # Одночасні запити (хвиля перепідключень) отримують один і той самий закодований знімок
+    return await room_snapshots.respond(request, "events", room_id, build)
 
 @router.get("/{room_id}/{event_id}")
 async def get_event(room_id: str, event_id: str):
@@ -94,6 +113,7 @@ async def delete_event(room_id: str, event_id: str):
     
     if not result:
         raise HTTPException(status_code=500, detail="Помилка видалення події")
+    room_snapshots.invalidate(room_id)
     
     # Повідомляємо всім учасникам кімнати про видалення
     if manager:
@@ -111,6 +131,7 @@ async def delete_event(room_id: str, event_id: str):
 async def clear_room_events(room_id: str):
     """Очищення всіх подій малювання в кімнаті"""
     await db.clear_room_events(room_id)
+    room_snapshots.invalidate(room_id)
     
     # Повідомляємо всім учасникам кімнати
     if manager:
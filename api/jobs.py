@@ -0,0 +1,57 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse
+
+import auth
+import jobs
+import room_transfer
+
+router = APIRouter()
+
+@router.get("/")
+async def list_jobs(request: Request):
+    """Завдання пулу процесів (останні JOBS_HISTORY завершених і всі незавершені)
+
+    Завдання приватної кімнати показуються лише з її токеном сесії.
+    """
+    listed = [jobs.manager.get(job_id) for job_id in list(jobs.manager.jobs)]
+    return {
+        "running": jobs.manager.running,
+        "pending": jobs.manager.pending,
+        "jobs": [job.describe() for job in listed if auth.has_room_access(job.room_id, request)]
+    }
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Статус і прогрес завдання"""
+    return _job(job_id, request).describe()
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str, request: Request):
+    """Скасування завдання"""
+    job = _job(job_id, request)
+    if not jobs.manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Завдання вже завершено ({job.status})")
+    return job.describe()
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str, request: Request):
+    """Результат завдання: файл експорту або підсумок імпорту"""
+    job = _job(job_id, request)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Завдання не виконано ({job.status})")
+    return job_result(job)
+
+def job_result(job: jobs.Job):
+    if job.kind == "export":
+        extension = room_transfer.FORMATS[job.result["format"]][1]
+        return FileResponse(job.result["path"], media_type="application/gzip",
+                            filename=f"{job.room_id}.{extension}.gz")
+    return {"room_id": job.room_id, **job.result}
+
+def _job(job_id: str, request: Request) -> jobs.Job:
+    job = jobs.manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Завдання {job_id} не знайдено")
+    # Дані приватної кімнати (файл експорту) - лише з токеном сесії, як і в /api/rooms
+    auth.require_room_access(job.room_id, request)
+    return job
@@ -1,13 +1,34 @@
-from fastapi import APIRouter, HTTPException
-from typing import Dict, List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Callable, Dict, List, Optional
 from datetime import datetime
+import asyncio
+import contextlib
+import math
+import os
 
+import config
 from database import Database
+from models.drawing import RoomSettings, RoomAuth
+import admission
+import auth
+import jobs
+import overload
+import rate_limit
+from metrics import connections_refused
+from room_directory import room_directory
+from room_stream import room_streams
+import room_transfer
+from snapshots import room_snapshots
 from websocket_handler import ConnectionManager
+from api.jobs import job_result
 
 router = APIRouter()
 db = Database()
 
+# Данные приватной комнаты - только с токеном сессии (Authorization: Bearer ... или ?token=...)
+room_access = [Depends(auth.require_room_access)]
+
 # Тут будет передаваться менеджер соединений из main.py
 manager: ConnectionManager = None
 
@@ -17,59 +38,94 @@ def set_connection_manager(connection_manager: ConnectionManager):
     manager = connection_manager
 
 @router.get("/")
-async def get_all_rooms():
-    """Получение списка всех активных комнат"""
-    if not manager:
-        return {"rooms": []}
-    
-    rooms_info = []
-    for room_id, user_count in manager.rooms.items():
-        rooms_info.append({
-            "room_id": room_id,
-            "users_count": user_count,
-            "status": "active"
-        })
+async def get_all_rooms(request: Request):
+    """Получение списка всех активных комнат (с ETag: неизменившийся список - 304)"""
+    def build():
+        rooms_info = []
+        for room_id in room_directory.rooms:
+            user_count = room_directory.users(room_id, "ws")
+            if user_count:
+                rooms_info.append({
+                    "room_id": room_id,
+                    "users_count": user_count,
+                    "status": "active"
+                })
+        return {"rooms": rooms_info}
     
-    return {"rooms": rooms_info}
+    return room_directory.respond(request, "active_rooms", build)
 
-@router.get("/{room_id}")
+@router.get("/{room_id}", dependencies=room_access)
 async def get_room_info(room_id: str):
     """Получение информации о конкретной комнате"""
     if not manager:
         raise HTTPException(status_code=503, detail="Сервис недоступен")
     
     room_info = manager.get_room_info(room_id)
+    stats = await db.get_room_stats(room_id)
     
     return {
         "room": room_info,
-        "drawings_count": len(await db.get_room_drawings(room_id)),
-        "templates_count": len(await db.get_room_templates(room_id))
+        "max_users": admission.room_settings.max_users(room_id),
+        "drawings_count": stats["drawings_count"],
+        "templates_count": stats["templates_count"],
+        "stats": stats
     }
 
-@router.get("/{room_id}/drawings")
-async def get_room_drawings(room_id: str):
-    """Получение всех рисунков в комнате"""
-    drawings = await db.get_room_drawings(room_id)
-    return {
-        "room_id": room_id,
-        "drawings": drawings,
-        "count": len(drawings)
-    }
+@router.get("/{room_id}/drawings", dependencies=room_access)
+async def get_room_drawings(room_id: str, request: Request):
+    """Получение всех рисунков в комнате (с ETag: без изменений в комнате - 304)"""
+    async def build():
+        # Снимок большой комнаты кодируется в пуле процессов (jobs.py)
+        return await jobs.build_snapshot(db, "drawings", room_id)
+    
+    # Одновременные запросы (волна переподключений) получают один и тот же закодированный снимок
+    return await room_snapshots.respond(request, "drawings", room_id, build)
 
-@router.get("/{room_id}/templates")
-async def get_room_templates(room_id: str):
-    """Получение всех шаблонов в комнате"""
-    templates = await db.get_room_templates(room_id)
-    return {
-        "room_id": room_id,
-        "templates": templates,
-        "count": len(templates)
-    }
+@router.get("/{room_id}/templates", dependencies=room_access)
+async def get_room_templates(room_id: str, request: Request):
+    """Получение всех шаблонов в комнате (с ETag; тела - по хешу через GET /api/templates/{hash})"""
+    async def build():
+        templates = await db.get_room_templates(room_id)
+        return {
+            "room_id": room_id,
+            "templates": templates,
+            "count": len(templates)
+        }
+    
+    return await room_snapshots.respond(request, "templates", room_id, build)
+
+@router.get("/{room_id}/stream")
+async def stream_room(room_id: str, request: Request, interval: float = 0.0, last_event_id: Optional[str] = None):
+    """Поток сообщений комнаты только для просмотра (SSE)
+    
+    interval - получать сообщения пакетами не чаще раза в interval секунд,
+    last_event_id - для клиентов, не умеющих заголовок Last-Event-ID. Токен сессии приватной комнаты -
+    Authorization: Bearer ... или ?token=... (браузерный EventSource заголовки не задает).
+    """
+    if overload.controller.shedding:
+        connections_refused.inc("overload")
+        raise HTTPException(status_code=503, detail="Сервер перегружен",
+                            headers={"Retry-After": str(math.ceil(overload.retry_hint(config.OVERLOAD_RETRY_AFTER)))})
+    if not auth.has_room_access(room_id, request):
+        connections_refused.inc("unauthorized")
+        raise HTTPException(status_code=401, detail="Нужен токен сессии комнаты")
+    if config.ROOM_STREAM_MAX_VIEWERS and room_streams.viewers_count >= config.ROOM_STREAM_MAX_VIEWERS:
+        connections_refused.inc("server_full")
+        raise HTTPException(status_code=503, detail="Превышено число зрителей",
+                            headers={"Retry-After": str(math.ceil(overload.retry_hint(config.ADMISSION_RETRY_AFTER)))})
+    if interval > 0:
+        interval = min(max(interval, config.ROOM_STREAM_MIN_INTERVAL), config.ROOM_STREAM_MAX_INTERVAL)
+    
+    events = room_streams.stream(room_id, request.headers.get("last-event-id") or last_event_id, max(interval, 0.0))
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-@router.delete("/{room_id}/drawings")
+@router.delete("/{room_id}/drawings", dependencies=room_access)
 async def clear_room_drawings(room_id: str):
     """Очистка всех рисунков в комнате"""
-    await db.clear_room_drawings(room_id)
+    async with overload.deferred_writer.clearing(room_id):
+        await db.clear_room_drawings(room_id)
+    room_snapshots.invalidate(room_id)
     
     # Уведомляем всех участников комнаты
     if manager:
@@ -81,6 +137,52 @@ async def clear_room_drawings(room_id: str):
     
     return {"message": f"Рисунки в комнате {room_id} очищены"}
 
+@router.put("/{room_id}/settings")
+async def update_room_settings(room_id: str, settings: RoomSettings, request: Request):
+    """Изменение настроек комнаты (ограничение участников действует для новых подключений)
+    
+    Непереданные поля не меняются. Приватную комнату меняет только владелец токена сессии
+    или текущего пароля (current_password).
+    """
+    current = admission.room_settings.get(room_id) or {}
+    if auth.is_private(current) and not auth.has_room_access(room_id, request):
+        rate_limit.enforce_rest(room_id, request)
+        if settings.current_password is None or \
+                not await auth.verify_password(room_id, settings.current_password, current["password"]):
+            raise HTTPException(status_code=401, detail="Нужен токен сессии или текущий пароль комнаты",
+                                headers={"WWW-Authenticate": "Bearer"})
+    name = current.get("name") if settings.name is None else settings.name
+    max_users = current.get("max_users") if settings.max_users is None else settings.max_users
+    if max_users is not None and max_users < 0:
+        raise HTTPException(status_code=400, detail="max_users не может быть отрицательным")
+    is_private = current.get("is_private", False) if settings.is_private is None else settings.is_private
+    password = current.get("password")
+    if settings.password is not None:
+        password = await auth.hash_password(settings.password) if settings.password else None
+    if is_private and not password:
+        raise HTTPException(status_code=400, detail="Приватной комнате нужен пароль")
+    await db.save_room(room_id, name, max_users, is_private, password)
+    await admission.room_settings.load(db)
+    return {
+        "room_id": room_id,
+        "name": name,
+        "max_users": admission.room_settings.max_users(room_id),
+        "is_private": is_private
+    }
+
+@router.post("/{room_id}/auth")
+async def authenticate(room_id: str, credentials: RoomAuth, request: Request):
+    """Вход в приватную комнату: токен сессии для подключения /ws/{room_id}?token=..."""
+    rate_limit.enforce_rest(room_id, request)
+    room = admission.room_settings.get(room_id)
+    if auth.is_private(room) and not await auth.verify_password(room_id, credentials.password, room["password"]):
+        raise HTTPException(status_code=401, detail="Неверный пароль")
+    return {
+        "room_id": room_id,
+        "token": auth.create_session_token(room_id),
+        "expires_in": config.AUTH_TOKEN_TTL
+    }
+
 @router.post("/{room_id}/join")
 async def join_room(room_id: str):
     """Информация для подключения к комнате"""
@@ -90,24 +192,109 @@ async def join_room(room_id: str):
         "message": f"Подключитесь к WebSocket по адресу ws://your-server/ws/{room_id}"
     }
 
-@router.get("/{room_id}/export")
-async def export_room_data(room_id: str):
-    """Экспорт данных комнаты"""
+@router.get("/{room_id}/export", dependencies=room_access)
+async def export_room_data(room_id: str, request: Request, format: Optional[str] = None,
+                           background: Optional[bool] = None):
+    """Экспорт данных комнаты (ETag - по сохраненным данным; room_info и exported_at его не меняют)
+    
+    format=ndjson или geojsonseq - экспорт в gzip для переноса комнаты (room_transfer.py). Небольшая комната
+    отдается потоком сразу; комната от JOBS_OFFLOAD_MIN_ROWS записей (или background=true) экспортируется
+    в пуле процессов: ответ 202, файл - через GET /api/jobs/{job_id}/result. С background=false большая
+    комната тоже экспортируется в пуле, но ответ ждет готовый файл (не потоком).
+    """
+    if format is not None:
+        if format not in room_transfer.FORMATS:
+            raise HTTPException(status_code=400, detail=f"Неизвестный формат: {format}")
+        stats = await db.get_room_stats(room_id)
+        total = stats["drawings_count"] + stats["events_count"] + stats["templates_count"]
+        large = total >= config.JOBS_OFFLOAD_MIN_ROWS
+        extension = room_transfer.FORMATS[format][1]
+        if not large and not background:
+            return StreamingResponse(room_transfer.export_room(db, room_id, format), media_type="application/gzip",
+                                     headers={"Content-Disposition": f'attachment; filename="{room_id}.{extension}.gz"'})
+        if background is None:
+            background = True
+        path = jobs.manager.result_path(f".{extension}.gz")
+        return await _run_job("export", room_id, background, jobs.export_job,
+                              db.db_path, room_id, format, path, total)
+    not_modified = room_snapshots.not_modified(request, room_id)
+    if not_modified is not None:
+        return not_modified
+    etag = room_snapshots.etag(room_id)
     drawings = await db.get_room_drawings(room_id)
-    templates = await db.get_room_templates(room_id)
+    templates = await db.get_room_templates(room_id, with_data=True)
+    stats = await db.get_room_stats(room_id)
     
     room_info = None
     if manager:
         room_info = manager.get_room_info(room_id)
     
-    return {
+    return JSONResponse({
         "room_id": room_id,
         "exported_at": datetime.now().isoformat(),
         "room_info": room_info,
         "drawings": drawings,
         "templates": templates,
-        "stats": {
-            "drawings_count": len(drawings),
-            "templates_count": len(templates)
-        }
-    }
+        "stats": stats
+    }, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.post("/{room_id}/import", dependencies=room_access)
+async def import_room_data(room_id: str, request: Request, background: bool = False):
+    """Импорт данных в комнату из потока экспорта (NDJSON или GeoJSONSeq, gzip или без сжатия)
+    
+    Запись пачками по IMPORT_BATCH_SIZE, каждая пачка - одна транзакция; события с уже существующим
+    event_id и имеющиеся в комнате шаблоны пропускаются. Тело (не больше MAX_UPLOAD_SIZE) сохраняется во
+    временный файл и импортируется в пуле процессов; с background=true ответ 202 сразу (статус - GET /api/jobs/{job_id}).
+    """
+    if overload.controller.shedding:
+        raise HTTPException(status_code=503, detail="Сервер перегружен",
+                            headers={"Retry-After": str(math.ceil(overload.retry_hint(config.OVERLOAD_RETRY_AFTER)))})
+    too_large = HTTPException(status_code=413, detail=f"Файл импорта больше {config.MAX_UPLOAD_SIZE} байт")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > config.MAX_UPLOAD_SIZE:
+        raise too_large
+    path = jobs.manager.result_path(".upload")
+    loop = asyncio.get_running_loop()
+    written = 0
+    try:
+        with open(path, "wb") as upload:
+            async for chunk in request.stream():
+                written += len(chunk)
+                if written > config.MAX_UPLOAD_SIZE:
+                    raise too_large
+                await loop.run_in_executor(None, upload.write, chunk)
+    except BaseException:
+        # Превышение размера или обрыв загрузки: неполный файл не остается на диске
+        # (если файл не удалось даже создать, исходная ошибка не подменяется)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        raise
+    
+    def imported(job: jobs.Job):
+        room_snapshots.invalidate(room_id)
+        # Отмененное в очереди задание файл не удалило
+        if os.path.exists(path):
+            os.unlink(path)
+    
+    return await _run_job("import", room_id, background, jobs.import_job, db.db_path, room_id, path,
+                          on_done=imported)
+
+async def _run_job(kind: str, room_id: str, background: bool, function: Callable, *args,
+                   on_done: Optional[Callable] = None):
+    """Задание в пуле процессов: 202 с описанием задания или ожидание и его результат"""
+    job = jobs.manager.submit(kind, room_id, function, *args, on_done=on_done)
+    if job is None:
+        if on_done is not None:
+            on_done(None)
+        raise HTTPException(status_code=503, detail="Очередь заданий заполнена",
+                            headers={"Retry-After": str(math.ceil(config.OVERLOAD_RETRY_AFTER))})
+    if background:
+        return JSONResponse(job.describe(), status_code=202, headers={"Location": f"/api/jobs/{job.id}"})
+    
+    # Отключение клиента не отменяет задание: результат остается доступен через /api/jobs
+    await asyncio.shield(job.task)
+    if job.status != "done":
+        raise HTTPException(status_code=500, detail={"job_id": job.id, "status": job.status, "error": job.error})
+    if isinstance(job.result, dict) and "error" in job.result:
+        raise HTTPException(status_code=400, detail={"error": job.result["error"], "imported": job.result["imported"]})
+    return job_result(job)
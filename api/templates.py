@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from database import Database
+from snapshots import etag_matches
+
+router = APIRouter()
+db = Database()
+
+# Тіло за хешем вмісту ніколи не змінюється - клієнти та проксі кешують його без перевірки
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@router.get("/{template_hash}")
+async def get_template(template_hash: str, request: Request):
+    """Тіло шаблону за хешем вмісту (sha256)"""
+    headers = {"ETag": f'"{template_hash}"', "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    data = await db.get_template_blob(template_hash)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Шаблон не знайдено")
+    return Response(content=data, media_type="application/json", headers=headers)
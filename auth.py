@@ -0,0 +1,112 @@
+"""
+Автентифікація в приватних кімнатах
+
+Пароль (bcrypt, rooms.password) перевіряється один раз - POST /api/rooms/{room_id}/auth видає короткочасний
+підписаний токен сесії (JWT), з яким клієнт підключається (і перепідключається) як /ws/{room_id}?token=...
+Перевірка токена - це лише HMAC, тож серія перепідключень під час збою мережі не коштує bcrypt.
+Робота bcrypt виконується в пулі потоків, одночасно не більше AUTH_MAX_CONCURRENT_HASHES операцій,
+а успішні перевірки пароля запам'ятовуються на AUTH_VERIFY_CACHE_TTL.
+REST-запити до даних приватної кімнати передають той самий токен: Authorization: Bearer ... або ?token=...
+"""
+import asyncio
+import hashlib
+import hmac
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+
+import admission
+import config
+from logger import get_logger
+
+log = get_logger("auth")
+
+TOKEN_ALGORITHM = "HS256"
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_executor = ThreadPoolExecutor(max_workers=config.AUTH_MAX_CONCURRENT_HASHES, thread_name_prefix="bcrypt")
+_hash_slots: Optional[asyncio.Semaphore] = None
+
+# Успішні перевірки: (кімната, HMAC пароля) -> (хеш із БД, час завершення дії)
+_verified: Dict[Tuple[str, str], Tuple[str, float]] = {}
+
+
+async def _run_hashing(function, *args):
+    """Виконання bcrypt у пулі потоків з обмеженням одночасних операцій"""
+    global _hash_slots
+    if _hash_slots is None:
+        _hash_slots = asyncio.Semaphore(config.AUTH_MAX_CONCURRENT_HASHES)
+    async with _hash_slots:
+        return await asyncio.get_running_loop().run_in_executor(_executor, function, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run_hashing(pwd_context.hash, password)
+
+
+def _fingerprint(password: str) -> str:
+    # Пароль у відкритому вигляді не зберігається навіть у пам'яті
+    return hmac.new(config.AUTH_SECRET_KEY.encode(), password.encode(), hashlib.sha256).hexdigest()
+
+
+async def verify_password(room_id: str, password: str, hashed: str) -> bool:
+    """Перевірка пароля кімнати (повторна перевірка того ж пароля - з кешу)"""
+    key = (room_id, _fingerprint(password))
+    now = time.monotonic()
+    cached = _verified.get(key)
+    if cached is not None and cached[0] == hashed and cached[1] > now:
+        return True
+    try:
+        valid = await _run_hashing(pwd_context.verify, password, hashed)
+    except ValueError:
+        log.error("❌ Некоректний хеш пароля кімнати %s", room_id)
+        return False
+    if valid:
+        if len(_verified) >= config.AUTH_VERIFY_CACHE_SIZE:
+            _verified.clear()
+        _verified[key] = (hashed, now + config.AUTH_VERIFY_CACHE_TTL)
+    return valid
+
+
+def create_session_token(room_id: str) -> str:
+    """Підписаний токен доступу до кімнати на AUTH_TOKEN_TTL секунд"""
+    return jwt.encode({"room": room_id, "exp": int(time.time() + config.AUTH_TOKEN_TTL)},
+                      config.AUTH_SECRET_KEY, algorithm=TOKEN_ALGORITHM)
+
+
+def verify_session_token(room_id: str, token: Optional[str]) -> bool:
+    if not token:
+        return False
+    try:
+        claims = jwt.decode(token, config.AUTH_SECRET_KEY, algorithms=[TOKEN_ALGORITHM])
+    except JWTError:
+        return False
+    return claims.get("room") == room_id
+
+
+def is_private(room: Optional[dict]) -> bool:
+    return bool(room and room["is_private"] and room["password"])
+
+
+def request_token(request: Request) -> Optional[str]:
+    """Токен сесії запиту: заголовок Authorization: Bearer ... або параметр token"""
+    scheme, _, value = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and value.strip():
+        return value.strip()
+    return request.query_params.get("token")
+
+
+def has_room_access(room_id: str, request: Request) -> bool:
+    return not is_private(admission.room_settings.get(room_id)) or verify_session_token(room_id, request_token(request))
+
+
+def require_room_access(room_id: str, request: Request):
+    """Залежність FastAPI для REST-доступу до даних кімнати: приватна кімната - лише з токеном сесії"""
+    if not has_room_access(room_id, request):
+        raise HTTPException(status_code=401, detail="Потрібен токен сесії кімнати",
+                            headers={"WWW-Authenticate": "Bearer"})
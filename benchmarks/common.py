@@ -0,0 +1,151 @@
+"""
+Спільні засоби для бенчмарків: запуск сервера, метрики, статистика, формат результатів
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    """Вільний TCP-порт на localhost"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_server(repo_dir: str = REPO_ROOT, port: Optional[int] = None, env: Optional[Dict[str, str]] = None,
+                 startup_timeout: float = 30.0):
+    """Запуск збірки сервера з repo_dir на localhost в окремому процесі з тимчасовою БД
+
+    Робоча директорія - тимчасова, тому drawing_sync.db та static/ не зачіпають репозиторій.
+    """
+    port = port or free_port()
+    workdir = tempfile.mkdtemp(prefix="drawing-sync-bench-")
+    process_env = dict(os.environ)
+    process_env["PYTHONPATH"] = os.path.abspath(repo_dir)
+    process_env.setdefault("LOG_LEVEL", "WARNING")
+    process_env.update(env or {})
+    log_file = open(os.path.join(workdir, "server.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env=process_env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Сервер завершився з кодом {process.returncode}, лог: {workdir}/server.log")
+            try:
+                with urllib.request.urlopen(f"{base_url}/api/status", timeout=1):
+                    break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Сервер не запустився вчасно")
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log_file.close()
+
+
+def ws_url(base_url: str) -> str:
+    """http://host -> ws://host"""
+    if base_url.startswith("https://"):
+        return "wss://" + base_url[len("https://"):]
+    return "ws://" + base_url.split("://", 1)[-1]
+
+
+def scrape_metrics(base_url: str) -> Dict[str, float]:
+    """Зчитування /metrics сервера: "назва{мітки}" -> значення"""
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+        text = response.read().decode("utf-8")
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, _, value = line.rpartition(" ")
+        try:
+            values[name] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+def percentile(sorted_samples: Sequence[float], pct: float) -> float:
+    """Перцентиль з лінійною інтерполяцією (вибірка має бути відсортована)"""
+    if not sorted_samples:
+        return 0.0
+    rank = (len(sorted_samples) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_samples) - 1)
+    return sorted_samples[low] + (sorted_samples[high] - sorted_samples[low]) * (rank - low)
+
+
+def metric(value: float, unit: str, better: str, samples: Optional[Iterable[float]] = None) -> dict:
+    """Запис метрики результату; better - "lower" або "higher" (використовується детектором регресій)"""
+    entry = {"value": round(value, 6), "unit": unit, "better": better}
+    if samples is not None:
+        entry["samples"] = [round(sample, 6) for sample in samples]
+    return entry
+
+
+def latency_metrics(prefix: str, latencies_seconds: List[float]) -> Dict[str, dict]:
+    """p50/p95/p99/max затримок у мілісекундах"""
+    ordered = sorted(latencies_seconds)
+    result = {}
+    for pct in (50, 95, 99):
+        result[f"{prefix}_p{pct}_ms"] = metric(percentile(ordered, pct) * 1000, "ms", "lower")
+    result[f"{prefix}_max_ms"] = metric((ordered[-1] if ordered else 0.0) * 1000, "ms", "lower")
+    return result
+
+
+def make_result(benchmark: str, parameters: dict, metrics: Dict[str, dict]) -> dict:
+    """Машинозчитуваний результат бенчмарку"""
+    return {
+        "benchmark": benchmark,
+        "created_at": datetime.now().isoformat(),
+        "parameters": parameters,
+        "metrics": metrics,
+    }
+
+
+def write_result(result: dict, output: Optional[str]):
+    """Друк результату та збереження у файл"""
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    print(text)
+
+
+def format_comparison(current: Dict[str, dict], baseline: Dict[str, dict]) -> str:
+    """Markdown-таблиця: базовий прогін, поточний, зміна (+ погіршення позначається ⚠️)"""
+    lines = ["| Метрика | База | Поточний | Зміна |", "|---|---|---|---|"]
+    for name, entry in current.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        change = ""
+        if old["value"]:
+            delta = (entry["value"] - old["value"]) / abs(old["value"]) * 100
+            worse = delta > 0 if entry.get("better", "lower") == "lower" else delta < 0
+            change = f"{delta:+.1f}%" + (" ⚠️" if worse and abs(delta) >= 5 else "")
+        lines.append(f"| {name} | {old['value']:.3f} | {entry['value']:.3f} | {change} |")
+    return "\n".join(lines)
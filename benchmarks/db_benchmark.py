@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Мікробенчмарк методів Database на синтетичних історіях інцидентів
+
+Для кожного розміру N створюється тимчасова БД, де цільова кімната містить N подій
+малювання та N команд (полігони, лінії, маркери), а інші кімнати - фонові дані.
+Кожен метод вимірюється кілька разів; результат - таблиця медіан і JSON.
+
+Запуск з кореня репозиторію:
+    python -m benchmarks.db_benchmark --sizes 1000,10000,100000
+    python -m benchmarks.db_benchmark --sizes 100000,1000000 --output db.json --baseline db_old.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.common import make_result, metric, write_result
+from database import Database, init_db
+from models.drawing_event import DrawingEvent
+
+TARGET_ROOM = "incident-0"
+DRAWING_TYPES = ("polygon", "line", "marker")
+PLATFORMS = ("android", "windows")
+BATCH = 10000
+
+
+def generate_history(db_path: str, size: int, rooms: int, background: float, seed: int):
+    """Заповнення БД синтетичною історією напряму через sqlite3 (пакетні транзакції)"""
+    rng = random.Random(seed)
+    start = datetime(2025, 9, 9, 12, 0, 0)
+    conn = sqlite3.connect(db_path)
+
+    # Цільова кімната отримує N рядків, інші - N * background сумарно
+    room_sizes = [(TARGET_ROOM, size)]
+    others = max(0, rooms - 1)
+    for index in range(1, rooms):
+        room_sizes.append((f"incident-{index}", int(size * background / others)))
+
+    event_counter = 0
+    for room_id, count in room_sizes:
+        events, commands = [], []
+        shape_points = 0
+        drawing_type = "polygon"
+        for index in range(count):
+            if shape_points == 0:
+                drawing_type = rng.choice(DRAWING_TYPES)
+                shape_points = 1 if drawing_type == "marker" else rng.randint(3, 40)
+            shape_points -= 1
+            action = "finish" if shape_points == 0 and drawing_type != "marker" else "add_point"
+            lat = 48.0 + rng.random()
+            lon = 30.0 + rng.random()
+            timestamp = (start + timedelta(milliseconds=index * 50)).isoformat()
+            event_counter += 1
+            events.append((
+                f"evt-{event_counter}", None, room_id, drawing_type, action, rng.choice(PLATFORMS),
+                json.dumps({"color": "#FF0000", "width": 3.0, "fill": drawing_type == "polygon", "opacity": 0.7}),
+                json.dumps({"lat": lat, "lon": lon}), timestamp,
+            ))
+            commands.append((room_id, lat, lon, action, "#FF0000", 5, "brush", timestamp))
+            if len(events) >= BATCH:
+                _flush(conn, events, commands)
+        _flush(conn, events, commands)
+
+    # Версії застосунку: історія релізів по платформах
+    versions = [
+        (platform, f"1.{index}.0", f"/api/updates/download/{platform}", 1000, "notes", False,
+         (start + timedelta(minutes=index)).isoformat())
+        for index in range(max(10, size // 100)) for platform in ("android", "windows", "linux")
+    ]
+    conn.executemany(
+        "INSERT INTO app_versions (platform, version, download_url, file_size, release_notes, is_required, created_at)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)", versions)
+    conn.commit()
+    conn.close()
+
+
+def _flush(conn: sqlite3.Connection, events: list, commands: list):
+    conn.executemany(
+        "INSERT INTO drawing_events (event_id, event_name, room_id, drawing_type, action, platform, style, data, timestamp)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", events)
+    conn.executemany(
+        "INSERT INTO drawing_commands (room_id, x, y, action, color, size, tool, timestamp)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", commands)
+    conn.commit()
+    events.clear()
+    commands.clear()
+
+
+async def time_call(factory: Callable, repeat: int) -> List[float]:
+    """Тривалості repeat викликів корутини, секунди"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await factory()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def benchmark_size(db_path: str, size: int, repeat: int, inserts: int) -> Dict[str, List[float]]:
+    db = Database(db_path)
+    results: Dict[str, List[float]] = {}
+
+    results["get_room_events"] = await time_call(lambda: db.get_room_events(TARGET_ROOM), repeat)
+    results["get_room_drawings"] = await time_call(lambda: db.get_room_drawings(TARGET_ROOM), repeat)
+    results["get_latest_version"] = await time_call(lambda: db.get_latest_version("android"), repeat)
+
+    # Вставка: окремі виклики, як під час інциденту
+    counter = iter(range(inserts * repeat))
+
+    def new_event():
+        return DrawingEvent(
+            event_id=f"bench-{size}-{next(counter)}", drawing_type="polygon", action="add_point",
+            platform="android", data={"lat": 48.5, "lon": 30.5})
+
+    results["save_drawing_event"] = await time_call(lambda: db.save_drawing_event(TARGET_ROOM, new_event()), inserts)
+
+    # Очищення руйнує дані - вимірюється один раз, останнім
+    results["clear_room_events"] = await time_call(lambda: db.clear_room_events(TARGET_ROOM), 1)
+    return results
+
+
+def format_table(sizes: List[int], medians: Dict[str, Dict[int, float]],
+                 baseline: Optional[Dict[str, dict]] = None) -> str:
+    """Markdown-таблиця медіан (мс); з базовою лінією - зміна у відсотках"""
+    header = "| Метод | " + " | ".join(f"N={size:,}" for size in sizes) + " |"
+    lines = [header, "|" + "---|" * (len(sizes) + 1)]
+    for method, by_size in medians.items():
+        cells = []
+        for size in sizes:
+            value = by_size.get(size)
+            cell = f"{value:.2f}" if value is not None else "-"
+            old = (baseline or {}).get(f"{method}@{size}_ms")
+            if value is not None and old and old["value"]:
+                cell += f" ({(value - old['value']) / old['value'] * 100:+.0f}%)"
+            cells.append(cell)
+        lines.append(f"| {method} | " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+async def run(args) -> dict:
+    sizes = [int(size) for size in args.sizes.split(",")]
+    medians: Dict[str, Dict[int, float]] = {}
+    metrics: Dict[str, dict] = {}
+
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix="drawing-sync-dbbench-")
+        db_path = os.path.join(workdir, "bench.db")
+        try:
+            await init_db(db_path)
+            started = time.perf_counter()
+            generate_history(db_path, size, args.rooms, args.background, args.seed)
+            print(f"📦 N={size:,}: історію згенеровано за {time.perf_counter() - started:.1f} с "
+                  f"({os.path.getsize(db_path) / 1024 / 1024:.1f} МБ)")
+
+            for method, samples in (await benchmark_size(db_path, size, args.repeat, args.inserts)).items():
+                median_ms = statistics.median(samples) * 1000
+                medians.setdefault(method, {})[size] = median_ms
+                metrics[f"{method}@{size}_ms"] = metric(median_ms, "ms", "lower", [s * 1000 for s in samples])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["metrics"]
+    print()
+    print(format_table(sizes, medians, baseline))
+    print()
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк методів Database на великих історіях")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Розміри цільової кімнати через кому")
+    parser.add_argument("--rooms", type=int, default=20, help="Кількість кімнат")
+    parser.add_argument("--background", type=float, default=1.0,
+                        help="Обсяг даних інших кімнат відносно цільової")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторів для методів читання")
+    parser.add_argument("--inserts", type=int, default=200, help="Кількість вимірюваних вставок")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора даних")
+    parser.add_argument("--baseline", help="JSON попереднього прогону для порівняння в таблиці")
+    parser.add_argument("--output", help="Файл для JSON-результату")
+    args = parser.parse_args()
+
+    metrics = asyncio.run(run(args))
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    write_result(make_result("db_benchmark", parameters, metrics), args.output)
+
+
+if __name__ == "__main__":
+    main()
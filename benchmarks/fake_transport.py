@@ -0,0 +1,195 @@
+"""
+Детермінований in-process транспорт WebSocket для моделювання розсилки
+
+FakeWebSocket реалізує ту частину інтерфейсу starlette.WebSocket, яку використовують
+ConnectionManager і handle_websocket_connection, і моделює канал до клієнта:
+затримку, пропускну здатність з обмеженим буфером (зворотний тиск на відправника),
+розкид затримки та відмови. VirtualTimeLoop - цикл подій з віртуальним часом:
+asyncio.sleep не чекає реально, а зсуває годинник, тож тисячі клієнтів з
+секундними затримками моделюються швидко і відтворювано (при однаковому seed).
+"""
+import asyncio
+import json
+import random
+import selectors
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import WebSocketDisconnect
+
+_DISCONNECT = object()
+
+
+class VirtualClockSelector(selectors.BaseSelector):
+    """Селектор, що замість очікування тайм-ауту зсуває віртуальний годинник"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self):
+        self._selector.close()
+
+    def select(self, timeout=None):
+        # Реальні дескриптори (self-pipe циклу) перевіряються без очікування
+        events = self._selector.select(0 if timeout is not None else 0.01)
+        if not events and timeout:
+            self.now += timeout
+        return events
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Цикл подій з віртуальним часом"""
+
+    def __init__(self):
+        self._virtual_selector = VirtualClockSelector()
+        super().__init__(selector=self._virtual_selector)
+
+    def time(self) -> float:
+        return self._virtual_selector.now
+
+
+def run_virtual(coroutine):
+    """Виконання корутини у VirtualTimeLoop"""
+    loop = VirtualTimeLoop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _ping_ids(data: str) -> List[int]:
+    message = json.loads(data)
+    messages = message.get("messages", []) if message.get("type") == "batch" else [message]
+    return [item["id"] for item in messages if item.get("type") == "ping"]
+
+
+class LinkProfile:
+    """Параметри каналу до одного клієнта"""
+
+    def __init__(self, latency: float = 0.02, bandwidth: Optional[float] = None, jitter: float = 0.0,
+                 buffer_bytes: int = 64 * 1024, failure_rate: float = 0.0, fail_after: Optional[int] = None,
+                 vanish_after: Optional[int] = None):
+        self.latency = latency            # Затримка в один бік, секунди
+        self.bandwidth = bandwidth        # Байт/с до клієнта; None - без обмеження
+        self.jitter = jitter              # Додаткова випадкова затримка 0..jitter
+        self.buffer_bytes = buffer_bytes  # Буфер відправки; при переповненні send_text чекає
+        self.failure_rate = failure_rate  # Імовірність обриву на кожній відправці
+        self.fail_after = fail_after      # Обрив після N відправок
+        self.vanish_after = vanish_after  # Клієнт "зникає" без закриття після N відправок
+
+
+class FakeWebSocket:
+    """Віртуальне з'єднання: серверна сторона - інтерфейс WebSocket, клієнтська - client_*"""
+
+    def __init__(self, name: str, profile: LinkProfile, rng: random.Random,
+                 on_receive: Optional[Callable[["FakeWebSocket", float, str], None]] = None,
+                 query_params: Optional[dict] = None, headers: Optional[dict] = None, auto_pong: bool = False):
+        self.name = name
+        self.profile = profile
+        self.rng = rng
+        self.on_receive = on_receive
+        # Клієнт відповідає на {"type": "ping"} сервера, як DrawingSyncClient
+        self.auto_pong = auto_pong
+        self.query_params = query_params or {}
+        self.headers = headers or {}
+        self.client = (name, 0)
+        self.accepted = False
+        self.closed = False
+        self.vanished = False
+        self.failed = False
+        self.close_code: Optional[int] = None
+        self.close_reason: Optional[str] = None
+        self.sent_count = 0
+        self.sent_bytes = 0
+        # (віртуальний час доставки, текст)
+        self.deliveries: List[Tuple[float, str]] = []
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._link_free_at = 0.0
+
+    # --- Серверна сторона (інтерфейс starlette.WebSocket) ---
+
+    async def accept(self, subprotocol: Optional[str] = None):
+        self.accepted = True
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        if self.closed:
+            return
+        self.closed = True
+        self.close_code = code
+        self.close_reason = reason
+        self._inbox.put_nowait(_DISCONNECT)
+
+    async def send_text(self, data: str):
+        if self.closed:
+            raise RuntimeError("Cannot call 'send' once a close message has been sent.")
+        profile = self.profile
+        self.sent_count += 1
+        if (profile.fail_after is not None and self.sent_count > profile.fail_after) or \
+                (profile.failure_rate and self.rng.random() < profile.failure_rate):
+            self.closed = True
+            self.failed = True
+            self._inbox.put_nowait(_DISCONNECT)
+            raise ConnectionResetError(f"{self.name}: з'єднання розірване")
+
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        size = len(data.encode("utf-8"))
+        self.sent_bytes += size
+        transmit = size / profile.bandwidth if profile.bandwidth else 0.0
+        self._link_free_at = max(now, self._link_free_at) + transmit
+        if profile.bandwidth:
+            # Буфер переповнений - відправник чекає, поки канал його розвантажить
+            backlog = self._link_free_at - now - profile.buffer_bytes / profile.bandwidth
+            if backlog > 0:
+                await asyncio.sleep(backlog)
+
+        if profile.vanish_after is not None and self.sent_count > profile.vanish_after:
+            # Зомбі-з'єднання: відправка "вдається", але клієнт нічого не отримує
+            self.vanished = True
+            return
+        arrival = self._link_free_at + profile.latency + (self.rng.uniform(0, profile.jitter) if profile.jitter else 0.0)
+        self.deliveries.append((arrival, data))
+        if self.on_receive is not None:
+            loop.call_at(arrival, self.on_receive, self, arrival, data)
+        if self.auto_pong and '"ping"' in data:
+            for ping_id in _ping_ids(data):
+                loop.call_at(arrival, self.client_send, json.dumps({"type": "pong", "id": ping_id}))
+
+    async def send_json(self, data, mode: str = "text"):
+        await self.send_text(json.dumps(data))
+
+    async def receive_text(self) -> str:
+        item = await self._inbox.get()
+        if item is _DISCONNECT:
+            raise WebSocketDisconnect(self.close_code or 1000)
+        return item
+
+    async def receive_json(self, mode: str = "text"):
+        return json.loads(await self.receive_text())
+
+    # --- Клієнтська сторона ---
+
+    def client_send(self, text: str):
+        """Клієнт надсилає повідомлення (надійде на сервер через latency)"""
+        if self.vanished:
+            return
+        asyncio.get_running_loop().call_later(self.profile.latency, self._inbox.put_nowait, text)
+
+    def client_disconnect(self, code: int = 1000):
+        """Клієнт закриває з'єднання"""
+        if self.closed:
+            return
+        self.close_code = code
+        asyncio.get_running_loop().call_later(self.profile.latency, self._inbox.put_nowait, _DISCONNECT)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Відтворюване моделювання розсилки на віртуальних клієнтах (без мережі і без БД)
+
+Тисячі FakeWebSocket-клієнтів підключаються в одному процесі до ConnectionManager (--engine manager,
+як /ws/{room_id}, але без запису в БД) або до handle_websocket_connection (--engine legacy, /ws/old/{room}).
+Час віртуальний: затримки, пропускна здатність і відмови моделюються детерміновано за --seed, тож два
+алгоритми розсилки порівнюються на однаковому "мережевому" сценарії.
+
+Запуск з кореня репозиторію:
+    python -m benchmarks.fanout_sim --rooms 5 --clients 500 --rate 5 --duration 10 --output sim.json
+    python -m benchmarks.fanout_sim --engine legacy --slow-fraction 0.05 --slow-bandwidth 2 --baseline sim.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import List
+
+from benchmarks.common import format_comparison, latency_metrics, make_result, metric, write_result
+from benchmarks.fake_transport import FakeWebSocket, LinkProfile, run_virtual
+from benchmarks.load_generator import extract_stamp
+from logger import ROOT_LOGGER
+import config
+from websocket_handler import UKRAINE_REGIONS, ConnectionManager, handle_websocket_connection, legacy_manager
+
+ENGINES = ("manager", "legacy")
+
+
+async def manager_session(manager: ConnectionManager, websocket: FakeWebSocket, room: str, batching: bool):
+    """Обробка з'єднання /ws/{room_id} для повідомлень рисування (без збереження в БД)"""
+    if not await manager.connect(websocket, room, batching=batching, heartbeat=websocket.auto_pong):
+        return
+    try:
+        while True:
+            message = json.loads(await websocket.receive_text())
+            if manager.record_inbound(websocket, message):
+                continue
+            await manager.broadcast_to_room(room, {
+                "type": "drawing_event",
+                "action": message.get("action", "unknown"),
+                "data": message.get("data", {}),
+            }, exclude=websocket)
+    except Exception:
+        pass
+    finally:
+        await manager.disconnect(websocket, room)
+
+
+def build_message(engine: str, client_id: int, seq: int, now: float, rng: random.Random) -> str:
+    stamp = {"c": client_id, "s": seq, "t": now}
+    lat = 50.45 + rng.uniform(-0.05, 0.05)
+    lon = 30.52 + rng.uniform(-0.05, 0.05)
+    if engine == "legacy":
+        return json.dumps({"type": "drawing", "x": lat, "y": lon, "action": "draw", "color": "#FF0000",
+                           "size": 5, "tool": "brush", "bench": stamp})
+    return json.dumps({"type": "drawing_event", "action": "add_point",
+                       "data": {"lat": lat, "lon": lon, "color": "#FF0000", "bench": stamp}})
+
+
+async def sender(engine: str, websocket: FakeWebSocket, client_id: int, rate: float, duration: float,
+                 rng: random.Random) -> int:
+    loop = asyncio.get_running_loop()
+    # Випадковий зсув, щоб відправники не стартували одночасно
+    await asyncio.sleep(rng.uniform(0, 1.0 / rate))
+    seq = 0
+    end = loop.time() + duration
+    while loop.time() < end and not websocket.closed:
+        websocket.client_send(build_message(engine, client_id, seq, loop.time(), rng))
+        seq += 1
+        await asyncio.sleep(1.0 / rate)
+    return seq
+
+
+async def simulate(args) -> dict:
+    rng = random.Random(args.seed)
+    manager = legacy_manager if args.engine == "legacy" else ConnectionManager()
+    rooms = UKRAINE_REGIONS[:args.rooms]
+    clients: List[FakeWebSocket] = []
+    sessions = []
+
+    for room in rooms:
+        for index in range(args.clients):
+            slow = rng.random() < args.slow_fraction
+            bandwidth = args.slow_bandwidth if slow else args.bandwidth
+            # "Зомбі" зникають без закриття після привітання та кількох повідомлень
+            vanish = rng.random() < args.vanish_fraction
+            profile = LinkProfile(
+                latency=args.latency / 1000, jitter=args.jitter / 1000,
+                bandwidth=bandwidth * 1024 if bandwidth else None, failure_rate=args.failure_rate,
+                vanish_after=rng.randint(2, 20) if vanish else None)
+            websocket = FakeWebSocket(f"{room}-{index}", profile, random.Random(rng.random()),
+                                      query_params={"heartbeat": "1"} if args.heartbeat > 0 else {},
+                                      auto_pong=args.heartbeat > 0)
+            clients.append(websocket)
+            if args.engine == "legacy":
+                sessions.append(asyncio.create_task(handle_websocket_connection(websocket, room)))
+            else:
+                sessions.append(asyncio.create_task(manager_session(manager, websocket, room, args.batch)))
+    # Усі клієнти підключені до старту відправки
+    await asyncio.sleep(0)
+    heartbeat = asyncio.create_task(manager.heartbeat(args.heartbeat)) if args.heartbeat > 0 else None
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    senders = []
+    for room_index, room in enumerate(rooms):
+        for index in range(args.senders):
+            websocket = clients[room_index * args.clients + index]
+            senders.append(sender(args.engine, websocket, room_index * args.clients + index, args.rate, args.duration,
+                                  random.Random(rng.random())))
+    sent = sum(await asyncio.gather(*senders))
+    if heartbeat is not None:
+        heartbeat.cancel()
+
+    # Дочікуємось доставки всього, що в дорозі, і закриваємо з'єднання
+    await asyncio.sleep(args.drain)
+    for websocket in clients:
+        websocket.client_disconnect()
+    # Обрив під час привітання legacy-обробник не перехоплює - рахуємо як відмову, а не помилку моделювання
+    await asyncio.gather(*sessions, return_exceptions=True)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    latencies = []
+    for client_id, websocket in enumerate(clients):
+        for arrival, raw in websocket.deliveries:
+            frame = json.loads(raw)
+            for message in frame["messages"] if frame.get("type") == "batch" else [frame]:
+                stamp = extract_stamp(message)
+                if stamp is not None and stamp["c"] != client_id:
+                    latencies.append(arrival - stamp["t"])
+    expected = sent * (args.clients - 1)
+    failed = sum(1 for websocket in clients if websocket.failed)
+    reaped = sum(1 for websocket in clients if websocket.close_code == config.HEARTBEAT_CLOSE_CODE)
+    # Даремна робота: повідомлення, відправлені клієнтам, що вже зникли
+    wasted = sum(max(0, websocket.sent_count - websocket.profile.vanish_after) for websocket in clients
+                 if websocket.profile.vanish_after is not None)
+
+    results = {
+        "sent": metric(sent, "count", "higher"),
+        "delivered": metric(len(latencies), "count", "higher"),
+        "delivery_ratio": metric(len(latencies) / expected if expected else 0.0, "ratio", "higher"),
+        "failed_connections": metric(failed, "count", "lower"),
+        "reaped_connections": metric(reaped, "count", "higher"),
+        "sends_to_zombies": metric(wasted, "count", "lower"),
+        "server_cpu_seconds": metric(cpu, "s", "lower"),
+        "cpu_us_per_delivery": metric(cpu / len(latencies) * 1e6 if latencies else 0.0, "us", "lower"),
+        "wall_seconds": metric(wall, "s", "lower"),
+    }
+    results.update(latency_metrics("fanout_latency", latencies))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Моделювання розсилки на віртуальних клієнтах")
+    parser.add_argument("--engine", choices=ENGINES, default="manager", help="Алгоритм розсилки")
+    parser.add_argument("--rooms", type=int, default=5, help=f"Кількість кімнат (до {len(UKRAINE_REGIONS)})")
+    parser.add_argument("--clients", type=int, default=200, help="Клієнтів у кожній кімнаті")
+    parser.add_argument("--senders", type=int, default=1, help="Клієнтів, що малюють, у кожній кімнаті")
+    parser.add_argument("--rate", type=float, default=5.0, help="Повідомлень/с від кожного відправника")
+    parser.add_argument("--duration", type=float, default=10.0, help="Тривалість відправки, віртуальні секунди")
+    parser.add_argument("--drain", type=float, default=30.0, help="Час на доставку залишку, віртуальні секунди")
+    parser.add_argument("--latency", type=float, default=20.0, help="Затримка в один бік, мс")
+    parser.add_argument("--jitter", type=float, default=5.0, help="Розкид затримки, мс")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Пропускна здатність до клієнта, КБ/с (0 - без обмеження)")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Частка повільних клієнтів")
+    parser.add_argument("--slow-bandwidth", type=float, default=4.0, help="Пропускна здатність повільних клієнтів, КБ/с")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Імовірність обриву на кожній відправці")
+    parser.add_argument("--vanish-fraction", type=float, default=0.0, help="Частка клієнтів, що зникають без закриття")
+    parser.add_argument("--heartbeat", type=float, default=0.0, help="Інтервал ping, віртуальні секунди (0 - вимкнено)")
+    parser.add_argument("--batch", action="store_true", help="Клієнти приймають пакети повідомлень (?batch=1)")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора сценарію")
+    parser.add_argument("--baseline", help="JSON попереднього прогону для порівняння")
+    parser.add_argument("--output", help="Файл для JSON-результату")
+    args = parser.parse_args()
+    args.rooms = min(args.rooms, len(UKRAINE_REGIONS))
+
+    # Попередження про кожну невдалу відправку лише засмічують вивід моделювання
+    logging.getLogger(ROOT_LOGGER).setLevel(logging.ERROR)
+    metrics = run_virtual(simulate(args))
+
+    parameters = {key: value for key, value in vars(args).items() if key not in ("baseline", "output")}
+    result = make_result("fanout_sim", parameters, metrics)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            print(format_comparison(metrics, json.load(file)["metrics"]))
+        print()
+    write_result(result, args.output)
+
+
+if __name__ == "__main__":
+    main()
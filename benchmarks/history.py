@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Історія результатів бенчмарків за комітами та детектор регресій
+
+    python -m benchmarks.history record load.json            # дописати результат для поточного коміту
+    python -m benchmarks.history list
+    python -m benchmarks.history compare --baseline main      # HEAD проти main; код виходу 1 при регресії
+    python -m benchmarks.history compare --baseline a1b2c3 --candidate HEAD --threshold 10 --alpha 0.01
+
+Порівнюються лише прогони того самого бенчмарку з однаковими параметрами. Вибірка метрики -
+поля "samples" всіх прогонів коміту (або їхні "value", якщо вибірок немає), тому для надійного
+висновку варто записати кілька прогонів на коміт. Значущість - двосторонній t-тест Велча; якщо
+в одній з вибірок менше двох значень, зміна понад поріг позначається як "недостатньо даних"
+і на код виходу не впливає.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.common import REPO_ROOT
+
+DEFAULT_HISTORY = os.path.join(REPO_ROOT, "benchmarks", "history.jsonl")
+
+
+def git(*args: str) -> str:
+    return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+
+
+def resolve_commit(ref: str) -> str:
+    try:
+        return git("rev-parse", "--verify", f"{ref}^{{commit}}")
+    except subprocess.CalledProcessError:
+        # Коміт міг зникнути з репозиторію (rebase) - шукаємо за префіксом в історії
+        return ref
+
+
+def parameters_key(parameters: dict) -> str:
+    """Ключ набору параметрів (без шляхів і адрес, що не впливають на навантаження)"""
+    relevant = {key: value for key, value in parameters.items() if key not in ("repo", "url", "capture")}
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def load_history(path: str) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def record(args) -> int:
+    with open(args.result, encoding="utf-8") as file:
+        result = json.load(file)
+    commit = resolve_commit(args.commit)
+    entry = {
+        "commit": commit,
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")) if args.commit == "HEAD" else False,
+        "recorded_at": datetime.now().isoformat(),
+        "benchmark": result["benchmark"],
+        "parameters_key": parameters_key(result.get("parameters", {})),
+        "parameters": result.get("parameters", {}),
+        "metrics": result["metrics"],
+    }
+    with open(args.history, "a", encoding="utf-8") as file:
+        file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    dirty = " (незакомічені зміни)" if entry["dirty"] else ""
+    print(f"✅ {result['benchmark']} записано для {commit[:10]}{dirty}")
+    return 0
+
+
+def list_entries(args) -> int:
+    for entry in load_history(args.history):
+        print(f"{entry['commit'][:10]}{'*' if entry.get('dirty') else ' '} {entry['recorded_at'][:19]} "
+              f"{entry['benchmark']:<16} params={entry['parameters_key']} metrics={len(entry['metrics'])}")
+    return 0
+
+
+# --- Статистика ---
+
+def _betacf(a: float, b: float, x: float) -> float:
+    """Неперервний дріб для неповної бета-функції (метод Лентца)"""
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 300):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 1e-12:
+            break
+    return h
+
+
+def regularized_beta(a: float, b: float, x: float) -> float:
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1.0 - x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def welch_p_value(first: List[float], second: List[float]) -> Optional[float]:
+    """Двосторонній p-value t-тесту Велча; None, якщо вибірки замалі"""
+    if len(first) < 2 or len(second) < 2:
+        return None
+    mean1, mean2 = statistics.fmean(first), statistics.fmean(second)
+    var1, var2 = statistics.variance(first) / len(first), statistics.variance(second) / len(second)
+    if var1 + var2 == 0:
+        return 0.0 if mean1 != mean2 else 1.0
+    t = (mean1 - mean2) / math.sqrt(var1 + var2)
+    df = (var1 + var2) ** 2 / (
+        (var1 ** 2 / (len(first) - 1) if var1 else 0.0) + (var2 ** 2 / (len(second) - 1) if var2 else 0.0))
+    return regularized_beta(df / 2.0, 0.5, df / (df + t * t))
+
+
+def samples_for(entries: List[dict], name: str) -> List[float]:
+    values: List[float] = []
+    for entry in entries:
+        item = entry["metrics"].get(name)
+        if item is None:
+            continue
+        values.extend(item.get("samples") or [item["value"]])
+    return values
+
+
+def compare_groups(baseline: List[dict], candidate: List[dict], threshold: float,
+                   alpha: float) -> Tuple[List[list], int]:
+    """Рядки таблиці порівняння та кількість регресій"""
+    rows, regressions = [], 0
+    names = [name for name in candidate[-1]["metrics"] if any(name in e["metrics"] for e in baseline)]
+    for name in names:
+        better = candidate[-1]["metrics"][name].get("better", "lower")
+        old, new = samples_for(baseline, name), samples_for(candidate, name)
+        old_mean, new_mean = statistics.fmean(old), statistics.fmean(new)
+        change = (new_mean - old_mean) / abs(old_mean) * 100 if old_mean else 0.0
+        worse = change > 0 if better == "lower" else change < 0
+        p_value = welch_p_value(old, new)
+        significant = p_value is not None and p_value < alpha
+        status = "ok"
+        if p_value is None and abs(change) > threshold:
+            # Один прогон не відрізнити від шуму: зміна показується, але регресією не вважається
+            status = "недостатньо даних"
+        elif worse and abs(change) > threshold and significant:
+            status = "РЕГРЕСІЯ"
+            regressions += 1
+        elif not worse and abs(change) > threshold and significant:
+            status = "покращення"
+        rows.append([name, f"{old_mean:.4g}", f"{new_mean:.4g}", f"{change:+.1f}%",
+                     "-" if p_value is None else f"{p_value:.3g}", f"{len(old)}/{len(new)}", status])
+    return rows, regressions
+
+
+def compare(args) -> int:
+    history = load_history(args.history)
+    baseline_commit = resolve_commit(args.baseline)
+    candidate_commit = resolve_commit(args.candidate)
+
+    def entries_for(commit: str) -> Dict[Tuple[str, str], List[dict]]:
+        groups: Dict[Tuple[str, str], List[dict]] = {}
+        for entry in history:
+            if entry["commit"].startswith(commit) and (not args.benchmark or entry["benchmark"] == args.benchmark):
+                groups.setdefault((entry["benchmark"], entry["parameters_key"]), []).append(entry)
+        return groups
+
+    baseline_groups = entries_for(baseline_commit)
+    candidate_groups = entries_for(candidate_commit)
+    common = [key for key in candidate_groups if key in baseline_groups]
+    if not common:
+        print(f"❌ Немає спільних прогонів для {baseline_commit[:10]} і {candidate_commit[:10]}")
+        return 2
+
+    total = inconclusive = 0
+    for key in common:
+        rows, regressions = compare_groups(baseline_groups[key], candidate_groups[key], args.threshold, args.alpha)
+        total += regressions
+        inconclusive += sum(1 for row in rows if row[-1] == "недостатньо даних")
+        print(f"\n### {key[0]} (params={key[1]}): {baseline_commit[:10]} -> {candidate_commit[:10]}\n")
+        print("| Метрика | База | Кандидат | Зміна | p | n | Статус |")
+        print("|---|---|---|---|---|---|---|")
+        for row in rows:
+            print("| " + " | ".join(row) + " |")
+
+    print()
+    if inconclusive:
+        print(f"⚠️ Без висновку (менше двох значень у вибірці): {inconclusive}")
+    if total:
+        print(f"❌ Регресій: {total} (поріг {args.threshold}%, alpha {args.alpha})")
+        return 1
+    print(f"✅ Регресій не виявлено (поріг {args.threshold}%, alpha {args.alpha})")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Історія бенчмарків і детектор регресій")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="Файл історії (JSON Lines)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="Дописати результат бенчмарку")
+    record_parser.add_argument("result", help="JSON-результат load_generator / db_benchmark / replay")
+    record_parser.add_argument("--commit", default="HEAD", help="Коміт, до якого належить результат")
+
+    commands.add_parser("list", help="Показати записи історії")
+
+    compare_parser = commands.add_parser("compare", help="Порівняти коміт з базовим")
+    compare_parser.add_argument("--baseline", required=True, help="Базовий коміт (гілка, тег, SHA)")
+    compare_parser.add_argument("--candidate", default="HEAD", help="Коміт-кандидат")
+    compare_parser.add_argument("--benchmark", help="Лише цей бенчмарк")
+    compare_parser.add_argument("--threshold", type=float, default=5.0, help="Допустиме погіршення, відсотки")
+    compare_parser.add_argument("--alpha", type=float, default=0.05, help="Рівень значущості")
+
+    args = parser.parse_args()
+    handlers = {"record": record, "list": list_entries, "compare": compare}
+    sys.exit(handlers[args.command](args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Генератор навантаження: R кімнат x C клієнтів, що малюють із заданою частотою
+
+Запуск з кореня репозиторію:
+    python -m benchmarks.load_generator --rooms 10 --clients 20 --rate 10 --duration 30
+    python -m benchmarks.load_generator --format legacy --output load.json
+    python -m benchmarks.load_generator --url http://127.0.0.1:8000   # вже запущений сервер
+
+Без --url сервер запускається локально (uvicorn в окремому процесі, тимчасова БД).
+Затримка вимірюється від відправки точки до її отримання кожним іншим клієнтом кімнати.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import urllib.parse
+from typing import Dict, List, Optional
+
+import websockets
+
+from benchmarks.common import (
+    REPO_ROOT, latency_metrics, local_server, make_result, metric, scrape_metrics, write_result, ws_url,
+)
+from websocket_handler import UKRAINE_REGIONS
+
+FORMATS = ("drawing_event", "drawing", "legacy")
+
+
+class LoadStats:
+    """Лічильники прогону"""
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+        self.recording = False
+
+
+def build_message(fmt: str, client_id: int, seq: int) -> dict:
+    """Повідомлення з міткою часу відправки в полі "bench" """
+    stamp = {"c": client_id, "s": seq, "t": time.perf_counter()}
+    lat = 50.45 + random.uniform(-0.05, 0.05)
+    lon = 30.52 + random.uniform(-0.05, 0.05)
+    if fmt == "drawing_event":
+        return {"type": "drawing_event", "action": "add_point",
+                "data": {"lat": lat, "lon": lon, "color": "#FF0000", "bench": stamp}}
+    if fmt == "drawing":
+        return {"type": "drawing", "action_type": "polygon_point",
+                "data": {"lat": lat, "lon": lon, "bench": stamp}}
+    return {"type": "drawing", "x": lat, "y": lon, "action": "draw", "color": "#FF0000",
+            "size": 5, "tool": "brush", "bench": stamp}
+
+
+def extract_stamp(message: dict) -> Optional[dict]:
+    data = message.get("data")
+    if isinstance(data, dict) and "bench" in data:
+        return data["bench"]
+    return message.get("bench")
+
+
+async def run_client(uri: str, fmt: str, client_id: int, rate: float, stop: asyncio.Event,
+                     stats: LoadStats):
+    """Один клієнт: окремі задачі відправки та прийому"""
+    try:
+        async with websockets.connect(uri, max_size=None, ping_interval=None) as websocket:
+            async def receiver():
+                async for raw in websocket:
+                    message = json.loads(raw)
+                    stamp = extract_stamp(message)
+                    if stamp is None or stamp["c"] == client_id:
+                        continue
+                    if stats.recording:
+                        stats.received += 1
+                        stats.latencies.append(time.perf_counter() - stamp["t"])
+
+            receive_task = asyncio.create_task(receiver())
+            seq = 0
+            if rate > 0:
+                interval = 1.0 / rate
+                # Розносимо старт клієнтів, щоб уникнути синхронних сплесків
+                next_send = time.perf_counter() + random.uniform(0, interval)
+                while not stop.is_set():
+                    delay = next_send - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    seq += 1
+                    await websocket.send(json.dumps(build_message(fmt, client_id, seq)))
+                    if stats.recording:
+                        stats.sent += 1
+                    next_send += interval
+            else:
+                await stop.wait()
+            # Даємо час отримати повідомлення, що ще в дорозі
+            await asyncio.sleep(1.0)
+            receive_task.cancel()
+    except (OSError, websockets.exceptions.WebSocketException):
+        stats.errors += 1
+
+
+def client_plan(rooms: int, clients: int, fmt: str, base_ws: str, drawers: float) -> List[dict]:
+    """Розподіл клієнтів за кімнатами та форматами"""
+    plan = []
+    client_id = 0
+    for room_index in range(rooms):
+        for index in range(clients):
+            client_fmt = FORMATS[client_id % len(FORMATS)] if fmt == "mixed" else fmt
+            if client_fmt == "legacy":
+                # Старий endpoint приймає лише кімнати областей
+                room = UKRAINE_REGIONS[room_index % len(UKRAINE_REGIONS)]
+                path = f"/ws/old/{urllib.parse.quote(room)}"
+            else:
+                path = f"/ws/bench-{room_index}"
+            plan.append({
+                "id": client_id,
+                "format": client_fmt,
+                "uri": base_ws + path,
+                "draws": index < max(1, round(clients * drawers)),
+            })
+            client_id += 1
+    return plan
+
+
+async def run_load(base_url: str, args) -> dict:
+    stats = LoadStats()
+    stop = asyncio.Event()
+    plan = client_plan(args.rooms, args.clients, args.format, ws_url(base_url), args.drawers)
+
+    tasks = []
+    for entry in plan:
+        rate = args.rate if entry["draws"] else 0
+        tasks.append(asyncio.create_task(run_client(entry["uri"], entry["format"], entry["id"], rate, stop, stats)))
+        # Не відкриваємо всі з'єднання в одну мить
+        if len(tasks) % 50 == 0:
+            await asyncio.sleep(0.05)
+
+    await asyncio.sleep(args.warmup)
+    # Збір метрик - блокуючий HTTP-запит: у пулі потоків, щоб не затримувати клієнтів у циклі подій
+    loop = asyncio.get_running_loop()
+    before = await loop.run_in_executor(None, scrape_metrics, base_url)
+    peak_rss = before.get("process_resident_memory_bytes", 0.0)
+    stats.recording = True
+    started = time.perf_counter()
+
+    deadline = started + args.duration
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(min(1.0, max(0.0, deadline - time.perf_counter())))
+        sample = await loop.run_in_executor(None, scrape_metrics, base_url)
+        peak_rss = max(peak_rss, sample.get("process_resident_memory_bytes", 0.0))
+
+    stop.set()
+    elapsed = time.perf_counter() - started
+    after = await loop.run_in_executor(None, scrape_metrics, base_url)
+    await asyncio.gather(*tasks)
+    stats.recording = False
+
+    cpu = after.get("process_cpu_seconds_total", 0.0) - before.get("process_cpu_seconds_total", 0.0)
+    results: Dict[str, dict] = {
+        "sent_per_sec": metric(stats.sent / elapsed, "msg/s", "higher"),
+        "delivered_per_sec": metric(stats.received / elapsed, "msg/s", "higher"),
+        "server_cpu_percent": metric(100.0 * cpu / elapsed, "%", "lower"),
+        "server_cpu_seconds_per_1k_delivered": metric(
+            1000.0 * cpu / stats.received if stats.received else 0.0, "s", "lower"),
+        "server_rss_peak_bytes": metric(peak_rss, "bytes", "lower"),
+        "client_errors": metric(stats.errors, "count", "lower"),
+    }
+    results.update(latency_metrics("fanout_latency", stats.latencies))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор навантаження WebSocket для Drawing Sync Server")
+    parser.add_argument("--rooms", type=int, default=5, help="Кількість кімнат")
+    parser.add_argument("--clients", type=int, default=10, help="Клієнтів у кожній кімнаті")
+    parser.add_argument("--rate", type=float, default=5.0, help="Точок на секунду від кожного клієнта, що малює")
+    parser.add_argument("--drawers", type=float, default=1.0, help="Частка клієнтів кімнати, що малюють (0..1)")
+    parser.add_argument("--format", choices=FORMATS + ("mixed",), default="drawing_event", help="Формат повідомлень")
+    parser.add_argument("--duration", type=float, default=20.0, help="Тривалість вимірювання, секунди")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Прогрів перед вимірюванням, секунди")
+    parser.add_argument("--url", help="Адреса вже запущеного сервера (інакше запускається локально)")
+    parser.add_argument("--repo", default=REPO_ROOT, help="Збірка сервера для локального запуску")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора координат")
+    parser.add_argument("--output", help="Файл для JSON-результату")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    parameters = {key: value for key, value in vars(args).items() if key not in ("output",)}
+
+    if args.url:
+        metrics = asyncio.run(run_load(args.url.rstrip("/"), args))
+    else:
+        with local_server(args.repo) as base_url:
+            metrics = asyncio.run(run_load(base_url, args))
+
+    write_result(make_result("load_generator", parameters, metrics), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Відтворення записаного трафіку (CAPTURE_ENABLED=1) на локальному сервері
+
+Кожне записане з'єднання відкривається заново на тому ж endpoint і в тій же кімнаті,
+повідомлення надсилаються за записаним розкладом, прискореним у --speed разів
+(0 - максимальна швидкість). REST-події надсилаються в POST /api/events/{room}.
+
+Запуск з кореня репозиторію:
+    python -m benchmarks.replay captures/traffic.ndjson --speed 10 --output replay_new.json
+    python -m benchmarks.replay captures/traffic.ndjson --speed 10 --repo ../old-build --output replay_old.json
+    python -m benchmarks.replay captures/traffic.ndjson --speed 10 --baseline replay_old.json
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List
+
+import websockets
+
+from benchmarks.common import (
+    REPO_ROOT, format_comparison, latency_metrics, local_server, make_result, metric, scrape_metrics,
+    write_result, ws_url,
+)
+from benchmarks.load_generator import extract_stamp
+
+
+class ReplayStats:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+        # Наскільки відправка відставала від розкладу
+        self.schedule_lag: List[float] = []
+
+
+def load_capture(path: str) -> Dict[int, List[dict]]:
+    """Записи, згруповані за з'єднаннями; REST-події - під ідентифікатором 0"""
+    connections: Dict[int, List[dict]] = defaultdict(list)
+    session = 0
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "capture" in record:
+                # Заголовок нової сесії запису: ідентифікатори з'єднань починаються заново
+                session += 1
+                continue
+            connection_id = record["c"]
+            connections[session * 1_000_000 + connection_id if connection_id else 0].append(record)
+    return connections
+
+
+def stamp_message(raw: str, stamp: dict) -> str:
+    """Додавання мітки часу відправки (у data, щоб сервер її переслав)"""
+    try:
+        message = json.loads(raw)
+    except ValueError:
+        return raw
+    if not isinstance(message, dict):
+        return raw
+    if isinstance(message.get("data"), dict):
+        message["data"]["bench"] = stamp
+    else:
+        message["bench"] = stamp
+    return json.dumps(message)
+
+
+async def wait_until(start: float, at: float, speed: float, stats: ReplayStats):
+    if speed <= 0:
+        return
+    delay = start + at / speed - time.perf_counter()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    else:
+        stats.schedule_lag.append(-delay)
+
+
+async def replay_connection(base_url: str, records: List[dict], start: float, speed: float, stats: ReplayStats):
+    first = records[0]
+    await wait_until(start, first["t"], speed, stats)
+    room = urllib.parse.quote(first["r"])
+    path = f"/ws/old/{room}" if first["e"] == "ws_old" else f"/ws/{room}"
+    connection_key = id(records)
+
+    try:
+        async with websockets.connect(ws_url(base_url) + path, max_size=None, ping_interval=None) as websocket:
+            async def receiver():
+                async for raw in websocket:
+                    stamp = extract_stamp(json.loads(raw))
+                    if stamp is not None and stamp["c"] != connection_key:
+                        stats.received += 1
+                        stats.latencies.append(time.perf_counter() - stamp["t"])
+
+            receive_task = asyncio.create_task(receiver())
+            for seq, record in enumerate(records):
+                if record["k"] != "msg":
+                    continue
+                await wait_until(start, record["t"], speed, stats)
+                stamp = {"c": connection_key, "s": seq, "t": time.perf_counter()}
+                await websocket.send(stamp_message(record["m"], stamp))
+                stats.sent += 1
+            last = records[-1]
+            if last["k"] == "close":
+                await wait_until(start, last["t"], speed, stats)
+            # Дочікуємось повідомлень, що ще в дорозі
+            await asyncio.sleep(1.0)
+            receive_task.cancel()
+    except (OSError, websockets.exceptions.WebSocketException):
+        stats.errors += 1
+
+
+async def replay_rest(base_url: str, records: List[dict], start: float, speed: float, stats: ReplayStats):
+    loop = asyncio.get_running_loop()
+
+    def post(room: str, body: bytes):
+        request = urllib.request.Request(
+            f"{base_url}/api/events/{urllib.parse.quote(room)}", data=body, method="POST",
+            headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=30):
+                pass
+        except OSError:
+            # 409 (повтор event_id) та інші помилки рахуються, але не зупиняють відтворення
+            stats.errors += 1
+
+    for record in records:
+        await wait_until(start, record["t"], speed, stats)
+        await loop.run_in_executor(None, post, record["r"], record["m"].encode("utf-8"))
+        stats.sent += 1
+
+
+async def run_replay(base_url: str, capture_path: str, speed: float) -> Dict[str, dict]:
+    connections = load_capture(capture_path)
+    stats = ReplayStats()
+    # Збір метрик - блокуючий HTTP-запит: у пулі потоків, як і POST у replay_rest
+    loop = asyncio.get_running_loop()
+    before = await loop.run_in_executor(None, scrape_metrics, base_url)
+    start = time.perf_counter()
+
+    tasks = []
+    for connection_id, records in connections.items():
+        if connection_id == 0:
+            tasks.append(replay_rest(base_url, records, start, speed, stats))
+        else:
+            tasks.append(replay_connection(base_url, records, start, speed, stats))
+    await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - start
+    after = await loop.run_in_executor(None, scrape_metrics, base_url)
+    cpu = after.get("process_cpu_seconds_total", 0.0) - before.get("process_cpu_seconds_total", 0.0)
+    lag = sorted(stats.schedule_lag)
+
+    results = {
+        "replay_seconds": metric(elapsed, "s", "lower"),
+        "sent_per_sec": metric(stats.sent / elapsed, "msg/s", "higher"),
+        "delivered_per_sec": metric(stats.received / elapsed, "msg/s", "higher"),
+        "server_cpu_seconds": metric(cpu, "s", "lower"),
+        "server_rss_bytes": metric(after.get("process_resident_memory_bytes", 0.0), "bytes", "lower"),
+        "schedule_lag_max_ms": metric((lag[-1] if lag else 0.0) * 1000, "ms", "lower"),
+        "errors": metric(stats.errors, "count", "lower"),
+    }
+    results.update(latency_metrics("fanout_latency", stats.latencies))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Відтворення записаного трафіку Drawing Sync Server")
+    parser.add_argument("capture", help="Файл запису (CAPTURE_FILE)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Прискорення: 1, 10, ... або 0 - максимально")
+    parser.add_argument("--url", help="Адреса вже запущеного сервера (інакше запускається локально)")
+    parser.add_argument("--repo", default=REPO_ROOT, help="Збірка сервера для локального запуску")
+    parser.add_argument("--baseline", help="JSON попереднього прогону (іншої збірки) для порівняння")
+    parser.add_argument("--output", help="Файл для JSON-результату")
+    args = parser.parse_args()
+
+    if args.url:
+        metrics = asyncio.run(run_replay(args.url.rstrip("/"), args.capture, args.speed))
+    else:
+        with local_server(args.repo) as base_url:
+            metrics = asyncio.run(run_replay(base_url, args.capture, args.speed))
+
+    parameters = {"capture": args.capture, "speed": args.speed, "url": args.url, "repo": args.repo}
+    result = make_result("replay", parameters, metrics)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            print(format_comparison(metrics, json.load(file)["metrics"]))
+        print()
+    write_result(result, args.output)
+
+
+if __name__ == "__main__":
+    main()
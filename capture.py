@@ -0,0 +1,107 @@
+"""
+Запис вхідного трафіку для відтворення (benchmarks/replay.py)
+
+Формат - NDJSON, один запис на рядок, тільки дописування:
+    {"capture": 1, "started_at": "..."}                          - заголовок сесії запису
+    {"t": 0.0123, "k": "open", "c": 7, "e": "ws", "r": "room"}      - підключення
+    {"t": 0.0456, "k": "msg", "c": 7, "e": "ws", "r": "room", "m": "<сирий текст>"}
+    {"t": 1.2345, "k": "close", "c": 7, "e": "ws", "r": "room"}     - відключення
+t - секунди від початку сесії, c - ідентифікатор з'єднання, e - endpoint ("ws", "ws_old", "rest").
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import config
+from logger import get_logger
+
+log = get_logger("capture")
+
+ENDPOINT_WS = "ws"
+ENDPOINT_WS_OLD = "ws_old"
+ENDPOINT_REST = "rest"
+
+_enabled = False
+_started = 0.0
+_writer: Optional["CaptureWriter"] = None
+
+
+class CaptureWriter(threading.Thread):
+    """Фоновий запис у файл, щоб цикл подій не чекав на диск"""
+
+    def __init__(self, path: str, queue_size: int = 100000):
+        super().__init__(name="capture-writer", daemon=True)
+        self.path = path
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def put(self, record: dict):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        self.queue.put(None)
+        self.join(timeout=5)
+
+    def run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps({"capture": 1, "started_at": datetime.now().isoformat()}) + "\n")
+            while True:
+                record = self.queue.get()
+                if record is None:
+                    break
+                file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                if self.queue.empty():
+                    file.flush()
+
+
+def _record(kind: str, connection_id: int, endpoint: str, room: str, message: Optional[str] = None):
+    record = {"t": round(time.perf_counter() - _started, 6), "k": kind, "c": connection_id, "e": endpoint, "r": room}
+    if message is not None:
+        record["m"] = message
+    _writer.put(record)
+
+
+def record_open(connection_id: int, endpoint: str, room: str):
+    if _enabled:
+        _record("open", connection_id, endpoint, room)
+
+
+def record_message(connection_id: int, endpoint: str, room: str, message: str):
+    if _enabled:
+        _record("msg", connection_id, endpoint, room, message)
+
+
+def record_close(connection_id: int, endpoint: str, room: str):
+    if _enabled:
+        _record("close", connection_id, endpoint, room)
+
+
+def setup_capture():
+    """Увімкнення запису згідно з config.CAPTURE_*"""
+    global _enabled, _started, _writer
+    if not config.CAPTURE_ENABLED or _writer is not None:
+        return
+    _writer = CaptureWriter(config.CAPTURE_FILE)
+    _writer.start()
+    _started = time.perf_counter()
+    _enabled = True
+    log.info("🎙️ Запис трафіку увімкнено: %s", config.CAPTURE_FILE)
+
+
+def shutdown_capture():
+    """Зупинка запису з дописуванням черги"""
+    global _enabled, _writer
+    _enabled = False
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
@@ -1,6 +1,8 @@
 """
 Файл конфігурації для сервера синхронізації
 """
+import os
+import secrets
 
 # Налаштування сервера
 HOST = "0.0.0.0"       # Слухати на всіх інтерфейсах
@@ -24,3 +26,133 @@ LINUX_UPDATES_DIR = f"{UPDATES_DIR}/linux"
 # Додаткові налаштування
 MAX_UPLOAD_SIZE = 100 * 1024 * 1024  # 100 МБ максимальний розмір файлу для завантаження
 MAX_ROOM_HISTORY = 1000              # Максимальна кількість команд для зберігання в історії кімнати
+
+# Розсилка WebSocket
+WS_SEND_QUEUE_SIZE = 1000         # Максимум повідомлень у черзі відправки одного з'єднання
+WS_SLOW_CONSUMER_CLOSE_CODE = 1013  # Код закриття для клієнта, що не встигає отримувати (черга переповнена)
+WS_SLOW_CONSUMER_LAG = 10.0         # Найстаріше повідомлення в черзі старше (секунди) - клієнт повільний...
+WS_SLOW_CONSUMER_RTT_FACTOR = 20    # ...але допуск не менший за N x RTT клієнта
+WS_COALESCE_RTT_FRACTION = 0.5      # Вікно об'єднання повідомлень у пакет (?batch=1) - частка RTT клієнта
+WS_COALESCE_MAX = 0.25              # Максимальне вікно об'єднання, секунди
+WS_PING_INTERVAL = 20.0             # Ping рівня протоколу (uvicorn) - для клієнтів, що не відповідають pong
+WS_PING_TIMEOUT = 20.0
+
+# Heartbeat рівня застосунку: {"type": "ping", "id": N} -> {"type": "pong", "id": N}
+HEARTBEAT_INTERVAL = 15.0   # Інтервал ping, секунди
+HEARTBEAT_MISSED_LIMIT = 3  # Пропущених інтервалів без жодного повідомлення до видалення з'єднання
+HEARTBEAT_CLOSE_CODE = 1001  # Код закриття для видаленого з'єднання
+
+# Обмеження частоти вхідних повідомлень (token bucket, див. rate_limit.py)
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_POLICY = os.environ.get("RATE_LIMIT_POLICY", "coalesce")  # "coalesce", "delay" або "reject"
+RATE_LIMIT_CONNECTION_RATE = 50.0   # Повідомлень/с від одного з'єднання
+RATE_LIMIT_CONNECTION_BURST = 100   # Допустимий сплеск
+RATE_LIMIT_ROOM_RATE = 500.0        # Повідомлень/с у кімнату від усіх клієнтів (WebSocket і REST)
+RATE_LIMIT_ROOM_BURST = 1000
+RATE_LIMIT_CLIENT_RATE = 20.0       # Запитів/с POST /api/events з однієї IP-адреси
+RATE_LIMIT_CLIENT_BURST = 40
+RATE_LIMIT_MAX_DELAY = 1.0          # Довша затримка - повідомлення відкидається
+RATE_LIMIT_NOTIFY_INTERVAL = 1.0    # Не частіше одного slow_down на з'єднання за цей час, секунди
+
+# Контролер перевантаження (overload.py)
+OVERLOAD_CHECK_INTERVAL = 1.0                          # Інтервал перевірки, секунди
+OVERLOAD_LAG_THRESHOLDS = (0.05, 0.1, 0.25, 0.5)       # Затримка циклу подій для рівнів 1..4, секунди
+OVERLOAD_QUEUE_THRESHOLDS = (5000, 20000, 50000, 100000)  # Повідомлень у чергах відправки для рівнів 1..4
+OVERLOAD_RECOVERY_RATIO = 0.5   # Зниження рівня - коли тиск нижчий за поріг поточного рівня x коефіцієнт...
+OVERLOAD_RECOVERY_TIME = 10.0   # ...протягом цього часу, секунди
+OVERLOAD_COALESCE_WINDOW = 0.1  # Рівень 1+: мінімальне вікно об'єднання пакетів (?batch=1), секунди
+OVERLOAD_THIN_EVERY = 3         # Рівень 2+: розсилається кожна N-та проміжна точка штриха
+OVERLOAD_THIN_HOLD = 0.25       # Рівень 2+: придержана точка розсилається, якщо штрих не продовжився за цей час, секунди
+OVERLOAD_FLUSH_INTERVAL = 2.0   # Рівень 3+: інтервал пакетного запису команд рисування в БД, секунди
+OVERLOAD_FLUSH_RETRIES = 3      # Спроб запису пакета, після яких він відкидається (drawing_sync_deferred_dropped_total)
+OVERLOAD_RETRY_AFTER = 5.0      # Рівень 4: через скільки секунд клієнту варто перепідключитися
+
+# Допуск до кімнат (admission.py)
+MAX_CONNECTIONS = int(os.environ.get("MAX_CONNECTIONS", "10000"))  # Усіх WebSocket-з'єднань сервера (0 - без обмеження)
+ROOM_DEFAULT_MAX_USERS = 0      # Ліміт кімнат без запису в таблиці rooms (0 - без обмеження)
+ADMISSION_REFRESH_INTERVAL = 60.0  # Перечитування таблиці rooms, секунди
+ADMISSION_RETRY_AFTER = 10.0    # Через скільки секунд повторити підключення до заповненої кімнати/сервера
+REFUSE_CLOSE_CODE = 1013        # Код закриття для відхиленого підключення (Try Again Later)
+RETRY_JITTER = 0.5              # Розкид підказки retry_after: від x1 до x(1 + RETRY_JITTER)
+
+# Знімки історії кімнат (snapshots.py)
+SNAPSHOT_CACHE_SIZE = 200       # Закодованих знімків у пам'яті (кімната x вид)
+SLOW_CONSUMER_RETRY_AFTER = 5.0  # Підказка перепідключення для клієнта, відключеного як повільний, секунди
+
+# Каталог кімнат для лобі (room_directory.py)
+ROOM_DIRECTORY_PUSH_INTERVAL = 1.0      # Об'єднання змін для підписників /api/lobby/stream, секунди
+ROOM_DIRECTORY_KEEPALIVE = 15.0         # Коментар-keepalive SSE під час тиші, секунди
+ROOM_DIRECTORY_SUBSCRIBER_QUEUE = 100   # Непрочитаних змін на підписника, далі - повний знімок
+ROOM_DIRECTORY_IDLE_TTL = 3600.0        # Порожня кімната без активності видаляється з каталогу через, секунди
+
+# Потоки SSE для переглядачів кімнат (room_stream.py, GET /api/rooms/{room_id}/stream)
+ROOM_STREAM_MAX_VIEWERS = 2000     # Усіх переглядачів сервера (0 - без обмеження)
+ROOM_STREAM_REPLAY = 500           # Останніх повідомлень кімнати для продовження з Last-Event-ID
+ROOM_STREAM_QUEUE = 1000           # Ненадісланих повідомлень на переглядача, далі - подія resync
+ROOM_STREAM_IDLE_TTL = 300.0       # Потік без переглядачів зберігається (для продовження), секунди
+ROOM_STREAM_KEEPALIVE = 15.0       # Коментар-keepalive під час тиші (проксі не закривають з'єднання), секунди
+ROOM_STREAM_RETRY = 3.0            # Підказка перепідключення для EventSource (retry:, з розкидом), секунди
+ROOM_STREAM_MIN_INTERVAL = 0.25    # Межі ?interval= для пакетів, секунди
+ROOM_STREAM_MAX_INTERVAL = 30.0
+
+# Перенесення кімнат (room_transfer.py, GET /api/rooms/{room_id}/export?format=..., POST .../import)
+EXPORT_CHUNK_SIZE = 64 * 1024      # Нестиснених байт на частину gzip-потоку експорту
+EXPORT_GZIP_LEVEL = 6
+IMPORT_BATCH_SIZE = 1000           # Записів на транзакцію імпорту
+IMPORT_MAX_LINE = 1024 * 1024      # Найбільший рядок (запис) імпорту, байт
+
+# Пул процесів для важких операцій (jobs.py, /api/jobs)
+JOBS_MAX_CONCURRENT = max(1, min(4, (os.cpu_count() or 2) - 1))  # Процесів пулу (одночасних завдань)
+JOBS_MAX_PENDING = 20              # Завдань API у черзі, далі - 503
+JOBS_HISTORY = 200                 # Завершених завдань у реєстрі (разом з файлами результатів)
+JOBS_START_METHOD = "spawn"        # Запуск процесів (fork небезпечний для процесу з потоками)
+JOBS_OFFLOAD_MIN_ROWS = 5000       # Знімок історії кімнати з такої кількості записів будується в пулі
+
+# Приватні кімнати (auth.py)
+# Ключ підпису токенів сесій; без змінної оточення - випадковий, токени недійсні після перезапуску
+AUTH_SECRET_KEY = os.environ.get("AUTH_SECRET_KEY") or secrets.token_urlsafe(32)
+AUTH_TOKEN_TTL = 15 * 60           # Час дії токена сесії, секунди
+AUTH_MAX_CONCURRENT_HASHES = 2     # Одночасних операцій bcrypt (потоків пулу)
+AUTH_VERIFY_CACHE_TTL = 5 * 60     # Скільки пам'ятати успішну перевірку пароля, секунди
+AUTH_VERIFY_CACHE_SIZE = 10000
+AUTH_CLOSE_CODE = 4401             # Код закриття для підключення до приватної кімнати без дійсного токена
+
+# Аналітика подій (агрегати event_rollup_minute / event_rollup_hour, /api/analytics)
+ANALYTICS_DEFAULT_RANGE = 3600          # Діапазон за замовчуванням (до поточного моменту), секунди
+ANALYTICS_MINUTE_MAX_RANGE = 6 * 3600   # granularity=auto: довший діапазон - погодинно, секунди
+ANALYTICS_MAX_BUCKETS = 10000           # Найбільша кількість інтервалів в одному запиті
+
+# Налаштування логування
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")    # DEBUG, INFO, WARNING, ERROR
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")  # "text" або "json"
+LOG_QUEUE_SIZE = 10000                             # Розмір черги фонового запису логів
+# Частка повідомлень категорії, що потрапляє в лог (1.0 - всі, 0.0 - жодного)
+LOG_SAMPLING = {
+    "ws.message": 0.1,
+    "events": 0.1,
+}
+# Максимальна кількість повідомлень категорії за секунду
+LOG_RATE_LIMITS = {
+    "ws": 50,
+    "ws.message": 20,
+    "events": 20,
+}
+
+# Налаштування метрик
+METRICS_MAX_LABEL_SETS = 1000  # Максимум наборів міток на метрику (захист від довільних назв кімнат)
+
+# Налаштування трасування (формат Chrome Trace Event, відкривається в ui.perfetto.dev)
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "0") == "1"
+TRACING_SAMPLE_RATE = float(os.environ.get("TRACING_SAMPLE_RATE", "0.01"))  # Частка повідомлень, що трасуються
+TRACING_FILE = os.environ.get("TRACING_FILE", "traces/trace.json")
+TRACING_MAX_BYTES = 50 * 1024 * 1024  # Розмір файлу до ротації
+TRACING_BACKUP_COUNT = 5              # Кількість старих файлів
+
+# Сторожовий потік циклу подій
+WATCHDOG_INTERVAL = 0.5         # Інтервал вимірювання затримки циклу подій, секунди
+WATCHDOG_STALL_THRESHOLD = 0.25  # Затримка, після якої знімається стек блокуючого виклику
+WATCHDOG_HISTORY = 100          # Скільки останніх блокувань зберігати
+
+# Запис вхідного трафіку для відтворення (benchmarks/replay.py)
+CAPTURE_ENABLED = os.environ.get("CAPTURE_ENABLED", "0") == "1"
+CAPTURE_FILE = os.environ.get("CAPTURE_FILE", "captures/traffic.ndjson")
@@ -1,10 +1,46 @@
 import sqlite3
 import aiosqlite
+import hashlib
 import json
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
 from models.drawing import DrawingCommand, Room, Template, AppVersion
 from models.drawing_event import DrawingEvent
+from logger import get_logger
+from metrics import timed_db
+
+log = get_logger("db")
+
+# Размер строки команды рисования для счетчика байт: числовые поля + текстовые поля в UTF-8
+DRAWING_ROW_NUMERIC_BYTES = 24
+
+def _drawing_size(command: DrawingCommand) -> int:
+    return DRAWING_ROW_NUMERIC_BYTES + len((command.action + command.color + command.tool + command.timestamp).encode())
+
+def template_hash(template_data: Dict[str, Any]) -> Tuple[str, str]:
+    """Адрес шаблона по содержимому: (sha256, каноничный JSON) - одинаковые шаблоны хранятся один раз"""
+    data = json.dumps(template_data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest(), data
+
+# Агрегаты событий по времени получения сервером (локальное время, а не часы клиента в event.timestamp):
+# таблица -> длина метки интервала в ISO-времени ("2025-09-09T12:34" / "2025-09-09T12")
+ROLLUP_TABLES = {"minute": ("event_rollup_minute", 16), "hour": ("event_rollup_hour", 13)}
+# PRAGMA user_version: с какой версии агрегаты считаются по времени получения (старые пересчитываются)
+ROLLUP_VERSION = 1
+ROLLUP_DIMENSIONS = ("room_id", "platform", "drawing_type", "action")
+
+def rollup_bucket(moment: datetime, granularity: str) -> str:
+    """Метка интервала агрегата (время с часовым поясом приводится к локальному, как datetime.now())"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat()[:ROLLUP_TABLES[granularity][1]]
+
+def rollup_bucket_after(moment: datetime, granularity: str) -> str:
+    """Метка первого интервала после moment (интервал, в котором лежит moment, включается в диапазон)"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    step = timedelta(minutes=1) if granularity == "minute" else timedelta(hours=1)
+    return rollup_bucket(moment - timedelta(microseconds=1) + step, granularity)
 
 class Database:
     """Класс для работы с базой данных"""
@@ -30,6 +66,7 @@ class Database:
             async with db.execute(query, params) as cursor:
                 return await cursor.fetchall()
     
+    @timed_db
     async def save_drawing_command(self, room_id: str, command: DrawingCommand):
         """Сохранение команды рисования"""
         query = """
@@ -40,8 +77,35 @@ class Database:
             room_id, command.x, command.y, command.action,
             command.color, command.size, command.tool, command.timestamp
         )
-        await self.execute_query(query, params)
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(query, params)
+            await self._update_stats(db, room_id, "drawings", 1, _drawing_size(command), command.timestamp)
+            await db.commit()
     
+    @timed_db
+    async def save_drawing_commands(self, commands: List[Tuple[str, DrawingCommand]]):
+        """Сохранение пачки команд рисования одной транзакцией"""
+        query = """
+        INSERT INTO drawing_commands (room_id, x, y, action, color, size, tool, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executemany(query, [
+                (room_id, command.x, command.y, command.action,
+                 command.color, command.size, command.tool, command.timestamp)
+                for room_id, command in commands
+            ])
+            totals: Dict[str, list] = {}
+            for room_id, command in commands:
+                total = totals.setdefault(room_id, [0, 0, command.timestamp])
+                total[0] += 1
+                total[1] += _drawing_size(command)
+                total[2] = command.timestamp
+            for room_id, (count, size, last_event_at) in totals.items():
+                await self._update_stats(db, room_id, "drawings", count, size, last_event_at)
+            await db.commit()
+    
+    @timed_db
     async def get_room_drawings(self, room_id: str) -> List[Dict]:
         """Получение всех команд рисования для комнаты"""
         query = """
@@ -61,45 +125,78 @@ class Database:
             for row in rows
         ]
     
+    @timed_db
     async def clear_room_drawings(self, room_id: str):
         """Очистка всех рисунков в комнате"""
         query = "DELETE FROM drawing_commands WHERE room_id = ?"
-        await self.execute_query(query, (room_id,))
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(query, (room_id,))
+            await self._reset_stats(db, room_id, "drawings")
+            await db.commit()
     
-    async def save_template(self, room_id: str, template_data: Dict[str, Any]):
-        """Сохранение шаблона"""
-        query = """
-        INSERT INTO templates (room_id, name, data, created_at)
-        VALUES (?, ?, ?, ?)
-        """
-        params = (
-            room_id,
-            template_data.get("name", "Шаблон"),
-            json.dumps(template_data),
-            datetime.now().isoformat()
+    @timed_db
+    async def save_template(self, room_id: str, template_data: Dict[str, Any]) -> Dict:
+        """Сохранение шаблона: тело - один раз на содержимое (template_blobs), в комнате - ссылка по хешу
+        (повторное сохранение того же шаблона в комнате новой записи не добавляет)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            template = await self._add_template(db, room_id, template_data, datetime.now().isoformat())
+            await db.commit()
+        
+        return template
+    
+    async def _add_template(self, db, room_id: str, template_data: Dict[str, Any], created_at: str) -> Dict:
+        """Запись шаблона в транзакции вызывающего ("added" - в комнате появилась новая ссылка)"""
+        digest, data = template_hash(template_data)
+        name = template_data.get("name", "Шаблон")
+        size = len(data.encode())
+        await db.execute(
+            "INSERT OR IGNORE INTO template_blobs (hash, data, size, created_at) VALUES (?, ?, ?, ?)",
+            (digest, data, size, created_at)
         )
-        await self.execute_query(query, params)
+        async with db.execute("SELECT 1 FROM templates WHERE room_id = ? AND hash = ?", (room_id, digest)) as cursor:
+            added = await cursor.fetchone() is None
+        if added:
+            # Тело шаблона в templates.data не дублируется
+            await db.execute(
+                "INSERT INTO templates (room_id, name, data, hash, created_at) VALUES (?, ?, '', ?, ?)",
+                (room_id, name, digest, created_at)
+            )
+            await self._update_stats(db, room_id, "templates", 1, size, created_at)
+        return {"hash": digest, "name": name, "size": size, "added": added}
     
-    async def get_room_templates(self, room_id: str) -> List[Dict]:
-        """Получение шаблонов для комнаты"""
-        query = """
-        SELECT id, name, data, created_at
-        FROM templates
-        WHERE room_id = ?
-        ORDER BY created_at DESC
+    @timed_db
+    async def get_room_templates(self, room_id: str, with_data: bool = False) -> List[Dict]:
+        """Получение шаблонов для комнаты (тела - только с with_data, иначе клиент берет их по хешу)"""
+        query = f"""
+        SELECT t.id, t.name, t.hash, b.size, t.created_at{", b.data" if with_data else ""}
+        FROM templates t
+        LEFT JOIN template_blobs b ON b.hash = t.hash
+        WHERE t.room_id = ?
+        ORDER BY t.created_at DESC
         """
         rows = await self.fetch_all(query, (room_id,))
         
-        return [
-            {
+        templates = []
+        for row in rows:
+            template = {
                 "id": row[0],
                 "name": row[1],
-                "data": json.loads(row[2]),
-                "created_at": row[3]
+                "hash": row[2],
+                "size": row[3],
+                "created_at": row[4]
             }
-            for row in rows
-        ]
+            if with_data:
+                template["data"] = json.loads(row[5]) if row[5] else None
+            templates.append(template)
+        return templates
+    
+    @timed_db
+    async def get_template_blob(self, digest: str) -> Optional[str]:
+        """Тело шаблона (каноничный JSON) по хешу"""
+        row = await self.fetch_one("SELECT data FROM template_blobs WHERE hash = ?", (digest,))
+        return row[0] if row else None
     
+    @timed_db
     async def save_app_version(self, version: AppVersion):
         """Сохранение версии приложения"""
         query = """
@@ -113,6 +210,7 @@ class Database:
         )
         await self.execute_query(query, params)
     
+    @timed_db
     async def get_latest_version(self, platform: str) -> Optional[Dict]:
         """Получение последней версии для платформы"""
         query = """
@@ -136,8 +234,20 @@ class Database:
             }
         return None
     
+    @timed_db
     async def save_drawing_event(self, room_id: str, event: DrawingEvent):
         """Сохранение события рисования"""
+        async with aiosqlite.connect(self.db_path) as db:
+            size = await self._add_event(db, room_id, event)
+            if size is None:
+                # Событие с таким event_id уже существует
+                return False
+            await self._update_stats(db, room_id, "events", 1, size, event.timestamp.isoformat())
+            await db.commit()
+        return True
+    
+    async def _add_event(self, db, room_id: str, event: DrawingEvent) -> Optional[int]:
+        """Запись события и агрегатов в транзакции вызывающего: размер для счетчиков или None - event_id занят"""
         query = """
         INSERT INTO drawing_events (
             event_id, event_name, room_id, drawing_type, action, 
@@ -146,6 +256,8 @@ class Database:
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
         
+        style = json.dumps(event.style.dict())
+        data = json.dumps(event.data if isinstance(event.data, dict) else event.data.dict())
         params = (
             event.event_id, 
             event.event_name,
@@ -153,18 +265,84 @@ class Database:
             event.drawing_type,
             event.action,
             event.platform,
-            json.dumps(event.style.dict()),
-            json.dumps(event.data if isinstance(event.data, dict) else event.data.dict()),
+            style,
+            data,
             event.timestamp.isoformat()
         )
-        
         try:
-            await self.execute_query(query, params)
-            return True
+            await db.execute(query, params)
         except sqlite3.IntegrityError:
-            # Событие с таким event_id уже существует
-            return False
+            return None
+        await self._update_rollups(db, room_id, event)
+        return len(style.encode()) + len(data.encode())
+    
+    @timed_db
+    async def import_room_batch(self, room_id: str, drawings: List[DrawingCommand], events: List[DrawingEvent],
+                                templates: List[Tuple[Dict[str, Any], str]]) -> Dict[str, int]:
+        """Загрузка пачки данных комнаты одной транзакцией (события с занятым event_id и уже
+        имеющиеся в комнате шаблоны пропускаются); templates - (тело, created_at)"""
+        imported = {"drawings": len(drawings), "events": 0, "templates": 0, "skipped": 0}
+        async with aiosqlite.connect(self.db_path) as db:
+            if drawings:
+                await db.executemany("""
+                INSERT INTO drawing_commands (room_id, x, y, action, color, size, tool, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (room_id, command.x, command.y, command.action,
+                     command.color, command.size, command.tool, command.timestamp)
+                    for command in drawings
+                ])
+                await self._update_stats(db, room_id, "drawings", len(drawings),
+                                         sum(_drawing_size(command) for command in drawings),
+                                         max(command.timestamp for command in drawings))
+            events_size = 0
+            last_event_at = None
+            for event in events:
+                size = await self._add_event(db, room_id, event)
+                if size is None:
+                    imported["skipped"] += 1
+                    continue
+                imported["events"] += 1
+                events_size += size
+                last_event_at = max(last_event_at or "", event.timestamp.isoformat())
+            if imported["events"]:
+                await self._update_stats(db, room_id, "events", imported["events"], events_size, last_event_at)
+            for template_data, created_at in templates:
+                if (await self._add_template(db, room_id, template_data, created_at))["added"]:
+                    imported["templates"] += 1
+                else:
+                    imported["skipped"] += 1
+            await db.commit()
+        return imported
+    
+    async def iter_room_records(self, room_id: str) -> AsyncIterator[Tuple[str, tuple]]:
+        """Построчное чтение данных комнаты для экспорта: ("drawing" | "event" | "template", строка)
+        
+        Строки читаются курсором порциями, вся комната в памяти не собирается.
+        События - с исходным JSON style/data (без повторного разбора).
+        """
+        queries = (
+            ("drawing", """
+            SELECT x, y, action, color, size, tool, timestamp
+            FROM drawing_commands WHERE room_id = ? ORDER BY id ASC
+            """),
+            ("event", """
+            SELECT event_id, event_name, drawing_type, action, platform, style, data, timestamp
+            FROM drawing_events WHERE room_id = ? ORDER BY timestamp ASC
+            """),
+            ("template", """
+            SELECT t.name, t.hash, t.created_at, COALESCE(b.data, t.data)
+            FROM templates t LEFT JOIN template_blobs b ON b.hash = t.hash
+            WHERE t.room_id = ? ORDER BY t.id ASC
+            """),
+        )
+        async with aiosqlite.connect(self.db_path, iter_chunk_size=500) as db:
+            for kind, query in queries:
+                async with db.execute(query, (room_id,)) as cursor:
+                    async for row in cursor:
+                        yield kind, row
     
+    @timed_db
     async def get_room_events(self, room_id: str) -> List[Dict]:
         """Получение всех событий рисования для комнаты"""
         query = """
@@ -190,6 +368,7 @@ class Database:
             for row in rows
         ]
     
+    @timed_db
     async def get_event(self, event_id: str) -> Optional[Dict]:
         """Получение конкретного события по ID"""
         query = """
@@ -215,6 +394,7 @@ class Database:
             "timestamp": row[8]
         }
     
+    @timed_db
     async def delete_event(self, event_id: str) -> bool:
         """Удаление события по ID"""
         query = """
@@ -223,19 +403,195 @@ class Database:
         """
         
         try:
-            await self.execute_query(query, (event_id,))
+            async with aiosqlite.connect(self.db_path) as db:
+                async with db.execute(
+                    "SELECT room_id, length(CAST(style AS BLOB)) + length(CAST(data AS BLOB)) "
+                    "FROM drawing_events WHERE event_id = ?", (event_id,)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                await db.execute(query, (event_id,))
+                if row:
+                    await self._update_stats(db, row[0], "events", -1, -row[1])
+                await db.commit()
             return True
         except Exception:
             return False
             
+    @timed_db
     async def clear_room_events(self, room_id: str):
         """Очистка всех событий рисования в комнате"""
         query = "DELETE FROM drawing_events WHERE room_id = ?"
-        await self.execute_query(query, (room_id,))
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(query, (room_id,))
+            await self._reset_stats(db, room_id, "events")
+            await db.commit()
+    
+    async def _update_stats(self, db, room_id: str, kind: str, count: int, size: int, last_event_at: str = None):
+        """Изменение счетчиков комнаты в транзакции записи (kind - drawings, events или templates)"""
+        await db.execute(f"""
+        INSERT INTO room_stats (room_id, {kind}_count, {kind}_bytes, last_event_at)
+        VALUES (?, MAX(?, 0), MAX(?, 0), ?)
+        ON CONFLICT(room_id) DO UPDATE SET
+            {kind}_count = MAX({kind}_count + ?, 0),
+            {kind}_bytes = MAX({kind}_bytes + ?, 0),
+            last_event_at = COALESCE(MAX(last_event_at, excluded.last_event_at), last_event_at, excluded.last_event_at)
+        """, (room_id, count, size, last_event_at, count, size))
+    
+    async def _reset_stats(self, db, room_id: str, kind: str):
+        """Обнуление счетчиков после очистки"""
+        await db.execute(f"UPDATE room_stats SET {kind}_count = 0, {kind}_bytes = 0 WHERE room_id = ?", (room_id,))
+    
+    async def _update_rollups(self, db, room_id: str, event: DrawingEvent):
+        """Учет события в минутном и часовом агрегатах (в транзакции записи события)"""
+        received = datetime.now()
+        for granularity, (table, _) in ROLLUP_TABLES.items():
+            await db.execute(f"""
+            INSERT INTO {table} (bucket, room_id, platform, drawing_type, action, count)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT(bucket, room_id, platform, drawing_type, action) DO UPDATE SET count = count + 1
+            """, (rollup_bucket(received, granularity), room_id, event.platform, event.drawing_type, event.action))
+    
+    @timed_db
+    async def get_event_rollups(self, granularity: str, start: datetime, end: datetime,
+                                room_id: Optional[str] = None, group_by: Tuple[str, ...] = ()) -> List[Dict]:
+        """Число событий по интервалам, пересекающим [start, end), из агрегатов (без чтения drawing_events)"""
+        table = ROLLUP_TABLES[granularity][0]
+        columns = "".join(f", {column}" for column in group_by)
+        query = f"""
+        SELECT bucket{columns}, SUM(count)
+        FROM {table}
+        WHERE bucket >= ? AND bucket < ?{" AND room_id = ?" if room_id else ""}
+        GROUP BY bucket{columns}
+        ORDER BY bucket{columns}
+        """
+        params = (rollup_bucket(start, granularity), rollup_bucket_after(end, granularity)) + ((room_id,) if room_id else ())
+        rows = await self.fetch_all(query, params)
+        
+        return [
+            dict(zip(("bucket",) + tuple(group_by) + ("count",), row))
+            for row in rows
+        ]
+    
+    @timed_db
+    async def get_event_totals(self, start: datetime, end: datetime, room_id: Optional[str] = None,
+                               group_by: Tuple[str, ...] = ()) -> List[Dict]:
+        """Число событий за [start, end) с точностью до минуты (минута, содержащая end, включается):
+        целые часы - из часового агрегата, неполные часы по краям - из минутного"""
+        start_minute = rollup_bucket(start, "minute")
+        end_minute = rollup_bucket_after(end, "minute")
+        first_hour = rollup_bucket(start, "hour")
+        if start_minute != first_hour + ":00":
+            first_hour = rollup_bucket(datetime.fromisoformat(first_hour) + timedelta(hours=1), "hour")
+        last_hour = end_minute[:ROLLUP_TABLES["hour"][1]]
+        if first_hour >= last_hour:
+            # Диапазон не содержит целых часов
+            first_hour = last_hour = end_minute
+        room_filter = " AND room_id = ?" if room_id else ""
+        room_params = (room_id,) if room_id else ()
+        columns = ", ".join(group_by)
+        query = f"""
+        SELECT {columns + ", " if columns else ""}SUM(count)
+        FROM (
+            SELECT * FROM event_rollup_hour
+            WHERE bucket >= ? AND bucket < ?{room_filter}
+            UNION ALL
+            SELECT * FROM event_rollup_minute
+            WHERE ((bucket >= ? AND bucket < ?) OR (bucket >= ? AND bucket < ?)){room_filter}
+        )
+        {"GROUP BY " + columns if columns else ""}
+        """
+        params = (
+            (first_hour, last_hour) + room_params
+            + (start_minute, min(first_hour + ":00", end_minute), max(last_hour + ":00", start_minute), end_minute)
+            + room_params
+        )
+        rows = await self.fetch_all(query, params)
+        
+        return [
+            dict(zip(tuple(group_by) + ("count",), row))
+            for row in rows
+            if row[-1]
+        ]
+    
+    @timed_db
+    async def get_room_stats(self, room_id: str) -> Dict:
+        """Счетчики комнаты (без чтения самих записей)"""
+        query = """
+        SELECT drawings_count, events_count, templates_count,
+               drawings_bytes + events_bytes + templates_bytes, last_event_at
+        FROM room_stats
+        WHERE room_id = ?
+        """
+        row = await self.fetch_one(query, (room_id,))
+        row = row or (0, 0, 0, 0, None)
+        
+        return {
+            "drawings_count": row[0],
+            "events_count": row[1],
+            "templates_count": row[2],
+            "bytes": row[3],
+            "last_event_at": row[4]
+        }
+    
+    @timed_db
+    async def get_stats_totals(self) -> Dict:
+        """Суммарные счетчики всех комнат"""
+        query = """
+        SELECT COUNT(*), COALESCE(SUM(drawings_count), 0), COALESCE(SUM(events_count), 0),
+               COALESCE(SUM(templates_count), 0),
+               COALESCE(SUM(drawings_bytes + events_bytes + templates_bytes), 0), MAX(last_event_at)
+        FROM room_stats
+        """
+        row = await self.fetch_one(query)
+        
+        return {
+            "rooms": row[0],
+            "drawings_count": row[1],
+            "events_count": row[2],
+            "templates_count": row[3],
+            "bytes": row[4],
+            "last_event_at": row[5]
+        }
+
+    @timed_db
+    async def get_rooms(self) -> List[Dict]:
+        """Получение настроек всех комнат"""
+        query = """
+        SELECT id, name, created_at, max_users, is_private, password
+        FROM rooms
+        """
+        rows = await self.fetch_all(query)
+        
+        return [
+            {
+                "id": row[0],
+                "name": row[1],
+                "created_at": row[2],
+                "max_users": row[3],
+                "is_private": bool(row[4]),
+                "password": row[5]
+            }
+            for row in rows
+        ]
+    
+    @timed_db
+    async def save_room(self, room_id: str, name: Optional[str], max_users: int,
+                        is_private: bool = False, password: Optional[str] = None):
+        """Создание или обновление настроек комнаты"""
+        query = """
+        INSERT INTO rooms (id, name, max_users, is_private, password)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name,
+            max_users = excluded.max_users,
+            is_private = excluded.is_private,
+            password = excluded.password
+        """
+        await self.execute_query(query, (room_id, name, max_users, is_private, password))
 
-async def init_db():
+async def init_db(db_path: str = "drawing_sync.db"):
     """Инициализация базы данных"""
-    async with aiosqlite.connect("drawing_sync.db") as db:
+    async with aiosqlite.connect(db_path) as db:
         # Таблица команд рисования
         await db.execute("""
         CREATE TABLE IF NOT EXISTS drawing_commands (
@@ -292,6 +648,21 @@ async def init_db():
         # Индексы для оптимизации
         await db.execute("CREATE INDEX IF NOT EXISTS idx_drawing_room ON drawing_commands(room_id)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_templates_room ON templates(room_id)")
+        
+        # Тела шаблонов по хешу содержимого (templates ссылается на них колонкой hash)
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS template_blobs (
+            hash TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        async with db.execute("PRAGMA table_info(templates)") as cursor:
+            if "hash" not in [column[1] for column in await cursor.fetchall()]:
+                await db.execute("ALTER TABLE templates ADD COLUMN hash TEXT")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_templates_room_hash ON templates(room_id, hash)")
+        templates_migrated = await _hash_templates(db)
         await db.execute("CREATE INDEX IF NOT EXISTS idx_versions_platform ON app_versions(platform)")
         
         # Таблица событий рисования
@@ -315,5 +686,112 @@ async def init_db():
         await db.execute("CREATE INDEX IF NOT EXISTS idx_events_room ON drawing_events(room_id)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_events_event_id ON drawing_events(event_id)")
         
+        # Счетчики комнат (обновляются в тех же транзакциях, что и данные)
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS room_stats (
+            room_id TEXT PRIMARY KEY,
+            drawings_count INTEGER NOT NULL DEFAULT 0,
+            drawings_bytes INTEGER NOT NULL DEFAULT 0,
+            events_count INTEGER NOT NULL DEFAULT 0,
+            events_bytes INTEGER NOT NULL DEFAULT 0,
+            templates_count INTEGER NOT NULL DEFAULT 0,
+            templates_bytes INTEGER NOT NULL DEFAULT 0,
+            last_event_at TEXT
+        )
+        """)
+        
+        # Агрегаты событий по минутам и часам (обновляются при сохранении события)
+        for table, _ in ROLLUP_TABLES.values():
+            await db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TEXT NOT NULL,
+                room_id TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                drawing_type TEXT NOT NULL,
+                action TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, room_id, platform, drawing_type, action)
+            )
+            """)
+            await db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_room ON {table}(room_id, bucket)")
+        
+        # Первый запуск с таблицей счетчиков (или перенос шаблонов) - заполняем по существующим данным
+        async with db.execute("SELECT COUNT(*) FROM room_stats") as cursor:
+            if (await cursor.fetchone())[0] == 0 or templates_migrated:
+                await _rebuild_room_stats(db)
+        async with db.execute("SELECT COUNT(*) FROM event_rollup_hour") as cursor:
+            rollups_empty = (await cursor.fetchone())[0] == 0
+        async with db.execute("PRAGMA user_version") as cursor:
+            rollups_outdated = (await cursor.fetchone())[0] < ROLLUP_VERSION
+        if rollups_empty or rollups_outdated:
+            await _rebuild_event_rollups(db)
+            await db.execute(f"PRAGMA user_version = {ROLLUP_VERSION}")
+        
+        await db.commit()
+        log.info("✅ База данных инициализирована")
+
+async def _rebuild_room_stats(db):
+    """Пересчет счетчиков комнат по данным (без commit)"""
+    await db.execute("DELETE FROM room_stats")
+    await db.execute(f"""
+    INSERT INTO room_stats (room_id, drawings_count, drawings_bytes, events_count, events_bytes,
+                            templates_count, templates_bytes, last_event_at)
+    SELECT room_id, SUM(dc), SUM(db), SUM(ec), SUM(eb), SUM(tc), SUM(tb), MAX(ts) FROM (
+        SELECT room_id, COUNT(*) AS dc,
+               SUM({DRAWING_ROW_NUMERIC_BYTES} + length(CAST(action || color || tool || timestamp AS BLOB))) AS db,
+               0 AS ec, 0 AS eb, 0 AS tc, 0 AS tb, MAX(timestamp) AS ts
+        FROM drawing_commands GROUP BY room_id
+        UNION ALL
+        SELECT room_id, 0, 0, COUNT(*), SUM(length(CAST(style AS BLOB)) + length(CAST(data AS BLOB))),
+               0, 0, MAX(timestamp)
+        FROM drawing_events GROUP BY room_id
+        UNION ALL
+        SELECT t.room_id, 0, 0, 0, 0, COUNT(*), SUM(COALESCE(b.size, length(CAST(t.data AS BLOB)))), MAX(t.created_at)
+        FROM templates t LEFT JOIN template_blobs b ON b.hash = t.hash GROUP BY t.room_id
+    )
+    GROUP BY room_id
+    """)
+
+async def _rebuild_event_rollups(db):
+    """Пересчет агрегатов событий по drawing_events (без commit)
+    
+    Время получения - created_at (CURRENT_TIMESTAMP в UTC), приводится к локальному, как datetime.now()
+    в _update_rollups, поэтому пересчет дает те же метки, что и запись по ходу работы.
+    """
+    for table, length in ROLLUP_TABLES.values():
+        await db.execute(f"DELETE FROM {table}")
+        await db.execute(f"""
+        INSERT INTO {table} (bucket, room_id, platform, drawing_type, action, count)
+        SELECT substr(replace(datetime(created_at, 'localtime'), ' ', 'T'), 1, {length}),
+               room_id, platform, drawing_type, action, COUNT(*)
+        FROM drawing_events
+        GROUP BY 1, room_id, platform, drawing_type, action
+        """)
+
+async def _hash_templates(db) -> int:
+    """Перенос тел шаблонов старого формата (templates.data) в template_blobs (без commit)"""
+    async with db.execute("SELECT id, data FROM templates WHERE hash IS NULL") as cursor:
+        rows = await cursor.fetchall()
+    for template_id, raw in rows:
+        try:
+            digest, data = template_hash(json.loads(raw))
+        except ValueError:
+            log.error("❌ Некорректный JSON шаблона %s", template_id)
+            continue
+        await db.execute(
+            "INSERT OR IGNORE INTO template_blobs (hash, data, size) VALUES (?, ?, ?)",
+            (digest, data, len(data.encode()))
+        )
+        await db.execute("UPDATE templates SET hash = ?, data = '' WHERE id = ?", (digest, template_id))
+    if rows:
+        log.info("✅ Шаблоны перенесены в хранилище по хешу: %d", len(rows))
+    return len(rows)
+
+async def rebuild_room_stats(db_path: str = "drawing_sync.db"):
+    """Пересчет счетчиков комнат и агрегатов событий (после переноса данных в обход Database)"""
+    async with aiosqlite.connect(db_path) as db:
+        await _hash_templates(db)
+        await _rebuild_room_stats(db)
+        await _rebuild_event_rollups(db)
         await db.commit()
-        print("✅ База данных инициализирована")
+    log.info("✅ Счетчики комнат пересчитаны")
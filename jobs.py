@@ -0,0 +1,324 @@
+"""
+Важкі операції в пулі процесів
+
+Експорт/імпорт кімнат і побудова знімків історії великих кімнат - це розбір та кодування JSON,
+тобто чистий Python: у циклі подій або в пулі потоків він через GIL затримує розсилку WebSocket.
+Такі операції виконуються як завдання в ProcessPoolExecutor (запускається при старті сервера):
+одночасно не більше JOBS_MAX_CONCURRENT, у черзі не більше JOBS_MAX_PENDING.
+Завдання має статус (queued, running, done, failed, cancelled) і прогрес; прогрес і прапорець
+скасування передаються через спільну пам'ять - слот на кожне місце пулу, без черг між процесами.
+"""
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
+
+import config
+from database import Database
+from logger import get_logger
+from metrics import counter, gauge, histogram
+import room_transfer
+from snapshots import encode
+
+log = get_logger("jobs")
+
+jobs_total = counter(
+    "drawing_sync_jobs_total", "Finished background jobs by kind and status", ("kind", "status"))
+job_seconds = histogram(
+    "drawing_sync_job_seconds", "Background job run time (excluding queueing) by kind", ("kind",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+job_queue_seconds = histogram(
+    "drawing_sync_job_queue_seconds", "Time a background job waits for a pool slot", ("kind",))
+
+
+class JobCancelled(Exception):
+    """Завдання скасовано під час виконання"""
+
+
+# Спільна пам'ять робочого процесу (initializer пулу)
+_progress = None
+_cancelled = None
+
+
+def _init_worker(progress, cancelled):
+    global _progress, _cancelled
+    _progress, _cancelled = progress, cancelled
+
+
+def checkpoint(slot: int, fraction: float):
+    """Прогрес з робочого процесу; скасоване завдання перериваються тут"""
+    if _progress is None:
+        return
+    _progress[slot] = min(max(fraction, 0.0), 1.0)
+    if _cancelled[slot]:
+        raise JobCancelled()
+
+
+# Функції завдань: виконуються в робочому процесі, аргументи та результат серіалізуються pickle
+
+def export_job(slot: int, db_path: str, room_id: str, export_format: str, path: str, total: int) -> dict:
+    """Експорт кімнати в gzip-файл (room_transfer.export_room)"""
+    async def run():
+        written = 0
+        with open(path, "wb") as output:
+            async for chunk in room_transfer.export_room(
+                    Database(db_path), room_id, export_format,
+                    progress=lambda records: checkpoint(slot, records / total if total else 0.0)):
+                output.write(chunk)
+                written += len(chunk)
+        return written
+    try:
+        return {"path": path, "format": export_format, "size": asyncio.run(run())}
+    except BaseException:
+        # Неповний файл (скасування або помилка) не залишається в каталозі результатів
+        if os.path.exists(path):
+            os.unlink(path)
+        raise
+
+
+def import_job(slot: int, db_path: str, room_id: str, path: str) -> dict:
+    """Імпорт файлу експорту в кімнату (room_transfer.import_room) пачками транзакцій"""
+    size = os.path.getsize(path) or 1
+
+    async def chunks():
+        read = 0
+        with open(path, "rb") as source:
+            while True:
+                chunk = source.read(1 << 16)
+                if not chunk:
+                    return
+                read += len(chunk)
+                checkpoint(slot, read / size)
+                yield chunk
+
+    try:
+        return {"imported": asyncio.run(room_transfer.import_room(Database(db_path), room_id, chunks()))}
+    except room_transfer.TransferError as e:
+        # Помилка даних - результат завдання, а не збій: вже записані пачки залишаються
+        return {"error": str(e), "imported": e.imported}
+    finally:
+        os.unlink(path)
+
+
+def snapshot_job(slot: int, db_path: str, kind: str, room_id: str) -> bytes:
+    """Закодований знімок історії кімнати (GET /api/rooms/{room_id}/drawings, GET /api/events/{room_id})"""
+    async def run():
+        db = Database(db_path)
+        if kind == "events":
+            items = await db.get_room_events(room_id)
+        else:
+            items = await db.get_room_drawings(room_id)
+        return encode({"room_id": room_id, kind: items, "count": len(items)})
+    return asyncio.run(run())
+
+
+class Job:
+    """Стан завдання в основному процесі"""
+
+    def __init__(self, kind: str, room_id: str, on_done: Optional[Callable] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.room_id = room_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.slot: Optional[int] = None
+        self.progress = 0.0
+        self.result = None
+        self.error: Optional[str] = None
+        self.on_done = on_done
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def describe(self) -> dict:
+        result = self.result if isinstance(self.result, dict) else None
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "room_id": self.room_id,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "result": {key: value for key, value in result.items() if key != "path"} if result else None,
+        }
+
+
+class JobManager:
+    """Пул процесів і реєстр завдань"""
+
+    def __init__(self):
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.slots: List[int] = []
+        self._slots_free: Optional[asyncio.Semaphore] = None
+        self._progress = None
+        self._cancelled = None
+        self.result_dir = os.path.join(tempfile.gettempdir(), f"drawing_sync_jobs_{os.getpid()}")
+
+    def start(self):
+        """Запуск пулу (обробник startup FastAPI)"""
+        size = config.JOBS_MAX_CONCURRENT
+        context = multiprocessing.get_context(config.JOBS_START_METHOD)
+        self._progress = context.Array("d", size, lock=False)
+        self._cancelled = context.Array("b", size, lock=False)
+        self.pool = self._create_pool()
+        self.slots = list(range(size))
+        self._slots_free = asyncio.Semaphore(size)
+        os.makedirs(self.result_dir, exist_ok=True)
+        log.info("✅ Пул завдань запущено: %d процесів", size)
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=config.JOBS_MAX_CONCURRENT, mp_context=multiprocessing.get_context(config.JOBS_START_METHOD),
+            initializer=_init_worker, initargs=(self._progress, self._cancelled))
+
+    def shutdown(self):
+        for job in self.jobs.values():
+            if not job.finished and job.slot is not None:
+                self._cancelled[job.slot] = 1
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+        shutil.rmtree(self.result_dir, ignore_errors=True)
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == "queued")
+
+    @property
+    def running(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == "running")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is not None and job.status == "running" and job.slot is not None:
+            job.progress = self._progress[job.slot]
+        return job
+
+    def submit(self, kind: str, room_id: str, function: Callable, *args,
+               on_done: Optional[Callable] = None, limit: bool = True) -> Optional[Job]:
+        """Постановка завдання; None - черга повна. function(slot, *args) виконується в пулі"""
+        if limit and self.pending >= config.JOBS_MAX_PENDING:
+            return None
+        job = Job(kind, room_id, on_done)
+        self.jobs[job.id] = job
+        self._evict()
+        job.task = asyncio.ensure_future(self._run(job, function, args))
+        return job
+
+    async def run(self, kind: str, room_id: str, function: Callable, *args):
+        """Виконання в пулі з очікуванням результату (помилка завдання піднімається тут)
+        
+        Без обмеження JOBS_MAX_PENDING: такі виклики вже обмежені тим, хто їх чекає (single-flight знімків).
+        """
+        job = self.submit(kind, room_id, function, *args, limit=False)
+        try:
+            await asyncio.shield(job.task)
+        finally:
+            # Внутрішні завдання не витісняють з реєстру завдання API
+            if job.finished:
+                self.jobs.pop(job.id, None)
+        if job.status != "done":
+            raise RuntimeError(job.error or f"Завдання {job.status}")
+        return job.result
+
+    async def _run(self, job: Job, function: Callable, args: tuple):
+        try:
+            if self.pool is None:
+                raise RuntimeError("Пул завдань не запущено")
+            async with self._slots_free:
+                pool = self.pool
+                job.slot = self.slots.pop()
+                self._progress[job.slot] = 0.0
+                self._cancelled[job.slot] = 0
+                job.status = "running"
+                job.started_at = time.time()
+                job_queue_seconds.observe(job.started_at - job.created_at, job.kind)
+                try:
+                    job.result = await asyncio.get_running_loop().run_in_executor(
+                        pool, function, job.slot, *args)
+                    job.status = "done"
+                    job.progress = 1.0
+                finally:
+                    job.progress = max(job.progress, self._progress[job.slot])
+                    self.slots.append(job.slot)
+                    job.slot = None
+                    job_seconds.observe(time.time() - job.started_at, job.kind)
+        except (JobCancelled, asyncio.CancelledError):
+            job.status = "cancelled"
+        except BrokenProcessPool as e:
+            # Робочий процес аварійно завершився (пам'ять, сигнал) - пул непридатний, створюється новий;
+            # завдання, що виконувалися в старому, завершуються тією ж помилкою, але пул замінює лише перше
+            job.status = "failed"
+            job.error = str(e)
+            if self.pool is not None and self.pool is pool:
+                log.error("❌ Пул завдань пошкоджено, перезапуск: %s", e)
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._create_pool()
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e) or type(e).__name__
+            log.error("❌ Завдання %s (%s, кімната %s) завершилося помилкою: %s", job.id, job.kind, job.room_id, e)
+        finally:
+            job.finished_at = time.time()
+            jobs_total.inc(job.kind, job.status)
+            if job.on_done is not None:
+                try:
+                    job.on_done(job)
+                except Exception as e:
+                    log.error("❌ Помилка обробки завершення завдання %s: %s", job.id, e)
+
+    def cancel(self, job_id: str) -> bool:
+        """Скасування: завдання в черзі - одразу, що виконується - на найближчій контрольній точці"""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        if job.slot is not None:
+            self._cancelled[job.slot] = 1
+        else:
+            job.task.cancel()
+        return True
+
+    def result_path(self, suffix: str) -> str:
+        """Новий файл для результату або завантаження завдання"""
+        return os.path.join(self.result_dir, f"{uuid.uuid4().hex}{suffix}")
+
+    def _evict(self):
+        """Видалення найстаріших завершених завдань понад JOBS_HISTORY (разом з файлами результатів)"""
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:max(0, len(self.jobs) - config.JOBS_HISTORY)]:
+            del self.jobs[job.id]
+            path = job.result.get("path") if isinstance(job.result, dict) else None
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+
+manager = JobManager()
+
+gauge("drawing_sync_jobs_running", "Background jobs running in the process pool",
+      function=lambda: manager.running)
+gauge("drawing_sync_jobs_pending", "Background jobs waiting for a process pool slot",
+      function=lambda: manager.pending)
+
+
+async def build_snapshot(db: Database, kind: str, room_id: str):
+    """Знімок історії кімнати (drawings або events) для SnapshotCache: велика кімната - у пулі процесів"""
+    stats = await db.get_room_stats(room_id)
+    if manager.pool is not None and stats[f"{kind}_count"] >= config.JOBS_OFFLOAD_MIN_ROWS:
+        return await manager.run(f"snapshot_{kind}", room_id, snapshot_job, db.db_path, kind, room_id)
+    items = await (db.get_room_events(room_id) if kind == "events" else db.get_room_drawings(room_id))
+    return {"room_id": room_id, kind: items, "count": len(items)}
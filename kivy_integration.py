@@ -4,6 +4,7 @@
 import asyncio
 import websockets
 import json
+import random
 import requests
 import threading
 from datetime import datetime
@@ -11,11 +12,21 @@ from datetime import datetime
 class DrawingSyncClient:
     """Клиент для синхронизации рисования с сервером"""
     
-    def __init__(self, server_url="ws://localhost:8000", room_id="default"):
+    # Переподключение без подсказки сервера: случайная задержка до BASE * 2^попытка, не больше MAX
+    RECONNECT_BASE_DELAY = 1.0
+    RECONNECT_MAX_DELAY = 60.0
+    
+    def __init__(self, server_url="ws://localhost:8000", room_id="default", token=None):
         self.server_url = server_url
         self.room_id = room_id
+        # Токен сессии приватной комнаты (POST /api/rooms/{room_id}/auth)
+        self.token = token
         self.websocket = None
         self.connected = False
+        self.running = False
+        self._received = False
+        # Тела шаблонов по хешу: сервер рассылает только {hash, name}, тело загружается один раз
+        self.templates = {}
         self.callbacks = {
             'on_drawing': None,
             'on_clear': None,
@@ -30,22 +41,59 @@ class DrawingSyncClient:
             self.callbacks[event_type] = callback_function
     
     async def connect(self):
-        """Подключение к серверу"""
-        try:
-            uri = f"{self.server_url}/ws/{self.room_id}"
-            self.websocket = await websockets.connect(uri)
-            self.connected = True
-            print(f"✅ Подключен к комнате: {self.room_id}")
-            
-            # Запускаем обработчик сообщений
-            await self._message_handler()
+        """Подключение к серверу с автоматическим переподключением
+        
+        Задержку сервер подсказывает в причине закрытия ({"retry_after": ...}, уже со случайным разбросом),
+        иначе она экспоненциальная со случайным разбросом - клиенты после сбоя не возвращаются одновременно.
+        """
+        self.running = True
+        attempt = 0
+        while self.running:
+            delay = None
+            try:
+                # batch=1 - сервер может объединять сообщения в пакеты, heartbeat=1 - клиент отвечает на ping
+                uri = f"{self.server_url}/ws/{self.room_id}?batch=1&heartbeat=1"
+                if self.token:
+                    uri += f"&token={self.token}"
+                self.websocket = await websockets.connect(uri)
+                self.connected = True
+                self._received = False
+                print(f"✅ Подключен к комнате: {self.room_id}")
+                
+                # Запускаем обработчик сообщений
+                await self._message_handler()
+                
+                if self._received:
+                    attempt = 0
+                delay = self._retry_delay(self.websocket.close_code, self.websocket.close_reason, attempt)
+                
+            except Exception as e:
+                print(f"❌ Ошибка подключения: {e}")
+                delay = self._retry_delay(None, None, attempt)
             
-        except Exception as e:
-            print(f"❌ Ошибка подключения: {e}")
             self.connected = False
+            if not self.running or delay is None:
+                break
+            attempt += 1
+            print(f"🔄 Переподключение через {delay:.1f} с")
+            await asyncio.sleep(delay)
+    
+    def _retry_delay(self, code, reason, attempt):
+        """Задержка перед переподключением; None - не переподключаться"""
+        if code == 4401:
+            print("🔒 Нужен действительный токен приватной комнаты")
+            return None
+        try:
+            retry_after = json.loads(reason).get("retry_after") if reason else None
+        except (ValueError, AttributeError):
+            retry_after = None
+        if retry_after:
+            return float(retry_after)
+        return random.uniform(0, min(self.RECONNECT_MAX_DELAY, self.RECONNECT_BASE_DELAY * 2 ** attempt))
     
     async def disconnect(self):
         """Отключение от сервера"""
+        self.running = False
         if self.websocket:
             await self.websocket.close()
             self.connected = False
@@ -104,6 +152,7 @@ class DrawingSyncClient:
         """Обработчик входящих сообщений"""
         try:
             async for message in self.websocket:
+                self._received = True
                 data = json.loads(message)
                 await self._handle_message(data)
         except websockets.exceptions.ConnectionClosed:
@@ -116,7 +165,14 @@ class DrawingSyncClient:
         """Обработка конкретного сообщения"""
         message_type = data.get("type")
         
-        if message_type == "drawing" and self.callbacks['on_drawing']:
+        if message_type == "batch":
+            for message in data.get("messages", []):
+                await self._handle_message(message)
+            
+        elif message_type == "ping":
+            await self.websocket.send(json.dumps({"type": "pong", "id": data.get("id")}))
+            
+        elif message_type == "drawing" and self.callbacks['on_drawing']:
             drawing_data = data.get("data", {})
             self.callbacks['on_drawing'](drawing_data)
             
@@ -124,8 +180,11 @@ class DrawingSyncClient:
             self.callbacks['on_clear']()
             
         elif message_type == "template" and self.callbacks['on_template']:
-            template_data = data.get("data", {})
-            self.callbacks['on_template'](template_data)
+            template_data = data.get("data")
+            if template_data is None:
+                template_data = await self.fetch_template(data.get("hash"))
+            if template_data is not None:
+                self.callbacks['on_template'](template_data)
             
         elif message_type == "user_joined" and self.callbacks['on_user_joined']:
             self.callbacks['on_user_joined'](data)
@@ -133,6 +192,22 @@ class DrawingSyncClient:
         elif message_type == "user_left" and self.callbacks['on_user_left']:
             self.callbacks['on_user_left'](data)
     
+    async def fetch_template(self, template_hash):
+        """Тело шаблона по хешу (из кэша или GET /api/templates/{hash})"""
+        if not template_hash:
+            return None
+        if template_hash not in self.templates:
+            url = f"{self.server_url.replace('ws', 'http', 1)}/api/templates/{template_hash}"
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: requests.get(url, timeout=10))
+                response.raise_for_status()
+                self.templates[template_hash] = response.json()
+            except Exception as e:
+                print(f"❌ Ошибка загрузки шаблона: {e}")
+                return None
+        return self.templates[template_hash]
+    
     def run_in_thread(self):
         """Запуск клиента в отдельном потоке"""
         def run_client():
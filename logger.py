@@ -0,0 +1,158 @@
+"""
+Структуроване логування сервера з фоновою чергою запису
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+import config
+
+ROOT_LOGGER = "drawing_sync"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+
+class CategoryFilter(logging.Filter):
+    """Вибірка та обмеження частоти повідомлень за категоріями"""
+
+    def __init__(self, sampling: Dict[str, float], rate_limits: Dict[str, float]):
+        super().__init__()
+        self.sampling = sampling
+        self.rate_limits = rate_limits
+        # Токени по категоріях: категорія -> [токени, час останнього поповнення]
+        self._buckets: Dict[str, list] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _lookup(table: Dict[str, float], category: str) -> Optional[float]:
+        """Пошук налаштування для категорії з урахуванням батьківських ("ws.message" -> "ws")"""
+        while category:
+            if category in table:
+                return table[category]
+            category = category.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = record.name[len(ROOT_LOGGER) + 1:] if record.name != ROOT_LOGGER else ""
+        record.category = category or "server"
+
+        # Попередження та помилки не відкидаються вибіркою
+        if record.levelno < logging.WARNING:
+            rate = self._lookup(self.sampling, category)
+            if rate is not None and rate < 1.0 and random.random() >= rate:
+                return False
+
+        limit = self._lookup(self.rate_limits, category)
+        if limit is None:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.get(category)
+            if bucket is None:
+                bucket = self._buckets[category] = [float(limit), now]
+            tokens = min(float(limit), bucket[0] + (now - bucket[1]) * limit)
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                self._suppressed[category] = self._suppressed.get(category, 0) + 1
+                return False
+            bucket[0] = tokens - 1.0
+            suppressed = self._suppressed.pop(category, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def suppressed_counts(self) -> Dict[str, int]:
+        """Кількість повідомлень, відкинутих обмеженням частоти"""
+        with self._lock:
+            return dict(self._suppressed)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Обробник, що ніколи не блокує цикл подій: при переповненні черги запис відкидається"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовий формат: час, рівень, категорія, повідомлення"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(category)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" (пропущено {suppressed} повідомлень)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Формат JSON - один об'єкт на рядок"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "category": getattr(record, "category", record.name),
+            "message": record.getMessage(),
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging():
+    """Налаштування логування: фільтр категорій + черга + фоновий потік запису"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if config.LOG_FORMAT == "json" else TextFormatter())
+
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(CategoryFilter(config.LOG_SAMPLING, config.LOG_RATE_LIMITS))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(config.LOG_LEVEL.upper())
+    root.handlers = [_queue_handler]
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Зупинка фонового потоку з дописуванням черги"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Логер для категорії (наприклад, "ws", "ws.message", "db")"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
@@ -0,0 +1,160 @@
+"""
+Сторожовий потік циклу подій: вимірює затримку та ловить блокуючі виклики
+
+Потік періодично ставить у цикл подій порожній колбек через
+call_soon_threadsafe і чекає на його виконання. Якщо колбек не виконався
+за WATCHDOG_STALL_THRESHOLD, цикл зайнятий блокуючим кодом: потік знімає
+стек потоку циклу та запам'ятовує, який маршрут чи повідомлення обробляється.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import config
+from logger import get_logger
+from metrics import event_loop_lag, event_loop_lag_histogram, event_loop_stalls, event_loop_stall_seconds
+
+log = get_logger("watchdog")
+
+# Що зараз обробляє кожна задача циклу подій (маршрут, тип повідомлення)
+_task_activity: Dict[asyncio.Task, str] = {}
+
+MAX_STACK_FRAMES = 40
+
+
+def set_activity(label: str):
+    """Позначити, що обробляє поточна задача"""
+    task = asyncio.current_task()
+    if task is not None:
+        _task_activity[task] = label
+
+
+def clear_activity():
+    """Зняти позначку поточної задачі"""
+    task = asyncio.current_task()
+    if task is not None:
+        _task_activity.pop(task, None)
+
+
+class ActivityMiddleware:
+    """ASGI middleware: позначає задачу запиту його методом і шляхом"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        label = f"{scope.get('method', 'WS')} {scope['path']}"
+        set_activity(label)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            clear_activity()
+
+
+class LoopWatchdog:
+    """Фоновий потік, що вимірює затримку циклу подій"""
+
+    def __init__(self, interval: float, threshold: float, history: int):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = deque(maxlen=history)
+        self.last_lag = 0.0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Запуск (викликається з потоку циклу подій)"""
+        if self._thread is not None:
+            return
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + self.threshold + 1)
+            self._thread = None
+
+    @staticmethod
+    def _current_activity(frame) -> Optional[str]:
+        """Позначка задачі, корутина якої є в стеку заблокованого потоку циклу
+        
+        Лише публічні атрибути (cr_frame, f_back): поточна задача циклу з іншого потоку без
+        внутрішніх структур asyncio не визначається, а кадр її корутини в стеку є завжди.
+        """
+        try:
+            labels = {}
+            for task, label in list(_task_activity.items()):
+                coro_frame = getattr(task.get_coro(), "cr_frame", None)
+                if coro_frame is not None:
+                    labels[id(coro_frame)] = label
+        except RuntimeError:
+            # Словник змінився під час копіювання (цикл уже розблокувався)
+            return None
+        while frame is not None:
+            label = labels.get(id(frame))
+            if label is not None:
+                return label
+            frame = frame.f_back
+        return None
+
+    def _capture(self) -> dict:
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = traceback.format_stack(frame, limit=MAX_STACK_FRAMES) if frame is not None else []
+        return {
+            "detected_at": datetime.now().isoformat(),
+            "activity": self._current_activity(frame),
+            "duration": None,
+            "finished": False,
+            "stack": [line.rstrip() for line in stack],
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            ack = threading.Event()
+            sent = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(ack.set)
+            except RuntimeError:
+                # Цикл подій закрито
+                return
+
+            if not ack.wait(self.threshold):
+                # Цикл заблокований - знімаємо стек, поки блокування триває
+                stall = self._capture()
+                self.stalls.append(stall)
+                while not ack.wait(self.interval):
+                    if self._stop.is_set():
+                        return
+                lag = time.perf_counter() - sent
+                stall["duration"] = round(lag, 4)
+                stall["finished"] = True
+                event_loop_stalls.inc()
+                event_loop_stall_seconds.observe(lag)
+                log.warning("🐢 Цикл подій заблоковано на %.3f с: %s\n%s",
+                            lag, stall["activity"], "\n".join(stall["stack"][-5:]))
+            else:
+                lag = time.perf_counter() - sent
+
+            self.last_lag = lag
+            event_loop_lag.set(lag)
+            event_loop_lag_histogram.observe(lag)
+
+    def recent_stalls(self) -> List[dict]:
+        """Останні блокування, новіші першими"""
+        return list(reversed(self.stalls))
+
+
+watchdog = LoopWatchdog(config.WATCHDOG_INTERVAL, config.WATCHDOG_STALL_THRESHOLD, config.WATCHDOG_HISTORY)
@@ -1,6 +1,7 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 import uvicorn
 import json
 import asyncio
@@ -8,14 +9,35 @@ from typing import Dict, List, Set
 from datetime import datetime
 import os
 
-from websocket_handler import ConnectionManager, handle_websocket_connection, UKRAINE_REGIONS, active_rooms
+import config
+from websocket_handler import ConnectionManager, handle_websocket_connection, UKRAINE_REGIONS, legacy_manager
 from database import Database, init_db
 from api.updates import router as updates_router
 from api.rooms import router as rooms_router
 from api.events import router as events_router
+from api.diagnostics import router as diagnostics_router
+from api.analytics import router as analytics_router
+from api.templates import router as templates_router
+from api.jobs import router as jobs_router
+from logger import setup_logging, shutdown_logging, get_logger
+import metrics
+import tracing
+import admission
+import capture
+import jobs
+import overload
+import rate_limit
+from room_directory import room_directory
+from room_stream import room_streams
+from snapshots import room_snapshots
+from loop_watchdog import watchdog, ActivityMiddleware, set_activity
 from models.drawing import DrawingCommand, Room
 from models.drawing_event import DrawingEvent
 
+setup_logging()
+log = get_logger("server")
+ws_log = get_logger("ws.message")
+
 app = FastAPI(title="Drawing Sync Server", version="1.0.0")
 
 # CORS middleware для поддержки клиентов
@@ -27,6 +49,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Пометка обрабатываемого маршрута для сторожевого потока цикла событий
+app.add_middleware(ActivityMiddleware)
+
 # Статические файлы для обновлений
 os.makedirs("static/updates", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -35,10 +60,23 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 manager = ConnectionManager()
 db = Database()
 
+# Метрики соединений
+metrics.gauge("drawing_sync_connections", "Open WebSocket connections",
+              function=lambda: len(manager.connection_info) + len(legacy_manager.connection_info))
+metrics.gauge("drawing_sync_rooms", "Rooms with at least one connection",
+              function=lambda: len(manager.active_connections) + len(legacy_manager.active_connections))
+
+# Фоновые задачи (запускаются при старте)
+background_tasks: List[asyncio.Task] = []
+
 # Подключение роутеров
 app.include_router(updates_router, prefix="/api/updates", tags=["updates"])
 app.include_router(rooms_router, prefix="/api/rooms", tags=["rooms"])
 app.include_router(events_router, prefix="/api/events", tags=["events"])
+app.include_router(diagnostics_router, prefix="/api/diagnostics", tags=["diagnostics"])
+app.include_router(analytics_router, prefix="/api/analytics", tags=["analytics"])
+app.include_router(templates_router, prefix="/api/templates", tags=["templates"])
+app.include_router(jobs_router, prefix="/api/jobs", tags=["jobs"])
 
 # Настройка менеджера соединений для API
 from api.rooms import set_connection_manager as set_rooms_manager
@@ -52,8 +90,34 @@ from api.rooms import set_connection_manager
 async def startup_event():
     """Инициализация при запуске сервера"""
     await init_db()
+    await admission.room_settings.load(db)
     set_connection_manager(manager)
-    print("🚀 Drawing Sync Server запущен!")
+    watchdog.start(asyncio.get_running_loop())
+    tracing.setup_tracing()
+    capture.setup_capture()
+    jobs.manager.start()
+    background_tasks.append(asyncio.create_task(manager.heartbeat()))
+    background_tasks.append(asyncio.create_task(legacy_manager.heartbeat()))
+    background_tasks.append(asyncio.create_task(overload.controller.run()))
+    background_tasks.append(asyncio.create_task(admission.room_settings.run(db)))
+    background_tasks.append(asyncio.create_task(room_directory.run()))
+    background_tasks.append(asyncio.create_task(room_streams.run()))
+    background_tasks.append(asyncio.create_task(overload.deferred_writer.run(db)))
+    log.info("🚀 Drawing Sync Server запущен!")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Остановка фоновых служб"""
+    for task in background_tasks:
+        task.cancel()
+    # Дожидаемся задач: отложенные команды рисования дописываются в БД
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    jobs.manager.shutdown()
+    watchdog.stop()
+    tracing.shutdown_tracing()
+    capture.shutdown_capture()
+    log.info("🛑 Drawing Sync Server остановлен")
+    shutdown_logging()
 
 @app.get("/")
 async def root():
@@ -75,118 +139,163 @@ async def get_status():
         "status": "online",
         "connected_clients": len(manager.active_connections),
         "active_rooms": len(manager.rooms),
+        "overload": overload.controller.status(),
+        "storage": await db.get_stats_totals(),
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+async def save_drawing_command(room_id: str, drawing_command: DrawingCommand):
+    """Сохранение команды рисования; в режиме перегрузки defer_persistence - отложенная пакетная запись"""
+    if overload.controller.defer_persistence:
+        overload.deferred_writer.add(room_id, drawing_command)
+    else:
+        await db.save_drawing_command(room_id, drawing_command)
+        room_snapshots.invalidate(room_id)
+
+async def handle_message(websocket: WebSocket, room_id: str, message: dict):
+    """Обработка одного сообщения клиента /ws/{room_id}"""
+    # Обрабатываем команду рисования
+    if message.get("type") == "drawing_event":
+        # Поддержка нового формата с географическими координатами
+        event_data = message.get("data", {})
+        action_type = message.get("action", "unknown") or event_data.get("action", "unknown") or event_data.get("event_type", "unknown")
+        
+        ws_log.info("📝 Получено сообщение рисования: %s (комната %s)", action_type, room_id)
+        ws_log.debug("📊 Данные: %s", event_data)
+        
+        # Проверяем наличие географических координат
+        lat = event_data.get("lat")
+        lon = event_data.get("lon")
+        
+        if lat is not None and lon is not None:
+            # Создаем команду рисования
+            drawing_command = DrawingCommand(
+                x=float(lat),  # Используем lat как x
+                y=float(lon),  # Используем lon как y
+                action=action_type,
+                color=event_data.get("color", "#000000"),
+                size=event_data.get("size", 5) or event_data.get("brush_size", 5),
+                tool=event_data.get("tool", action_type.split("_")[0] if "_" in action_type else "brush"),
+                timestamp=datetime.now().isoformat()
+            )
+            
+            # Сохраняем в базу данных (при перегрузке - пакетом в фоне)
+            await save_drawing_command(room_id, drawing_command)
+            
+            # Транслируем всем клиентам в комнате (передаем полное сообщение)
+            broadcast_message = {
+                "type": "drawing_event",
+                "action": action_type,
+                "data": event_data,
+                "timestamp": datetime.now().isoformat()
+            }
+            
+            ws_log.debug("📡 Транслируем сообщение: %s", broadcast_message)
+            
+            await manager.broadcast_to_room(room_id, broadcast_message, exclude=websocket)
+        else:
+            ws_log.warning("⚠️ Пропущено сообщение без координат (комната %s)", room_id)
+            ws_log.debug("📊 Данные: %s", event_data)
+            await manager.send_personal_message(
+                {"type": "error", "message": "Відсутні координати для малювання"}, 
+                websocket
+            )
+    
+    # Обработка стандартизированных событий рисования через JSON
+    elif message.get("type") == "drawing":
+        try:
+            data = message.get("data", {})
+            action_type = message.get("action_type", "unknown")
+            
+            # Создаем команду рисования
+            drawing_command = DrawingCommand(
+                x=data.get("lat", 0),  # Используем lat как x
+                y=data.get("lon", 0),  # Используем lon как y
+                action=action_type,
+                color=data.get("color", "#000000"),
+                size=data.get("size", 5),
+                tool=data.get("tool", action_type.split("_")[0] if "_" in action_type else "brush"),
+                timestamp=datetime.now().isoformat()
+            )
+            
+            # Сохраняем в базу данных (при перегрузке - пакетом в фоне)
+            await save_drawing_command(room_id, drawing_command)
+            
+            # Транслируем всем клиентам в комнате
+            await manager.broadcast_to_room(room_id, message, exclude=websocket)
+            
+        except Exception as e:
+            ws_log.error("❌ Ошибка обработки события рисования: %s", e)
+            await manager.send_personal_message(
+                {"type": "error", "message": f"Ошибка обработки события: {str(e)}"}, 
+                websocket
+            )
+    
+    elif message.get("type") == "clear":
+        # Очистка холста
+        async with overload.deferred_writer.clearing(room_id):
+            await db.clear_room_drawings(room_id)
+        room_snapshots.invalidate(room_id)
+        await manager.broadcast_to_room(room_id, {
+            "type": "clear",
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    elif message.get("type") == "template":
+        # Добавление шаблона
+        template_data = message.get("data")
+        template = await db.save_template(room_id, template_data)
+        room_snapshots.invalidate(room_id)
+        # Рассылается только адрес шаблона: тело клиент загружает один раз (GET /api/templates/{hash})
+        await manager.broadcast_to_room(room_id, {
+            "type": "template",
+            "hash": template["hash"],
+            "name": template["name"],
+            "timestamp": datetime.now().isoformat()
+        })
+
 @app.websocket("/ws/{room_id}")
 async def websocket_endpoint_manager(websocket: WebSocket, room_id: str):
     """WebSocket endpoint для синхронизации рисования - использует ConnectionManager"""
-    await manager.connect(websocket, room_id)
+    if not await manager.connect(websocket, room_id, batching=websocket.query_params.get("batch") == "1",
+                                 heartbeat=websocket.query_params.get("heartbeat") == "1",
+                                 token=websocket.query_params.get("token")):
+        return
+    connection_id = manager.connection_info[websocket]["connection_id"]
+    capture.record_open(connection_id, capture.ENDPOINT_WS, room_id)
+    limiter = rate_limit.InboundLimiter(
+        room_id, "ws",
+        process=lambda message: handle_message(websocket, room_id, message),
+        notify=lambda control: manager.send_personal_message(control, websocket),
+    )
     try:
         while True:
             # Получаем данные от клиента
             data = await websocket.receive_text()
-            message = json.loads(data)
-            
-            # Обрабатываем команду рисования
-            if message.get("type") == "drawing_event":
-                # Поддержка нового формата с географическими координатами
-                event_data = message.get("data", {})
-                action_type = message.get("action", "unknown") or event_data.get("action", "unknown") or event_data.get("event_type", "unknown")
-                
-                print(f"📝 Получено сообщение рисования: {action_type}")
-                print(f"📊 Данные: {event_data}")
-                
-                # Проверяем наличие географических координат
-                lat = event_data.get("lat")
-                lon = event_data.get("lon")
-                
-                if lat is not None and lon is not None:
-                    # Создаем команду рисования
-                    drawing_command = DrawingCommand(
-                        x=float(lat),  # Используем lat как x
-                        y=float(lon),  # Используем lon как y
-                        action=action_type,
-                        color=event_data.get("color", "#000000"),
-                        size=event_data.get("size", 5) or event_data.get("brush_size", 5),
-                        tool=event_data.get("tool", action_type.split("_")[0] if "_" in action_type else "brush"),
-                        timestamp=datetime.now().isoformat()
-                    )
-                    
-                    # Сохраняем в базу данных
-                    await db.save_drawing_command(room_id, drawing_command)
-                    
-                    # Транслируем всем клиентам в комнате (передаем полное сообщение)
-                    broadcast_message = {
-                        "type": "drawing_event",
-                        "action": action_type,
-                        "data": event_data,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    
-                    print(f"📡 Транслируем сообщение: {broadcast_message}")
-                    
-                    await manager.broadcast_to_room(room_id, broadcast_message, exclude=websocket)
-                else:
-                    print(f"⚠️ Пропущено сообщение без координат: {event_data}")
-                    await manager.send_personal_message(
-                        {"type": "error", "message": "Відсутні координати для малювання"}, 
-                        websocket
-                    )
-            
-            # Обработка стандартизированных событий рисования через JSON
-            elif message.get("type") == "drawing":
-                try:
-                    data = message.get("data", {})
-                    action_type = message.get("action_type", "unknown")
-                    
-                    # Создаем команду рисования
-                    drawing_command = DrawingCommand(
-                        x=data.get("lat", 0),  # Используем lat как x
-                        y=data.get("lon", 0),  # Используем lon как y
-                        action=action_type,
-                        color=data.get("color", "#000000"),
-                        size=data.get("size", 5),
-                        tool=data.get("tool", action_type.split("_")[0] if "_" in action_type else "brush"),
-                        timestamp=datetime.now().isoformat()
-                    )
-                    
-                    # Сохраняем в базу данных
-                    await db.save_drawing_command(room_id, drawing_command)
-                    
-                    # Транслируем всем клиентам в комнате
-                    await manager.broadcast_to_room(room_id, message, exclude=websocket)
-                    
-                except Exception as e:
-                    print(f"❌ Ошибка обработки события рисования: {e}")
-                    await manager.send_personal_message(
-                        {"type": "error", "message": f"Ошибка обработки события: {str(e)}"}, 
-                        websocket
-                    )
-            
-            elif message.get("type") == "clear":
-                # Очистка холста
-                await db.clear_room_drawings(room_id)
-                await manager.broadcast_to_room(room_id, {
-                    "type": "clear",
-                    "timestamp": datetime.now().isoformat()
-                })
-            
-            elif message.get("type") == "template":
-                # Добавление шаблона
-                template_data = message.get("data")
-                await db.save_template(room_id, template_data)
-                await manager.broadcast_to_room(room_id, {
-                    "type": "template",
-                    "data": template_data,
-                    "timestamp": datetime.now().isoformat()
-                })
-                
+            capture.record_message(connection_id, capture.ENDPOINT_WS, room_id, data)
+            with tracing.trace("ws.message", room=room_id) as trace:
+                with tracing.span("parse", size=len(data)):
+                    message = json.loads(data)
+                trace.set("type", message.get("type"))
+                if manager.record_inbound(websocket, message):
+                    continue
+                set_activity(f"WS /ws/{room_id}: {message.get('type')}")
+                metrics.messages_in.inc(room_id, message.get("type", "unknown"), "ws")
+                room_directory.activity(room_id)
+                await limiter.submit(message)
     except WebSocketDisconnect:
         await manager.disconnect(websocket, room_id)
     except Exception as e:
-        print(f"Ошибка WebSocket: {e}")
+        log.error("Ошибка WebSocket: %s", e)
         await manager.disconnect(websocket, room_id)
+    finally:
+        limiter.close()
+        capture.record_close(connection_id, capture.ENDPOINT_WS, room_id)
 
 @app.websocket("/ws/old/{room}")
 async def websocket_endpoint_legacy(websocket: WebSocket, room: str):
@@ -194,15 +303,25 @@ async def websocket_endpoint_legacy(websocket: WebSocket, room: str):
     await handle_websocket_connection(websocket, room)
 
 @app.get("/api/rooms")
-async def get_rooms():
-    """Отримання списку доступних кімнат"""
-    rooms_info = []
-    for room in UKRAINE_REGIONS:
-        rooms_info.append({
-            "name": room,
-            "users_count": len(active_rooms[room])
-        })
-    return {"rooms": rooms_info}
+async def get_rooms(request: Request):
+    """Отримання списку доступних кімнат (з ETag: незмінений список - 304)"""
+    def build():
+        return {"rooms": [
+            {"name": room, "users_count": room_directory.users(room, "ws_legacy")}
+            for room in UKRAINE_REGIONS
+        ]}
+    return room_directory.respond(request, "regions", build)
+
+@app.get("/api/lobby")
+async def get_lobby(request: Request):
+    """Каталог кімнат обох endpoints: користувачі, остання активність, кількість повідомлень"""
+    return room_directory.respond(request, "lobby", room_directory.snapshot)
+
+@app.get("/api/lobby/stream")
+async def stream_lobby():
+    """Каталог кімнат у реальному часі (SSE): подія snapshot, далі delta зі зміненими кімнатами"""
+    return StreamingResponse(room_directory.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/api/rooms/{room}/status")
 async def get_room_status(room: str):
@@ -212,8 +331,9 @@ async def get_room_status(room: str):
     
     return {
         "room": room,
-        "users_count": len(active_rooms[room]),
-        "is_active": len(active_rooms[room]) > 0
+        "users_count": legacy_manager.room_size(room),
+        "is_active": legacy_manager.room_size(room) > 0,
+        "stats": await db.get_room_stats(room)
     }
 
 if __name__ == "__main__":
@@ -222,5 +342,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="info"
+        log_level="info",
+        ws_ping_interval=config.WS_PING_INTERVAL,
+        ws_ping_timeout=config.WS_PING_TIMEOUT
     )
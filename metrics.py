@@ -0,0 +1,286 @@
+"""
+Метрики сервера у текстовому форматі Prometheus (без зовнішніх залежностей)
+"""
+import functools
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import config
+import tracing
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Значення мітки для наборів, що не вмістилися в ліміт кардинальності
+OVERFLOW_LABEL = "_other"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Базова метрика з набором міток"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_label_sets = config.METRICS_MAX_LABEL_SETS
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Tuple[str, ...]) -> Tuple[str, ...]:
+        # Обмежуємо кардинальність: кімнати створюються клієнтами довільно
+        if labels in self._values or len(self._values) < self.max_label_sets:
+            return labels
+        return (OVERFLOW_LABEL,) * len(self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in list(self._values.items())
+        ]
+
+
+class Counter(Metric):
+    """Лічильник, що тільки зростає"""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+
+class Gauge(Metric):
+    """Поточне значення; може обчислюватися функцією під час збору"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value: float, *labels: str):
+        self._values[self._key(labels)] = value
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels: str) -> float:
+        if self.function is not None and not labels:
+            return self.function()
+        return self._values.get(labels, 0.0)
+
+    def _samples(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {_format_value(self.function())}"]
+        return super()._samples()
+
+
+class Histogram(Metric):
+    """Гістограма розподілу значень (затримки в секундах)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [лічильники по кошиках..., сума, кількість]
+            state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[index] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, state in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {state[-1]}")
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{plain} {state[-1]}")
+        return lines
+
+    def time(self, *labels: str):
+        """Контекстний менеджер для вимірювання тривалості блоку"""
+        return _Timer(self, labels)
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Registry:
+    """Реєстр метрик процесу"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (),
+          function: Optional[Callable[[], float]] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, function))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Метрики процесу
+_PROCESS_START = time.time()
+
+
+def _resident_memory_bytes() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        if resource is None:
+            return 0.0
+        # Не Linux: максимальний RSS (у кілобайтах)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+gauge("process_cpu_seconds_total", "Total user and system CPU time in seconds", function=time.process_time)
+gauge("process_resident_memory_bytes", "Resident memory size in bytes", function=_resident_memory_bytes)
+gauge("process_start_time_seconds", "Start time of the process since unix epoch", function=lambda: _PROCESS_START)
+
+# Повідомлення та розсилка
+messages_in = counter(
+    "drawing_sync_messages_in_total", "Inbound messages by room, type and source", ("room", "type", "source"))
+messages_out = counter(
+    "drawing_sync_messages_out_total", "Messages delivered to clients by room and type", ("room", "type"))
+fanout_latency = histogram(
+    "drawing_sync_fanout_latency_seconds", "Time to hand one message to every connection send queue in a room",
+    ("room",))
+send_queue_wait = histogram(
+    "drawing_sync_send_queue_wait_seconds", "Time a message waits in a connection send queue before it is written")
+connection_rtt = histogram(
+    "drawing_sync_connection_rtt_seconds", "Application-level ping/pong round-trip time")
+rate_limited = counter(
+    "drawing_sync_rate_limited_total", "Inbound messages over the rate limit by endpoint, scope and policy",
+    ("endpoint", "scope", "policy"))
+messages_dropped = counter(
+    "drawing_sync_messages_dropped_total", "Queued outbound messages dropped before sending by reason", ("reason",))
+connections_dropped = counter(
+    "drawing_sync_connections_dropped_total", "Connections removed by the server", ("reason",))
+connections_refused = counter(
+    "drawing_sync_connections_refused_total", "Connection attempts refused before joining a room", ("reason",))
+send_queue_depth = gauge(
+    "drawing_sync_send_queue_depth", "Outbound messages accepted for fan-out but not yet written")
+
+# База даних
+db_latency = histogram(
+    "drawing_sync_db_query_seconds", "Database call latency by Database method", ("method",))
+
+snapshot_requests = counter(
+    "drawing_sync_snapshot_requests_total", "Room history snapshot requests by kind and result (hit, miss, coalesced, not_modified)",
+    ("kind", "result"))
+
+# Цикл подій
+event_loop_lag = gauge("drawing_sync_event_loop_lag_seconds", "Last measured event loop lag")
+event_loop_lag_histogram = histogram(
+    "drawing_sync_event_loop_lag_distribution_seconds", "Event loop lag distribution")
+event_loop_stalls = counter(
+    "drawing_sync_event_loop_stalls_total", "Callbacks that blocked the event loop longer than the stall threshold")
+event_loop_stall_seconds = histogram(
+    "drawing_sync_event_loop_stall_seconds", "Duration of event loop stalls",
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+
+def timed_db(method):
+    """Декоратор для вимірювання тривалості асинхронного методу Database (метрика + спан)"""
+    name = method.__name__
+    span_name = f"db.{name}"
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with tracing.span(span_name):
+                return await method(*args, **kwargs)
+        finally:
+            db_latency.observe(time.perf_counter() - start, name)
+
+    return wrapper
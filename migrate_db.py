@@ -1,7 +1,7 @@
 import sqlite3
 import asyncio
 import os
-from database import init_db
+from database import init_db, rebuild_room_stats
 
 async def main():
     """Запуск міграції бази даних"""
@@ -78,6 +78,9 @@ async def main():
             
             conn_new.close()
             conn_old.close()
+            
+            # Лічильники кімнат перераховуються за перенесеними даними
+            await rebuild_room_stats()
             print("✅ Міграція даних завершена")
             
         except Exception as e:
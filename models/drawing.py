@@ -21,6 +21,18 @@ class Room(BaseModel):
     is_private: bool = False
     password: Optional[str] = None
 
+class RoomSettings(BaseModel):
+    """Настройки комнаты, изменяемые через API"""
+    name: Optional[str] = None  # None - не менять
+    max_users: Optional[int] = None  # 0 - без ограничения; None - не менять
+    is_private: Optional[bool] = None  # None - не менять
+    password: Optional[str] = None  # Новый пароль (хранится bcrypt-хеш); None - не менять
+    current_password: Optional[str] = None  # Для изменения приватной комнаты без токена сессии
+
+class RoomAuth(BaseModel):
+    """Вход в приватную комнату"""
+    password: str
+
 class Template(BaseModel):
     """Шаблон для рисования"""
     id: Optional[str] = None
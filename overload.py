@@ -0,0 +1,191 @@
+"""
+Контролер перевантаження: ступінчаста деградація за затримкою циклу подій і глибиною черг відправки
+
+Рівні (кожен включає попередні):
+    0 normal            - звичайна робота
+    1 coalesce          - мінімальне вікно об'єднання пакетів для клієнтів з ?batch=1
+    2 thin              - розсилається лише кожна N-та проміжна точка штриха (кінцеві точки зберігаються)
+    3 defer_persistence - команди рисування записуються в БД пакетами у фоні
+    4 shed              - нові підключення відхиляються з підказкою, коли повторити
+Підвищення - на один рівень за перевірку, щойно тиск перевищує поріг рівня; зниження - після
+OVERLOAD_RECOVERY_TIME секунд тиску нижче порогу поточного рівня x OVERLOAD_RECOVERY_RATIO.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import config
+from logger import get_logger
+from loop_watchdog import watchdog
+from metrics import counter, gauge, send_queue_depth
+from models.drawing import DrawingCommand
+from snapshots import room_snapshots
+
+log = get_logger("overload")
+
+deferred_dropped = counter(
+    "drawing_sync_deferred_dropped_total", "Deferred drawing commands dropped after failed batch writes")
+
+MODES = ("normal", "coalesce", "thin", "defer_persistence", "shed")
+NORMAL, COALESCE, THIN, DEFER_PERSISTENCE, SHED = range(len(MODES))
+
+
+def retry_hint(base: float) -> float:
+    """Затримка повторного підключення з випадковим розкидом, щоб клієнти не поверталися разом"""
+    return round(base * random.uniform(1.0, 1.0 + config.RETRY_JITTER), 1)
+
+
+class OverloadController:
+    """Вибір режиму роботи за показниками навантаження"""
+
+    def __init__(self):
+        self.level = NORMAL
+        self.since = datetime.now().isoformat()
+        self.lag = 0.0
+        self.queue_depth = 0.0
+        self.transitions = deque(maxlen=50)
+        self._calm_since: Optional[float] = None
+
+    @property
+    def mode(self) -> str:
+        return MODES[self.level]
+
+    @property
+    def coalesce_window(self) -> float:
+        return config.OVERLOAD_COALESCE_WINDOW if self.level >= COALESCE else 0.0
+
+    @property
+    def thinning(self) -> bool:
+        return self.level >= THIN
+
+    @property
+    def defer_persistence(self) -> bool:
+        return self.level >= DEFER_PERSISTENCE
+
+    @property
+    def shedding(self) -> bool:
+        return self.level >= SHED
+
+    def pressure_level(self, lag: float, depth: float, ratio: float = 1.0) -> int:
+        """Найвищий рівень, поріг якого (x ratio) перевищено"""
+        level = NORMAL
+        for index, (lag_threshold, depth_threshold) in enumerate(
+                zip(config.OVERLOAD_LAG_THRESHOLDS, config.OVERLOAD_QUEUE_THRESHOLDS), start=1):
+            if lag >= lag_threshold * ratio or depth >= depth_threshold * ratio:
+                level = index
+        return level
+
+    def evaluate(self, lag: float, depth: float, now: float = None):
+        """Одна перевірка: підвищення або (після періоду спокою) зниження рівня"""
+        now = time.monotonic() if now is None else now
+        self.lag, self.queue_depth = lag, depth
+        if self.pressure_level(lag, depth) > self.level:
+            self._calm_since = None
+            self._set_level(self.level + 1)
+            return
+        if self.level > NORMAL and self.pressure_level(lag, depth, config.OVERLOAD_RECOVERY_RATIO) < self.level:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= config.OVERLOAD_RECOVERY_TIME:
+                self._calm_since = now
+                self._set_level(self.level - 1)
+        else:
+            self._calm_since = None
+
+    def _set_level(self, level: int):
+        previous = self.mode
+        self.level = level
+        self.since = datetime.now().isoformat()
+        self.transitions.append({"at": self.since, "from": previous, "to": self.mode,
+                                 "lag": round(self.lag, 4), "queue_depth": self.queue_depth})
+        report = log.warning if level > MODES.index(previous) else log.info
+        report("⚖️ Режим перевантаження: %s -> %s (затримка циклу %.3f с, черги %d)",
+               previous, self.mode, self.lag, self.queue_depth)
+
+    async def run(self, interval: float = None):
+        """Фонова задача перевірки навантаження"""
+        interval = interval or config.OVERLOAD_CHECK_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            self.evaluate(watchdog.last_lag, send_queue_depth.value())
+
+    def status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "level": self.level,
+            "since": self.since,
+            "event_loop_lag": round(self.lag, 4),
+            "send_queue_depth": self.queue_depth,
+            "transitions": list(self.transitions)[-10:],
+        }
+
+
+class DeferredWriter:
+    """Пакетний фоновий запис команд рисування (режим defer_persistence)"""
+
+    def __init__(self):
+        self.pending: List[Tuple[str, DrawingCommand]] = []
+        self.failures = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Запис пачки і очищення кімнати не перетинаються
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def add(self, room_id: str, command: DrawingCommand):
+        self.pending.append((room_id, command))
+
+    @asynccontextmanager
+    async def clearing(self, room_id: str):
+        """Очищення кімнати: її ще не записані команди відкидаються, а пачка, що вже записується,
+        встигає записатися до очищення в БД (інакше стерті штрихи повернулися б)"""
+        async with self.lock:
+            if self.pending:
+                self.pending = [(room, command) for room, command in self.pending if room != room_id]
+            yield
+
+    async def flush(self, db):
+        async with self.lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, []
+            try:
+                await db.save_drawing_commands(batch)
+            except Exception as e:
+                self.failures += 1
+                if self.failures < config.OVERLOAD_FLUSH_RETRIES:
+                    # Пачка повертається в чергу перед новішими командами і записується наступного разу
+                    log.error("❌ Помилка пакетного запису %d команд (спроба %d): %s", len(batch), self.failures, e)
+                    self.pending = batch + self.pending
+                else:
+                    log.error("❌ Пакет з %d команд відкинуто після %d спроб: %s", len(batch), self.failures, e)
+                    deferred_dropped.inc(amount=len(batch))
+                    self.failures = 0
+                return
+            self.failures = 0
+        for room_id in {room for room, _ in batch}:
+            room_snapshots.invalidate(room_id)
+
+    async def run(self, db, interval: float = None):
+        """Фонова задача: запис накопичених команд; при завершенні - дописування залишку"""
+        interval = interval or config.OVERLOAD_FLUSH_INTERVAL
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush(db)
+        finally:
+            await self.flush(db)
+
+
+controller = OverloadController()
+deferred_writer = DeferredWriter()
+
+gauge("drawing_sync_overload_level", "Current overload degradation level (0 - normal, 4 - shedding joins)",
+      function=lambda: controller.level)
@@ -0,0 +1,224 @@
+"""
+Обмеження частоти вхідних повідомлень (token bucket)
+
+Кожне з'єднання WebSocket має власне відро, кожна кімната - спільне для обох WebSocket endpoints
+і POST /api/events, REST-клієнти обмежуються за IP. Надлишок обробляється згідно з
+config.RATE_LIMIT_POLICY:
+    "coalesce" - проміжні оновлення позиції (update, update_point, move, draw) замінюються
+                 останнім і обробляються, коли з'являться токени; решта затримується
+    "delay"    - обробка затримується до появи токенів (не довше RATE_LIMIT_MAX_DELAY)
+    "reject"   - повідомлення відкидається
+Клієнт отримує керуючий кадр {"type": "slow_down", "retry_after": секунди, "scope": ..., "policy": ...}
+(не частіше ніж раз на RATE_LIMIT_NOTIFY_INTERVAL), REST - відповідь 429 з Retry-After.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+import config
+from logger import get_logger
+from metrics import rate_limited
+
+log = get_logger("ratelimit")
+
+# Дії, для яких важливе лише останнє значення
+COALESCIBLE_ACTIONS = {"update", "update_point", "move", "draw"}
+
+# Скільки відер кімнат/клієнтів тримати, перш ніж прибрати повні (неактивні)
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Відро токенів: rate токенів за секунду, не більше capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float, amount: float = 1.0) -> float:
+        """Скільки чекати до появи amount токенів (0 - вже є)"""
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float = 1.0):
+        """Списання токенів (може піти в мінус - борг віддається наступними запитами)"""
+        self.tokens -= amount
+
+
+def _bucket_for(buckets: Dict[str, TokenBucket], key: str, rate: float, capacity: float) -> TokenBucket:
+    bucket = buckets.get(key)
+    if bucket is None:
+        if len(buckets) >= MAX_BUCKETS:
+            now = time.monotonic()
+            for stale in [k for k, b in buckets.items() if b.wait_time(now, b.capacity) == 0]:
+                del buckets[stale]
+        bucket = buckets[key] = TokenBucket(rate, capacity)
+    return bucket
+
+
+_room_buckets: Dict[str, TokenBucket] = {}
+_client_buckets: Dict[str, TokenBucket] = {}
+
+
+def room_bucket(room_id: str) -> TokenBucket:
+    return _bucket_for(_room_buckets, room_id, config.RATE_LIMIT_ROOM_RATE, config.RATE_LIMIT_ROOM_BURST)
+
+
+def acquire(*buckets: Tuple[str, TokenBucket]) -> Tuple[float, Optional[str]]:
+    """Спроба взяти по токену з кожного відра: (0, None) або (очікування, назва обмеження)"""
+    now = time.monotonic()
+    wait, scope = 0.0, None
+    for name, bucket in buckets:
+        bucket_wait = bucket.wait_time(now)
+        if bucket_wait > wait:
+            wait, scope = bucket_wait, name
+    if wait == 0.0:
+        for _, bucket in buckets:
+            bucket.take()
+    return wait, scope
+
+
+def check_rest(room_id: str, client: str) -> Tuple[float, Optional[str]]:
+    """Перевірка REST-запиту: (0, None) - дозволено, інакше (Retry-After, назва обмеження)"""
+    if not config.RATE_LIMIT_ENABLED:
+        return 0.0, None
+    client_bucket = _bucket_for(_client_buckets, client, config.RATE_LIMIT_CLIENT_RATE, config.RATE_LIMIT_CLIENT_BURST)
+    wait, scope = acquire(("client", client_bucket), ("room", room_bucket(room_id)))
+    if wait:
+        rate_limited.inc("rest", scope, "reject")
+    return wait, scope
+
+
+def enforce_rest(room_id: str, request: Request):
+    """check_rest для обробника REST: перевищення ліміту - HTTP 429 з Retry-After"""
+    retry_after, scope = check_rest(room_id, request.client.host if request.client else "unknown")
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail=slow_down_message(retry_after, scope, "reject"),
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def slow_down_message(retry_after: float, scope: str, policy: str) -> dict:
+    return {"type": "slow_down", "retry_after": round(retry_after, 3), "scope": scope, "policy": policy}
+
+
+def _coalesce_key(message: dict) -> Optional[tuple]:
+    """Ключ оновлення, яке можна замінити новішим; None - повідомлення не об'єднується"""
+    action = message.get("action") or message.get("action_type")
+    if action not in COALESCIBLE_ACTIONS:
+        return None
+    data = message.get("data")
+    target = message.get("event_id") or (data.get("event_id") or data.get("id") if isinstance(data, dict) else None)
+    return message.get("type"), action, target
+
+
+class InboundLimiter:
+    """Обмеження вхідних повідомлень одного WebSocket-з'єднання
+
+    process - обробник повідомлення, notify - відправка керуючого кадру клієнту.
+    """
+
+    def __init__(self, room_id: str, endpoint: str, process: Callable[[dict], Awaitable],
+                 notify: Callable[[dict], Awaitable], policy: str = None):
+        self.room_id = room_id
+        self.endpoint = endpoint
+        self.process = process
+        self.notify = notify
+        self.policy = policy or config.RATE_LIMIT_POLICY
+        self.bucket = TokenBucket(config.RATE_LIMIT_CONNECTION_RATE, config.RATE_LIMIT_CONNECTION_BURST)
+        self.room_bucket = room_bucket(room_id)
+        # Відкладені оновлення (останнє для кожного ключа) та таймер їх обробки
+        self.pending: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+        self._last_notice = 0.0
+
+    async def submit(self, message: dict):
+        """Обробка повідомлення з урахуванням лімітів"""
+        if not config.RATE_LIMIT_ENABLED:
+            await self.process(message)
+            return
+        wait, scope = acquire(("connection", self.bucket), ("room", self.room_bucket))
+        if wait == 0.0:
+            async with self._lock:
+                # Відкладені оновлення старші за поточне повідомлення - обробляються першими
+                await self._flush_pending()
+                await self.process(message)
+            return
+
+        policy = self.policy
+        key = _coalesce_key(message) if policy == "coalesce" else None
+        if policy == "coalesce" and key is None:
+            policy = "delay"
+        if policy == "delay" and wait > config.RATE_LIMIT_MAX_DELAY:
+            policy = "reject"
+        rate_limited.inc(self.endpoint, scope, policy)
+        await self._notice(wait, scope, policy)
+
+        if policy == "coalesce":
+            self.pending.pop(key, None)
+            self.pending[key] = message
+            if self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(wait, self._schedule_flush)
+        elif policy == "delay":
+            # Читання з сокета зупиняється - клієнт отримує зворотний тиск через TCP
+            await asyncio.sleep(wait)
+            async with self._lock:
+                await self._flush_pending()
+                self._take()
+                await self.process(message)
+
+    def _take(self):
+        self.bucket.take()
+        self.room_bucket.take()
+
+    async def _notice(self, wait: float, scope: str, policy: str):
+        now = time.monotonic()
+        if now - self._last_notice < config.RATE_LIMIT_NOTIFY_INTERVAL:
+            return
+        self._last_notice = now
+        log.info("🚦 Обмеження частоти (%s, %s, кімната %s): %s", scope, policy, self.room_id, self.endpoint)
+        await self.notify(slow_down_message(wait, scope, policy))
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        asyncio.ensure_future(self._flush())
+
+    async def _flush(self):
+        try:
+            async with self._lock:
+                await self._flush_pending()
+        except Exception as e:
+            log.error("❌ Помилка обробки відкладеного повідомлення (кімната %s): %s", self.room_id, e)
+
+    async def _flush_pending(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self.pending:
+            _, message = self.pending.popitem(last=False)
+            self._take()
+            await self.process(message)
+
+    def close(self):
+        """Скасування відкладених оновлень при відключенні"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self.pending.clear()
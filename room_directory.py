@@ -0,0 +1,184 @@
+"""
+Каталог кімнат для лобі
+
+Один каталог для обох WebSocket endpoints (/ws/{room_id} і /ws/old/{room}): кількість користувачів,
+час останньої активності та кількість повідомлень оновлюються інкрементно при підключенні, відключенні
+й вхідних повідомленнях, без перебору з'єднань. Кожна зміна збільшує revision - з неї будується ETag
+(GET /api/lobby, /api/rooms), а закодована відповідь кешується до наступної зміни.
+Підписники GET /api/lobby/stream (SSE) отримують знімок, а далі - лише змінені кімнати, об'єднані
+за ROOM_DIRECTORY_PUSH_INTERVAL (активна кімната не породжує подію на кожне повідомлення).
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from fastapi import Request
+from fastapi.responses import Response
+
+import config
+from snapshots import encode, etag_matches
+
+
+class LobbySubscriber:
+    """Черга змін одного підписника; переповнення - замість змін буде надіслано повний знімок"""
+
+    def __init__(self):
+        self.deltas: List[dict] = []
+        self.resync = False
+        self.wakeup = asyncio.Event()
+
+    def push(self, delta: dict):
+        if not self.resync:
+            if len(self.deltas) >= config.ROOM_DIRECTORY_SUBSCRIBER_QUEUE:
+                self.deltas.clear()
+                self.resync = True
+            else:
+                self.deltas.append(delta)
+        self.wakeup.set()
+
+
+class RoomDirectory:
+    """Стан кімнат обох менеджерів з'єднань"""
+
+    def __init__(self):
+        self.rooms: Dict[str, dict] = {}
+        self.revision = 0
+        # Позначка запуску: ETag попереднього процесу з тим самим revision не збігається
+        self.boot = format(int(time.time()), "x")
+        self.dirty: Set[str] = set()
+        self.subscribers: Set[LobbySubscriber] = set()
+        self._bodies: Dict[str, tuple] = {}
+
+    def _entry(self, room_id: str) -> dict:
+        entry = self.rooms.get(room_id)
+        if entry is None:
+            entry = self.rooms[room_id] = {"users": {}, "last_activity": None, "events_count": 0}
+        return entry
+
+    def _changed(self, room_id: str):
+        self.revision += 1
+        self.dirty.add(room_id)
+
+    def joined(self, room_id: str, endpoint: str):
+        users = self._entry(room_id)["users"]
+        users[endpoint] = users.get(endpoint, 0) + 1
+        self._changed(room_id)
+
+    def left(self, room_id: str, endpoint: str):
+        entry = self.rooms.get(room_id)
+        if entry is None or not entry["users"].get(endpoint):
+            return
+        entry["users"][endpoint] -= 1
+        self._changed(room_id)
+
+    def activity(self, room_id: str):
+        """Вхідне повідомлення кімнати (WebSocket або REST)"""
+        entry = self._entry(room_id)
+        entry["events_count"] += 1
+        entry["last_activity"] = time.time()
+        self._changed(room_id)
+
+    def users(self, room_id: str, endpoint: str = None) -> int:
+        entry = self.rooms.get(room_id)
+        if entry is None:
+            return 0
+        if endpoint is not None:
+            return entry["users"].get(endpoint, 0)
+        return sum(entry["users"].values())
+
+    def describe(self, room_id: str) -> dict:
+        entry = self.rooms[room_id]
+        return {
+            "room_id": room_id,
+            "users_count": sum(entry["users"].values()),
+            "connections": dict(entry["users"]),
+            "last_activity": (datetime.fromtimestamp(entry["last_activity"]).isoformat()
+                              if entry["last_activity"] else None),
+            "events_count": entry["events_count"],
+        }
+
+    def snapshot(self) -> dict:
+        return {"revision": self.revision, "rooms": [self.describe(room_id) for room_id in self.rooms]}
+
+    @property
+    def etag(self) -> str:
+        return f'W/"rooms-{self.boot}-{self.revision}"'
+
+    def respond(self, request: Request, name: str, build: Callable[[], dict]) -> Response:
+        """Відповідь з ETag: 304 для актуальної копії клієнта, інакше тіло, закодоване раз на revision"""
+        etag = self.etag
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        cached = self._bodies.get(name)
+        if cached is None or cached[0] != self.revision:
+            cached = self._bodies[name] = (self.revision, encode(build()))
+        return Response(content=cached[1], media_type="application/json", headers=headers)
+
+    def subscribe(self) -> LobbySubscriber:
+        subscriber = LobbySubscriber()
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: LobbySubscriber):
+        self.subscribers.discard(subscriber)
+
+    def flush(self, now: float = None):
+        """Розсилка накопичених змін підписникам і видалення давно порожніх кімнат"""
+        now = time.time() if now is None else now
+        removed = [
+            room_id for room_id, entry in self.rooms.items()
+            if not any(entry["users"].values())
+            and now - (entry["last_activity"] or 0) > config.ROOM_DIRECTORY_IDLE_TTL
+        ]
+        for room_id in removed:
+            del self.rooms[room_id]
+        if removed:
+            self.revision += 1
+        if not self.dirty and not removed:
+            return
+        changed = [self.describe(room_id) for room_id in self.dirty if room_id in self.rooms]
+        self.dirty.clear()
+        if not self.subscribers:
+            return
+        delta = {"revision": self.revision, "rooms": changed, "removed": removed}
+        for subscriber in self.subscribers:
+            subscriber.push(delta)
+
+    async def run(self, interval: float = None):
+        """Фонова задача розсилки змін"""
+        interval = interval or config.ROOM_DIRECTORY_PUSH_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+    async def stream(self):
+        """Події SSE для одного підписника: snapshot, далі delta (коментар-keepalive під час тиші)"""
+        subscriber = self.subscribe()
+        try:
+            yield sse_event("snapshot", self.snapshot())
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), config.ROOM_DIRECTORY_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                subscriber.wakeup.clear()
+                if subscriber.resync:
+                    subscriber.resync = False
+                    yield sse_event("snapshot", self.snapshot())
+                    continue
+                deltas, subscriber.deltas = subscriber.deltas, []
+                for delta in deltas:
+                    yield sse_event("delta", delta)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def sse_event(event: str, data: dict, event_id: Optional[str] = None) -> bytes:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\n".encode("utf-8") + b"data: " + encode(data) + b"\n\n"
+
+
+room_directory = RoomDirectory()
@@ -0,0 +1,207 @@
+"""
+Потік подій кімнати для переглядачів (SSE)
+
+Табло та екрани, що лише показують кімнату, підключаються як GET /api/rooms/{room_id}/stream замість
+двобічного WebSocket. Повідомлення надходять з тієї ж розсилки ConnectionManager (після проріджування
+в режимі перевантаження) і кодуються один раз на кімнату: кожен переглядач отримує той самий кадр.
+Кожне повідомлення кімнати має номер; id події SSE - "{потік}-{номер}", тож після розриву клієнт
+продовжує з Last-Event-ID: останні ROOM_STREAM_REPLAY повідомлень досилаються з пам'яті, а якщо пропущено
+більше (або сервер перезапускався) - надсилається подія resync (клієнт перечитує /drawings).
+З ?interval=N повідомлення за N секунд надсилаються одним кадром {"type": "batch", ...}.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import config
+import overload
+from metrics import gauge, messages_out
+
+# Пакет повідомлень - той самий формат, що й для WebSocket-клієнтів з ?batch=1 (websocket_handler.BATCH_*)
+BATCH_PREFIX = '{"type": "batch", "messages": ['
+BATCH_SUFFIX = ']}'
+
+# Елемент потоку: (номер у кімнаті, OutboundMessage з websocket_handler)
+StreamItem = Tuple[int, object]
+
+# Позначка запуску та лічильник потоків: номер з попереднього процесу або видаленого потоку
+# не приймається за номер поточного
+_BOOT = format(int(time.time()), "x")
+_feed_ids = itertools.count(1)
+
+
+class StreamViewer:
+    """Черга одного переглядача"""
+
+    def __init__(self, interval: float = 0.0):
+        self.interval = interval
+        self.items: Deque[StreamItem] = deque()
+        self.resync = False
+        self.wakeup = asyncio.Event()
+
+    def push(self, item: StreamItem):
+        if not self.resync:
+            if len(self.items) >= config.ROOM_STREAM_QUEUE:
+                # Переглядач не встигає - замість черги він отримає resync
+                self.items.clear()
+                self.resync = True
+            else:
+                self.items.append(item)
+        self.wakeup.set()
+
+    def take(self) -> List[StreamItem]:
+        items = list(self.items)
+        self.items.clear()
+        self.wakeup.clear()
+        return items
+
+
+class RoomFeed:
+    """Нумерація та недавня історія повідомлень однієї кімнати"""
+
+    def __init__(self):
+        self.origin = f"{_BOOT}.{next(_feed_ids)}"
+        self.sequence = 0
+        self.history: Deque[StreamItem] = deque(maxlen=config.ROOM_STREAM_REPLAY)
+        self.viewers: Set[StreamViewer] = set()
+        self.idle_since = time.time()
+
+    def event_id(self, sequence: int) -> str:
+        return f"{self.origin}-{sequence}"
+
+    def since(self, event_id: Optional[str]) -> Optional[List[StreamItem]]:
+        """Повідомлення після Last-Event-ID; None - id іншого потоку або частина вже вийшла з історії"""
+        origin, _, sequence = (event_id or "").strip().rpartition("-")
+        if origin != self.origin or not sequence.isdigit() or int(sequence) > self.sequence:
+            return None
+        sequence = int(sequence)
+        if sequence == self.sequence:
+            return []
+        if not self.history or self.history[0][0] > sequence + 1:
+            return None
+        return [item for item in self.history if item[0] > sequence]
+
+
+class RoomStreams:
+    """Потоки кімнат; кімната без переглядачів не нумерується і нічого не зберігає"""
+
+    def __init__(self):
+        self.feeds: Dict[str, RoomFeed] = {}
+
+    @property
+    def viewers_count(self) -> int:
+        return sum(len(feed.viewers) for feed in self.feeds.values())
+
+    def publish(self, room_id: str, message):
+        """Повідомлення розсилки кімнати (OutboundMessage, вже закодоване)"""
+        feed = self.feeds.get(room_id)
+        if feed is None:
+            return
+        feed.sequence += 1
+        item = (feed.sequence, message)
+        feed.history.append(item)
+        for viewer in feed.viewers:
+            viewer.push(item)
+
+    def subscribe(self, room_id: str, viewer: StreamViewer) -> RoomFeed:
+        feed = self.feeds.get(room_id)
+        if feed is None:
+            feed = self.feeds[room_id] = RoomFeed()
+        feed.viewers.add(viewer)
+        return feed
+
+    def unsubscribe(self, room_id: str, viewer: StreamViewer):
+        feed = self.feeds.get(room_id)
+        if feed is None:
+            return
+        feed.viewers.discard(viewer)
+        if not feed.viewers:
+            feed.idle_since = time.time()
+
+    def prune(self, now: float = None):
+        """Видалення потоків, у яких давно немає переглядачів (їхні id вже не продовжити)"""
+        now = time.time() if now is None else now
+        for room_id in [
+            room_id for room_id, feed in self.feeds.items()
+            if not feed.viewers and now - feed.idle_since > config.ROOM_STREAM_IDLE_TTL
+        ]:
+            del self.feeds[room_id]
+
+    async def run(self, interval: float = None):
+        """Фонова задача очищення"""
+        interval = interval or config.ROOM_STREAM_IDLE_TTL / 2
+        while True:
+            await asyncio.sleep(interval)
+            self.prune()
+
+    def _frames(self, room_id: str, feed: RoomFeed, items: List[StreamItem], coalesce: bool) -> List[bytes]:
+        for _, message in items:
+            messages_out.inc(room_id, message.type)
+        if coalesce and len(items) > 1:
+            # Повідомлення, які скасував пізніший clear/видалення з того ж пакета, не надсилаються
+            kept: List[str] = []
+            cancelling = []
+            for _, message in reversed(items):
+                if any(later.obsoletes(message) for later in cancelling):
+                    continue
+                if message.type in ("clear", "clear_events", "drawing_event_deleted"):
+                    cancelling.append(message)
+                kept.append(message.text)
+            data = BATCH_PREFIX + ",".join(reversed(kept)) + BATCH_SUFFIX
+            return [sse_frame(feed.event_id(items[-1][0]), data)]
+        return [sse_frame(feed.event_id(sequence), message.text) for sequence, message in items]
+
+    async def stream(self, room_id: str, last_event_id: Optional[str] = None, interval: float = 0.0):
+        """Кадри SSE для одного переглядача: досилання після Last-Event-ID, далі живий потік"""
+        viewer = StreamViewer(interval)
+        feed = self.subscribe(room_id, viewer)
+        # Досилання визначається до першого await: усе новіше вже потрапляє в чергу переглядача
+        missed = feed.since(last_event_id)
+        position = feed.event_id(feed.sequence)
+        try:
+            yield f"retry: {int(overload.retry_hint(config.ROOM_STREAM_RETRY) * 1000)}\n\n".encode("utf-8")
+            if not last_event_id:
+                yield control_frame("ready", position)
+            elif missed is None:
+                yield control_frame("resync", position)
+            elif missed:
+                for frame in self._frames(room_id, feed, missed, bool(interval)):
+                    yield frame
+            while True:
+                try:
+                    await asyncio.wait_for(viewer.wakeup.wait(), config.ROOM_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if viewer.interval:
+                    # Кадр не частіше ніж раз на interval
+                    await asyncio.sleep(viewer.interval)
+                if viewer.resync:
+                    viewer.resync = False
+                    viewer.take()
+                    yield control_frame("resync", feed.event_id(feed.sequence))
+                    continue
+                for frame in self._frames(room_id, feed, viewer.take(), bool(viewer.interval)):
+                    yield frame
+        finally:
+            self.unsubscribe(room_id, viewer)
+
+
+def sse_frame(event_id: str, data: str) -> bytes:
+    return f"id: {event_id}\ndata: {data}\n\n".encode("utf-8")
+
+
+def control_frame(event: str, event_id: str) -> bytes:
+    """ready - початок потоку (поточний стан - через REST), resync - пропущені повідомлення недоступні
+    і стан треба перечитати; id в обох - позиція, з якої продовжується потік"""
+    data = json.dumps({"type": event})
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+room_streams = RoomStreams()
+
+gauge("drawing_sync_stream_viewers", "Connected SSE room stream viewers",
+      function=lambda: room_streams.viewers_count)
@@ -0,0 +1,319 @@
+"""
+Перенесення кімнати між серверами: потоковий експорт та імпорт
+
+Формати (обидва стискаються gzip):
+    ndjson      - рядок JSON на запис: заголовок {"type": "room_export", ...}, далі "drawing", "event", "template"
+    geojsonseq  - RFC 8142: кожен запис - Feature (RS + JSON + LF) з записом у properties;
+                  події з lat/lon мають геометрію Point, решта - null
+Експорт читає БД курсором і стискає частинами по EXPORT_CHUNK_SIZE - пам'ять не залежить від розміру
+кімнати. Імпорт приймає будь-який з форматів (стиснутий чи ні) і записує пачками по IMPORT_BATCH_SIZE
+записів, кожна пачка - одна транзакція.
+
+Командний рядок:
+    python room_transfer.py export <room_id> <файл|-> [--format geojsonseq] --server http://localhost:8000
+    python room_transfer.py import <room_id> <файл|-> --server http://localhost:8000 [--token ...]
+З --server дані йдуть через HTTP API запущеного сервера (/export, /import), і він сам оновлює знімки
+та ETag кімнати. Без --server файл БД (--db) змінюється напряму - лише коли сервер зупинено: запущений
+сервер не побачить імпорт у кешованих знімках до перезапуску.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+import config
+from database import Database, init_db
+from models.drawing import DrawingCommand
+from models.drawing_event import DrawingEvent
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "geojsonseq": ("application/geo+json-seq", "geojsons"),
+}
+
+EXPORT_VERSION = 1
+RECORD_SEPARATOR = "\x1e"
+
+DRAWING_FIELDS = ("x", "y", "action", "color", "size", "tool", "timestamp")
+EVENT_FIELDS = ("event_id", "event_name", "drawing_type", "action", "platform")
+
+
+class TransferError(ValueError):
+    """Некоректний рядок імпорту (line - номер рядка)"""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"рядок {line}: {message}")
+        self.line = line
+
+
+def _with_raw(fields: dict, raw: Dict[str, str]) -> str:
+    """JSON об'єкт з полів і вже закодованих JSON-значень (style/data вставляються без повторного розбору)"""
+    head = json.dumps(fields, ensure_ascii=False)
+    return head[:-1] + "".join(f", {json.dumps(key)}: {value}" for key, value in raw.items()) + "}"
+
+
+def _record(kind: str, row: tuple) -> Tuple[str, Optional[dict]]:
+    """Запис експорту: (JSON, геометрія GeoJSON або None)"""
+    if kind == "drawing":
+        return json.dumps({"type": "drawing", **dict(zip(DRAWING_FIELDS, row))}, ensure_ascii=False), None
+    if kind == "event":
+        fields = {"type": "event", **dict(zip(EVENT_FIELDS, row[:5])), "timestamp": row[7]}
+        return _with_raw(fields, {"style": row[5], "data": row[6]}), _geometry(row[6])
+    name, digest, created_at, data = row
+    return _with_raw({"type": "template", "name": name, "hash": digest, "created_at": created_at},
+                     {"data": data}), None
+
+
+def _geometry(data: str) -> Optional[dict]:
+    try:
+        point = json.loads(data)
+    except ValueError:
+        return None
+    if isinstance(point, dict) and isinstance(point.get("lat"), (int, float)) \
+            and isinstance(point.get("lon"), (int, float)):
+        return {"type": "Point", "coordinates": [point["lon"], point["lat"]]}
+    return None
+
+
+def _line(record: str, geometry: Optional[dict], export_format: str) -> str:
+    if export_format == "ndjson":
+        return record + "\n"
+    return (f'{RECORD_SEPARATOR}{{"type": "Feature", "geometry": {json.dumps(geometry)}, '
+            f'"properties": {record}}}\n')
+
+
+async def export_room(db: Database, room_id: str, export_format: str = "ndjson",
+                      progress: Callable[[int], None] = None) -> AsyncIterator[bytes]:
+    """Стиснутий gzip експорт кімнати частинами (progress - кількість записів після кожної частини)"""
+    compressor = zlib.compressobj(config.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    header = json.dumps({"type": "room_export", "version": EXPORT_VERSION, "room_id": room_id,
+                         "exported_at": datetime.now().isoformat()}, ensure_ascii=False)
+    pending = [_line(header, None, export_format)]
+    pending_size = 0
+    records = 0
+    async for kind, row in db.iter_room_records(room_id):
+        line = _line(*_record(kind, row), export_format)
+        pending.append(line)
+        pending_size += len(line)
+        records += 1
+        if pending_size >= config.EXPORT_CHUNK_SIZE:
+            chunk = compressor.compress("".join(pending).encode("utf-8"))
+            pending, pending_size = [], 0
+            if progress is not None:
+                progress(records)
+            if chunk:
+                yield chunk
+    yield compressor.compress("".join(pending).encode("utf-8")) + compressor.flush()
+
+
+class RecordReader:
+    """Розбір потоку імпорту на записи: gzip розпізнається за сигнатурою, Feature GeoJSON - за типом"""
+
+    def __init__(self):
+        self.decompressor = None
+        self.started = False
+        self.buffer = b""
+        self.line = 0
+
+    def feed(self, chunk: bytes) -> Iterator[dict]:
+        if not self.started:
+            self.buffer += chunk
+            if len(self.buffer) < 2:
+                return
+            self.started = True
+            chunk, self.buffer = self.buffer, b""
+            if chunk[:2] == b"\x1f\x8b":
+                self.decompressor = zlib.decompressobj(31)
+        if self.decompressor is not None:
+            chunk = self.decompressor.decompress(chunk)
+        self.buffer += chunk
+        *lines, self.buffer = self.buffer.split(b"\n")
+        if len(self.buffer) > config.IMPORT_MAX_LINE:
+            raise TransferError(self.line + 1, "рядок задовгий")
+        for raw in lines:
+            yield from self._parse(raw)
+
+    def close(self) -> Iterator[dict]:
+        if self.decompressor is not None:
+            self.buffer += self.decompressor.flush()
+            if not self.decompressor.eof:
+                raise TransferError(self.line + 1, "обрізаний gzip")
+        raw, self.buffer = self.buffer, b""
+        yield from self._parse(raw)
+
+    def _parse(self, raw: bytes) -> Iterator[dict]:
+        self.line += 1
+        raw = raw.strip().lstrip(RECORD_SEPARATOR.encode())
+        if not raw:
+            return
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            raise TransferError(self.line, f"некоректний JSON ({e})")
+        if isinstance(record, dict) and record.get("type") == "Feature":
+            record = record.get("properties")
+        if not isinstance(record, dict):
+            raise TransferError(self.line, "очікувався об'єкт JSON")
+        record["_line"] = self.line
+        yield record
+
+
+class RoomImporter:
+    """Накопичення записів у пачки та запис кожної пачки однією транзакцією"""
+
+    def __init__(self, db: Database, room_id: str, batch_size: int = None):
+        self.db = db
+        self.room_id = room_id
+        self.batch_size = batch_size or config.IMPORT_BATCH_SIZE
+        self.drawings: List[DrawingCommand] = []
+        self.events: List[DrawingEvent] = []
+        self.templates: List[Tuple[dict, str]] = []
+        self.imported = {"drawings": 0, "events": 0, "templates": 0, "skipped": 0}
+
+    async def add(self, record: dict):
+        line = record.pop("_line", 0)
+        kind = record.get("type")
+        try:
+            if kind == "drawing":
+                self.drawings.append(DrawingCommand(**record))
+            elif kind == "event":
+                self.events.append(DrawingEvent(**record))
+            elif kind == "template":
+                if not isinstance(record.get("data"), dict):
+                    raise TransferError(line, "шаблон без data")
+                self.templates.append((record["data"], record.get("created_at") or datetime.now().isoformat()))
+            elif kind == "room_export":
+                if record.get("version", EXPORT_VERSION) > EXPORT_VERSION:
+                    raise TransferError(line, f"непідтримувана версія експорту {record['version']}")
+                return
+            else:
+                raise TransferError(line, f"невідомий тип запису {kind!r}")
+        except ValidationError as e:
+            raise TransferError(line, f"некоректний запис {kind}: {e.errors()[0]['msg']}")
+        if len(self.drawings) + len(self.events) + len(self.templates) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if not (self.drawings or self.events or self.templates):
+            return
+        result = await self.db.import_room_batch(self.room_id, self.drawings, self.events, self.templates)
+        for key, value in result.items():
+            self.imported[key] += value
+        self.drawings, self.events, self.templates = [], [], []
+
+
+async def import_room(db: Database, room_id: str, chunks: AsyncIterator[bytes], batch_size: int = None) -> Dict:
+    """Імпорт потоку в кімнату; при помилці вже записані пачки залишаються (TransferError.imported)"""
+    reader = RecordReader()
+    importer = RoomImporter(db, room_id, batch_size)
+    try:
+        async for chunk in chunks:
+            for record in reader.feed(chunk):
+                await importer.add(record)
+        for record in reader.close():
+            await importer.add(record)
+        await importer.flush()
+    except (TransferError, zlib.error) as e:
+        if not isinstance(e, TransferError):
+            e = TransferError(reader.line, f"пошкоджений gzip ({e})")
+        e.imported = importer.imported
+        raise e
+    return importer.imported
+
+
+async def _read_file(stream, size: int = 1 << 16) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, stream.read, size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _http_main(args):
+    """Експорт та імпорт через HTTP API сервера"""
+    url = f"{args.server.rstrip('/')}/api/rooms/{urllib.parse.quote(args.room_id, safe='')}"
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    try:
+        if args.command == "export":
+            # background=false: велика кімната експортується в пулі, а відповідь - сам файл, а не 202
+            request = urllib.request.Request(f"{url}/export?format={args.format}&background=false", headers=headers)
+            output = sys.stdout.buffer if args.file == "-" else open(args.file, "wb")
+            try:
+                with urllib.request.urlopen(request) as response:
+                    shutil.copyfileobj(response, output)
+            finally:
+                if output is not sys.stdout.buffer:
+                    output.close()
+            print(f"✅ Кімнату {args.room_id} експортовано", file=sys.stderr)
+            return
+        source = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+        if source is not sys.stdin.buffer:
+            headers["Content-Length"] = str(os.fstat(source.fileno()).st_size)
+        try:
+            # Без Content-Length (stdin) тіло надсилається частинами (chunked)
+            request = urllib.request.Request(f"{url}/import", data=source, headers=headers, method="POST")
+            with urllib.request.urlopen(request) as response:
+                imported = json.load(response)["imported"]
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+        print(f"✅ Імпортовано в кімнату {args.room_id}: {imported}", file=sys.stderr)
+    except urllib.error.HTTPError as e:
+        print(f"❌ Сервер відповів {e.code}: {e.read().decode('utf-8', 'replace')}", file=sys.stderr)
+        sys.exit(1)
+
+
+async def _main(args):
+    if args.command == "import":
+        print("⚠️ Імпорт напряму в БД: якщо сервер запущено, перезапустіть його (або використовуйте --server)",
+              file=sys.stderr)
+    await init_db(args.db)
+    db = Database(args.db)
+    if args.command == "export":
+        output = sys.stdout.buffer if args.file == "-" else open(args.file, "wb")
+        try:
+            async for chunk in export_room(db, args.room_id, args.format):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        print(f"✅ Кімнату {args.room_id} експортовано", file=sys.stderr)
+    else:
+        source = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+        try:
+            imported = await import_room(db, args.room_id, _read_file(source), args.batch_size)
+        except TransferError as e:
+            print(f"❌ Помилка імпорту ({e}), вже імпортовано: {e.imported}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+        print(f"✅ Імпортовано в кімнату {args.room_id}: {imported}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Експорт та імпорт даних кімнати")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("room_id")
+    parser.add_argument("file", help="файл (.ndjson.gz / .geojsons.gz) або - для stdout/stdin")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson", help="формат експорту")
+    parser.add_argument("--server", help="адреса запущеного сервера (http://host:8000) замість --db")
+    parser.add_argument("--token", help="токен сесії приватної кімнати (з --server)")
+    parser.add_argument("--db", default="drawing_sync.db", help="файл бази даних (сервер має бути зупинено)")
+    parser.add_argument("--batch-size", type=int, default=None, help="записів на транзакцію імпорту")
+    args = parser.parse_args()
+    if args.server:
+        _http_main(args)
+    else:
+        asyncio.run(_main(args))
@@ -0,0 +1,116 @@
+"""
+Знімки історії кімнат для REST (GET /api/rooms/{room_id}/drawings, /templates, /export, GET /api/events/{room_id})
+
+Після перезапуску сервера чи обриву зв'язку сотні клієнтів одночасно запитують історію кімнати.
+Одночасні запити однієї кімнати й версії об'єднуються (single-flight): один запит до БД і один
+закодований буфер JSON на всіх, а готовий буфер віддається далі, доки дані кімнати не зміняться.
+Версія кімнати збільшується після кожної зміни її даних - invalidate() після запису в БД.
+З версії будується ETag: клієнт, що опитує кімнату з If-None-Match, отримує 304 без звернення до БД.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+import config
+from metrics import snapshot_requests
+
+
+def encode(body) -> bytes:
+    """Кодування як у JSONResponse FastAPI - відповідь не відрізняється від звичайної"""
+    return json.dumps(body, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match запиту містить etag (слабке порівняння, список через кому або *)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (candidate[2:] if candidate.startswith("W/") else candidate) == opaque
+        for candidate in (part.strip() for part in header.split(","))
+    )
+
+
+class SnapshotCache:
+    """Закодовані знімки (вид, кімната) -> (версія, буфер) з об'єднанням одночасних побудов"""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or config.SNAPSHOT_CACHE_SIZE
+        self.versions: Dict[str, int] = {}
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[int, bytes]]" = OrderedDict()
+        self.building: Dict[Tuple[str, str, int], asyncio.Task] = {}
+        # Позначка запуску: ETag попереднього процесу з тією ж версією не збігається
+        self.boot = format(int(time.time()), "x")
+
+    def version(self, room_id: str) -> int:
+        return self.versions.get(room_id, 0)
+
+    def etag(self, room_id: str, version: int = None) -> str:
+        return f'W/"{self.boot}-{self.version(room_id) if version is None else version}"'
+
+    def not_modified(self, request: Request, room_id: str) -> Optional[Response]:
+        """304 для актуальної копії клієнта (None - дані змінилися або запит без If-None-Match)"""
+        etag = self.etag(room_id)
+        if not etag_matches(request, etag):
+            return None
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    async def respond(self, request: Request, kind: str, room_id: str, build: Callable[[], Awaitable]) -> Response:
+        """Відповідь з ETag версії кімнати: 304 або закодований знімок (get)"""
+        version = self.version(room_id)
+        etag = self.etag(room_id, version)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request, etag):
+            snapshot_requests.inc(kind, "not_modified")
+            return Response(status_code=304, headers=headers)
+        return Response(content=await self.get(kind, room_id, build), media_type="application/json", headers=headers)
+
+    def invalidate(self, room_id: str):
+        """Дані кімнати змінилися: наступний запит будує новий знімок"""
+        self.versions[room_id] = self.versions.get(room_id, 0) + 1
+
+    async def get(self, kind: str, room_id: str, build: Callable[[], Awaitable]) -> bytes:
+        """Закодований знімок; build - читання даних з БД (викликається один раз на версію),
+        повертає тіло або вже закодований буфер (побудова в пулі процесів, jobs.py)"""
+        version = self.version(room_id)
+        entry = self.entries.get((kind, room_id))
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end((kind, room_id))
+            snapshot_requests.inc(kind, "hit")
+            return entry[1]
+
+        key = (kind, room_id, version)
+        task = self.building.get(key)
+        if task is None:
+            snapshot_requests.inc(kind, "miss")
+            # Окрема задача: відключення першого клієнта не скасовує побудову для решти
+            task = self.building[key] = asyncio.ensure_future(self._build(kind, room_id, version, build))
+        else:
+            snapshot_requests.inc(kind, "coalesced")
+        return await asyncio.shield(task)
+
+    async def _build(self, kind: str, room_id: str, version: int, build: Callable[[], Awaitable]) -> bytes:
+        try:
+            body = await build()
+            if not isinstance(body, bytes):
+                body = encode(body)
+        finally:
+            del self.building[(kind, room_id, version)]
+        current = self.entries.get((kind, room_id))
+        if current is None or current[0] <= version:
+            self.entries[(kind, room_id)] = (version, body)
+            self.entries.move_to_end((kind, room_id))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return body
+
+
+room_snapshots = SnapshotCache()
@@ -0,0 +1,232 @@
+"""
+Вибіркове трасування повідомлень: прийом -> збереження -> розсилка
+
+Спани записуються у файл формату Chrome Trace Event (JSON Array), який
+відкривається в chrome://tracing або https://ui.perfetto.dev.
+Коли трасування вимкнене, trace() і span() повертають спільні заглушки.
+"""
+import contextvars
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from typing import Optional
+
+import config
+from logger import get_logger
+
+log = get_logger("tracing")
+
+_enabled = False
+_sample_rate = 0.0
+_writer: Optional["TraceWriter"] = None
+_current: contextvars.ContextVar = contextvars.ContextVar("drawing_sync_trace", default=None)
+_sequence = itertools.count(1)
+
+# Зсув perf_counter відносно епохи, щоб час спанів можна було зіставити з логами
+_EPOCH_OFFSET = time.time() - time.perf_counter()
+_PID = os.getpid()
+
+
+class _NoopSpan:
+    """Заглушка, коли повідомлення не потрапило у вибірку"""
+
+    __slots__ = ()
+    trace_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, key: str, value):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    """Трасування одного повідомлення (кореневий спан)"""
+
+    __slots__ = ("trace_id", "tid", "name", "args", "start", "token")
+
+    def __init__(self, name: str, args: dict):
+        self.trace_id = uuid.uuid4().hex[:16]
+        # Кожне трасування - окремий рядок на часовій шкалі
+        self.tid = next(_sequence)
+        self.name = name
+        self.args = args
+        self.args["trace_id"] = self.trace_id
+
+    def __enter__(self):
+        self.token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _current.reset(self.token)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        _emit(self.name, "message", self.tid, self.start, end, self.args)
+        return False
+
+    def set(self, key: str, value):
+        self.args[key] = value
+
+
+class Span:
+    """Етап обробки всередині трасування"""
+
+    __slots__ = ("trace", "name", "args", "start")
+
+    def __init__(self, trace: Trace, name: str, args: dict):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        self.args["trace_id"] = self.trace.trace_id
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        _emit(self.name, "stage", self.trace.tid, self.start, end, self.args)
+        return False
+
+    def set(self, key: str, value):
+        self.args[key] = value
+
+
+def trace(name: str, **args):
+    """Початок трасування повідомлення (з імовірністю TRACING_SAMPLE_RATE)"""
+    if not _enabled or random.random() >= _sample_rate:
+        return _NOOP
+    return Trace(name, args)
+
+
+def span(name: str, **args):
+    """Спан етапу в поточному трасуванні; без трасування - заглушка"""
+    if not _enabled:
+        return _NOOP
+    current = _current.get()
+    if current is None:
+        return _NOOP
+    return Span(current, name, args)
+
+
+def current_trace_id() -> Optional[str]:
+    """Ідентифікатор поточного трасування (для логів)"""
+    current = _current.get()
+    return current.trace_id if current is not None else None
+
+
+def _emit(name: str, category: str, tid: int, start: float, end: float, args: dict):
+    if _writer is None:
+        return
+    _writer.put({
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": round((start + _EPOCH_OFFSET) * 1_000_000, 1),
+        "dur": round((end - start) * 1_000_000, 1),
+        "pid": _PID,
+        "tid": tid,
+        "args": args,
+    })
+
+
+class TraceWriter(threading.Thread):
+    """Фоновий запис спанів у файл з ротацією за розміром"""
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int, queue_size: int = 10000):
+        super().__init__(name="trace-writer", daemon=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._file = None
+
+    def put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        self.queue.put(None)
+        self.join(timeout=5)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() == 0:
+            # JSON Array Format: закриваюча "]" необов'язкова
+            self._file.write("[\n")
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def run(self):
+        self._open()
+        while True:
+            event = self.queue.get()
+            if event is None:
+                break
+            self._file.write(json.dumps(event, ensure_ascii=False) + ",\n")
+            # Дописуємо все, що накопичилося, одним скиданням на диск
+            while True:
+                try:
+                    event = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    self._file.close()
+                    return
+                self._file.write(json.dumps(event, ensure_ascii=False) + ",\n")
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        self._file.close()
+
+
+def setup_tracing():
+    """Увімкнення трасування згідно з config.TRACING_*"""
+    global _enabled, _sample_rate, _writer
+    if not config.TRACING_ENABLED or _writer is not None:
+        return
+    _writer = TraceWriter(config.TRACING_FILE, config.TRACING_MAX_BYTES, config.TRACING_BACKUP_COUNT)
+    _writer.start()
+    _sample_rate = config.TRACING_SAMPLE_RATE
+    _enabled = True
+    log.info("🔍 Трасування увімкнено: вибірка %.1f%%, файл %s", _sample_rate * 100, config.TRACING_FILE)
+
+
+def shutdown_tracing():
+    """Зупинка запису з дописуванням черги"""
+    global _enabled, _writer
+    _enabled = False
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
@@ -1,7 +1,31 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Set
+from typing import Deque, Dict, List, Optional, Set
+from collections import deque
 from datetime import datetime
+import asyncio
+import itertools
 import json
+import time
+
+import config
+
+import admission
+import auth
+import capture
+import overload
+import rate_limit
+import tracing
+from room_directory import room_directory
+from room_stream import room_streams
+from loop_watchdog import set_activity
+
+from logger import get_logger
+from metrics import (
+    messages_in, messages_out, messages_dropped, fanout_latency, connections_dropped, connections_refused,
+    send_queue_depth, send_queue_wait, connection_rtt,
+)
+
+log = get_logger("ws")
 
 # Список кімнат областей України
 UKRAINE_REGIONS = [
@@ -33,42 +57,330 @@ UKRAINE_REGIONS = [
     'м.Київ'
 ]
 
-# Словник для зберігання активних кімнат
-active_rooms = {region: [] for region in UKRAINE_REGIONS}
+# Ідентифікатори з'єднань (для запису трафіку та діагностики)
+connection_ids = itertools.count(1)
+
+# Приоритетные сообщения (управляющие и структурные) обгоняют в очереди поток точек
+PRIORITY_TYPES = {
+    "ping", "slow_down", "error", "room_joined", "user_joined", "user_left",
+    "clear", "clear_events", "drawing_event_deleted", "template",
+}
+
+# Промежуточные точки штриха, которые в режиме перегрузки "thin" можно не рассылать
+THINNABLE_ACTIONS = {"draw", "add_point", "update_point", "move", "update"}
+
+# Пакет сообщений для клиентов с ?batch=1: {"type": "batch", "messages": [...]}
+BATCH_PREFIX = '{"type": "batch", "messages": ['
+BATCH_SUFFIX = ']}'
+
+
+class OutboundMessage:
+    """Элемент очереди отправки
+    
+    Один и тот же объект ставится в очереди всех получателей - сообщение кодируется один раз.
+    group - к какой истории относится точка: "drawings" (команды рисования, очищаются "clear")
+    или "events" (события REST API, очищаются "clear_events" и удаляются "drawing_event_deleted").
+    """
+    
+    __slots__ = ("text", "type", "enqueued_at", "priority", "group", "event_id")
+    
+    def __init__(self, message: dict, enqueued_at: float):
+        self.text = json.dumps(message)
+        self.type = message.get("type", "unknown")
+        self.enqueued_at = enqueued_at
+        self.priority = self.type in PRIORITY_TYPES
+        self.event_id = message.get("event_id")
+        if self.type == "drawing":
+            self.group = "drawings"
+        elif self.type == "drawing_event":
+            self.group = "events" if self.event_id else "drawings"
+        else:
+            self.group = None
+    
+    def obsoletes(self, queued: "OutboundMessage") -> bool:
+        """Делает ли это сообщение ненужной отправку более старого queued"""
+        if self.type == "clear":
+            return queued.group == "drawings"
+        if self.type == "clear_events":
+            return queued.group == "events"
+        if self.type == "drawing_event_deleted":
+            return queued.group == "events" and queued.event_id == self.event_id
+        return False
+
+
+def is_stroke_point(message: dict) -> bool:
+    """Промежуточная точка штриха (не начало/конец фигуры и не событие REST API)"""
+    return (message.get("type") in ("drawing", "drawing_event") and not message.get("event_id")
+            and (message.get("action") or message.get("action_type")) in THINNABLE_ACTIONS)
+
+
+class StrokeThinner:
+    """Прореживание точек одного отправителя: первая точка штриха и каждая N-я рассылаются,
+    последняя придержанная - перед следующим сообщением не-точкой или по таймеру"""
+    
+    __slots__ = ("count", "held", "handle")
+    
+    def __init__(self):
+        self.count = 0
+        self.held: Optional[dict] = None
+        self.handle: Optional[asyncio.TimerHandle] = None
+    
+    def release(self) -> Optional[dict]:
+        """Придержанная точка (если есть) с отменой таймера"""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        held, self.held = self.held, None
+        return held
+
+
+class Outbox:
+    """Очередь отправки одного соединения с отдельной задачей записи
+    
+    Медленный клиент задерживает только свою очередь, а не рассылку всей комнате.
+    Две полосы: приоритетные сообщения отправляются раньше накопившихся точек, а точки,
+    которые отменил более поздний clear/удаление, выбрасываются не дойдя до сокета.
+    Здесь же хранится состояние heartbeat соединения и оценка RTT.
+    """
+    
+    def __init__(self, websocket: WebSocket, room_id: str, max_size: int, batching: bool = False,
+                 heartbeat: bool = False):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.max_size = max_size
+        # Клиент принимает пакеты сообщений - очередь отправляется одним кадром
+        self.batching = batching
+        self.priority: Deque[OutboundMessage] = deque()
+        self.queue: Deque[OutboundMessage] = deque()
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        # Время по часам цикла событий (в моделировании benchmarks/fanout_sim.py они виртуальные)
+        self.loop = asyncio.get_running_loop()
+        # Heartbeat: время последнего входящего сообщения, отправки текущего ping, сглаженный RTT.
+        # answers_pings - клиент подключился с ?heartbeat=1 (или уже отвечал pong)
+        self.last_seen = self.loop.time()
+        self.ping_sent_at: Optional[float] = None
+        self.answers_pings = heartbeat
+        self.rtt: Optional[float] = None
+    
+    def __len__(self) -> int:
+        return len(self.priority) + len(self.queue)
+    
+    def coalesce_window(self) -> float:
+        """Сколько ждать перед отправкой пакета: чем дальше клиент, тем крупнее пакеты"""
+        if not self.batching:
+            return 0.0
+        # При перегрузке пакеты укрупняются независимо от RTT
+        window = overload.controller.coalesce_window
+        if self.rtt is not None:
+            window = max(window, min(config.WS_COALESCE_MAX, self.rtt * config.WS_COALESCE_RTT_FRACTION))
+        return window
+    
+    def max_lag(self) -> float:
+        """Допустимый возраст старейшего сообщения в очереди"""
+        return max(config.WS_SLOW_CONSUMER_LAG, config.WS_SLOW_CONSUMER_RTT_FACTOR * (self.rtt or 0.0))
+    
+    def put(self, item: OutboundMessage) -> bool:
+        """Постановка в очередь; False - соединение закрыто или клиент не успевает принимать"""
+        if self.closed or len(self) >= self.max_size:
+            return False
+        if self.queue and item.enqueued_at - self.queue[0].enqueued_at > self.max_lag():
+            return False
+        if item.priority:
+            if item.type in ("clear", "clear_events", "drawing_event_deleted"):
+                self._drop_obsolete(item)
+            self.priority.append(item)
+        else:
+            self.queue.append(item)
+        send_queue_depth.inc()
+        self._wakeup.set()
+        return True
+    
+    def _drop_obsolete(self, item: OutboundMessage):
+        if not self.queue:
+            return
+        kept = deque(queued for queued in self.queue if not item.obsoletes(queued))
+        dropped = len(self.queue) - len(kept)
+        if dropped:
+            self.queue = kept
+            send_queue_depth.dec(amount=dropped)
+            messages_dropped.inc("obsolete", amount=dropped)
+    
+    def _take(self) -> List[OutboundMessage]:
+        if self.priority:
+            return [self.priority.popleft()]
+        return [self.queue.popleft()]
+    
+    def _take_all(self) -> List[OutboundMessage]:
+        items = list(self.priority)
+        items.extend(self.queue)
+        self.priority.clear()
+        self.queue.clear()
+        return items
+    
+    async def run(self):
+        """Запись сообщений из очереди в сокет: сначала приоритетная полоса"""
+        while True:
+            while not self.priority and not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            window = self.coalesce_window()
+            if window > 0:
+                # Собираем всё, что придет за окно, в один кадр
+                await asyncio.sleep(window)
+                items = self._take_all()
+            else:
+                items = self._take()
+            if not items:
+                continue
+            send_queue_depth.dec(amount=len(items))
+            now = self.loop.time()
+            for item in items:
+                send_queue_wait.observe(now - item.enqueued_at)
+                if item.type == "ping":
+                    self.ping_sent_at = now
+            if len(items) == 1:
+                await self.websocket.send_text(items[0].text)
+            else:
+                await self.websocket.send_text(BATCH_PREFIX + ",".join(item.text for item in items) + BATCH_SUFFIX)
+            for item in items:
+                messages_out.inc(self.room_id, item.type)
+    
+    def close(self):
+        """Остановка записи; неотправленные сообщения отбрасываются"""
+        self.closed = True
+        pending = len(self)
+        if pending:
+            send_queue_depth.dec(amount=pending)
+            self.priority.clear()
+            self.queue.clear()
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+
 
 class ConnectionManager:
     """Менеджер WebSocket соединений"""
     
-    def __init__(self):
+    # Соединения всех менеджеров процесса (глобальный лимит MAX_CONNECTIONS)
+    total_connections = 0
+    # Источник соединений в каталоге комнат
+    endpoint = "ws"
+    # Потоки SSE для зрителей комнат (GET /api/rooms/{room_id}/stream)
+    streams = room_streams
+    
+    def __init__(self, send_queue_size: int = None):
         # Активные соединения по комнатам
         self.active_connections: Dict[str, Set[WebSocket]] = {}
         # Мета информация о соединениях
         self.connection_info: Dict[WebSocket, dict] = {}
+        # Очереди отправки соединений
+        self.outboxes: Dict[WebSocket, Outbox] = {}
+        self.send_queue_size = send_queue_size or config.WS_SEND_QUEUE_SIZE
+        # Номер последнего ping (общий для всех соединений, кодируется один раз)
+        self.ping_id = 0
+        # Прореживание точек по отправителям (режим перегрузки "thin")
+        self.thinners: Dict[WebSocket, StrokeThinner] = {}
+    
+    def joined_message(self, room_id: str) -> dict:
+        """Уведомление участников о новом подключении"""
+        return {
+            "type": "user_joined",
+            "room_id": room_id,
+            "total_users": len(self.active_connections[room_id])
+        }
+    
+    def left_message(self, room_id: str) -> dict:
+        """Уведомление участников об отключении"""
+        return {
+            "type": "user_left",
+            "room_id": room_id,
+            "total_users": len(self.active_connections[room_id])
+        }
     
-    async def connect(self, websocket: WebSocket, room_id: str):
-        """Подключение клиента к комнате"""
+    def welcome_message(self, room_id: str) -> Optional[dict]:
+        """Личное сообщение новому участнику (None - не отправляется)"""
+        return None
+    
+    async def connect(self, websocket: WebSocket, room_id: str, batching: bool = False,
+                      heartbeat: bool = False, token: str = None) -> bool:
+        """Подключение клиента к комнате; False - подключение отклонено и закрыто
+        
+        batching - клиент принимает пакеты сообщений, heartbeat - клиент обещает отвечать pong
+        (такие соединения удаляются, если молчат дольше HEARTBEAT_MISSED_LIMIT интервалов),
+        token - токен сессии приватной комнаты (POST /api/rooms/{room_id}/auth).
+        """
         await websocket.accept()
         
+        if overload.controller.shedding:
+            await self.refuse(websocket, room_id, "overload", config.OVERLOAD_RETRY_AFTER)
+            return False
+        if auth.is_private(admission.room_settings.get(room_id)) and not auth.verify_session_token(room_id, token):
+            await self.refuse(websocket, room_id, "unauthorized", code=config.AUTH_CLOSE_CODE)
+            return False
+        refusal = admission.check(room_id, self.room_size(room_id), ConnectionManager.total_connections)
+        if refusal is not None:
+            await self.refuse(websocket, room_id, *refusal)
+            return False
+        
         if room_id not in self.active_connections:
             self.active_connections[room_id] = set()
         
         self.active_connections[room_id].add(websocket)
+        ConnectionManager.total_connections += 1
+        room_directory.joined(room_id, self.endpoint)
         self.connection_info[websocket] = {
+            "connection_id": next(connection_ids),
             "room_id": room_id,
             "connected_at": str(datetime.now())
         }
+        outbox = Outbox(websocket, room_id, self.send_queue_size, batching, heartbeat)
+        outbox.task = asyncio.create_task(self._write(outbox))
+        self.outboxes[websocket] = outbox
         
-        print(f"✅ Клиент подключился к комнате {room_id}. Всего в комнате: {len(self.active_connections[room_id])}")
+        log.info("✅ Клиент подключился к комнате %s. Всего в комнате: %d", room_id, len(self.active_connections[room_id]))
+        
+        welcome = self.welcome_message(room_id)
+        if welcome is not None:
+            await self.send_personal_message(welcome, websocket)
         
         # Отправляем информацию о подключении другим участникам
-        await self.broadcast_to_room(room_id, {
-            "type": "user_joined",
-            "room_id": room_id,
-            "total_users": len(self.active_connections[room_id])
-        }, exclude=websocket)
+        await self.broadcast_to_room(room_id, self.joined_message(room_id), exclude=websocket)
+        return True
     
-    async def disconnect(self, websocket: WebSocket, room_id: str):
-        """Отключение клиента от комнаты"""
+    async def refuse(self, websocket: WebSocket, room_id: str, reason: str, retry_after: float = None,
+                     code: int = None):
+        """Отказ в подключении: код закрытия и подсказка, через сколько секунд повторить (с разбросом)"""
+        connections_refused.inc(reason)
+        details = {"reason": reason}
+        if retry_after is not None:
+            details["retry_after"] = overload.retry_hint(retry_after)
+            log.warning("⛔ Подключение к комнате %s отклонено (%s), повтор через %.1f с",
+                        room_id, reason, details["retry_after"])
+        else:
+            log.warning("⛔ Подключение к комнате %s отклонено (%s)", room_id, reason)
+        try:
+            await websocket.close(code=code or config.REFUSE_CLOSE_CODE, reason=json.dumps(details))
+        except Exception:
+            pass
+    
+    async def _write(self, outbox: Outbox):
+        """Задача записи соединения; ошибка отправки отключает клиента"""
+        try:
+            await outbox.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("Ошибка рассылки сообщения: %s", e)
+            if outbox.websocket in self.connection_info:
+                connections_dropped.inc("send_failed")
+                await self.disconnect(outbox.websocket, outbox.room_id)
+    
+    def _remove(self, websocket: WebSocket, room_id: str) -> bool:
+        """Удаление соединения из комнаты без уведомлений; False - уже удалено"""
+        if websocket not in self.connection_info:
+            return False
+        
         if room_id in self.active_connections:
             self.active_connections[room_id].discard(websocket)
             
@@ -76,46 +388,195 @@ class ConnectionManager:
             if not self.active_connections[room_id]:
                 del self.active_connections[room_id]
         
-        if websocket in self.connection_info:
-            del self.connection_info[websocket]
+        del self.connection_info[websocket]
+        ConnectionManager.total_connections -= 1
+        room_directory.left(room_id, self.endpoint)
+        thinner = self.thinners.pop(websocket, None)
+        if thinner is not None:
+            thinner.release()
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is not None:
+            outbox.close()
+        return True
+    
+    async def disconnect(self, websocket: WebSocket, room_id: str):
+        """Отключение клиента от комнаты (повторный вызов ничего не делает)"""
+        # Последняя придержанная точка - конец штриха, она рассылается до уведомления об отключении
+        thinner = self.thinners.get(websocket)
+        held = thinner.release() if thinner is not None else None
+        if not self._remove(websocket, room_id):
+            return
+        if held is not None:
+            await self._fanout(room_id, held, websocket)
         
-        print(f"❌ Клиент отключился от комнаты {room_id}")
+        log.info("❌ Клиент отключился от комнаты %s", room_id)
         
         # Уведомляем остальных участников
         if room_id in self.active_connections:
-            await self.broadcast_to_room(room_id, {
-                "type": "user_left",
-                "room_id": room_id,
-                "total_users": len(self.active_connections[room_id])
-            })
+            await self.broadcast_to_room(room_id, self.left_message(room_id))
     
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
-        """Отправка личного сообщения"""
+    async def drop_slow_consumer(self, websocket: WebSocket, room_id: str):
+        """Отключение клиента, который не успевает принимать сообщения"""
+        if websocket not in self.connection_info:
+            return
+        log.warning("🐢 Клиент не успевает принимать сообщения и отключен (комната %s)", room_id)
+        connections_dropped.inc("slow_consumer")
+        await self.disconnect(websocket, room_id)
+        reason = {"reason": "slow_consumer", "retry_after": overload.retry_hint(config.SLOW_CONSUMER_RETRY_AFTER)}
         try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as e:
-            print(f"Ошибка отправки сообщения: {e}")
+            await websocket.close(code=config.WS_SLOW_CONSUMER_CLOSE_CODE, reason=json.dumps(reason))
+        except Exception:
+            pass
+    
+    def record_inbound(self, websocket: WebSocket, message: dict) -> bool:
+        """Учет входящего сообщения для heartbeat; True - это pong, дальше не обрабатывается"""
+        is_pong = message.get("type") == "pong"
+        outbox = self.outboxes.get(websocket)
+        if outbox is None:
+            return is_pong
+        now = outbox.loop.time()
+        outbox.last_seen = now
+        if not is_pong:
+            return False
+        outbox.answers_pings = True
+        if message.get("id") == self.ping_id and outbox.ping_sent_at is not None:
+            rtt = now - outbox.ping_sent_at
+            outbox.ping_sent_at = None
+            # Сглаженная оценка, как SRTT в TCP
+            outbox.rtt = rtt if outbox.rtt is None else outbox.rtt * 0.875 + rtt * 0.125
+            self.connection_info[websocket]["rtt_ms"] = round(outbox.rtt * 1000, 1)
+            connection_rtt.observe(rtt)
+        return True
+    
+    async def heartbeat(self, interval: float = None, missed_limit: int = None):
+        """Фоновая задача: периодический ping соединениям с heartbeat и удаление "зомби" """
+        interval = interval or config.HEARTBEAT_INTERVAL
+        missed_limit = missed_limit or config.HEARTBEAT_MISSED_LIMIT
+        while True:
+            await asyncio.sleep(interval)
+            await self.heartbeat_tick(interval * missed_limit)
+    
+    async def heartbeat_tick(self, timeout: float):
+        """Один цикл heartbeat: пакетное удаление молчащих соединений и новый ping"""
+        now = asyncio.get_running_loop().time()
+        # Клиенты без поддержки pong проверяются ping-ом протокола (uvicorn, WS_PING_*)
+        zombies = [
+            websocket for websocket, outbox in self.outboxes.items()
+            if outbox.answers_pings and now - outbox.last_seen > timeout
+        ]
+        if zombies:
+            await self.reap(zombies, "heartbeat_timeout")
+        
+        # Старые клиенты не знают сообщения ping - его получают только объявившие поддержку
+        targets = [(websocket, outbox) for websocket, outbox in self.outboxes.items() if outbox.answers_pings]
+        if not targets:
+            return
+        self.ping_id += 1
+        item = OutboundMessage({"type": "ping", "id": self.ping_id}, now)
+        overflowed = [(websocket, outbox) for websocket, outbox in targets if not outbox.put(item)]
+        for websocket, outbox in overflowed:
+            await self.drop_slow_consumer(websocket, outbox.room_id)
+    
+    async def reap(self, websockets: List[WebSocket], reason: str):
+        """Пакетное удаление соединений: одно уведомление на комнату вместо одного на клиента"""
+        rooms = set()
+        for websocket in websockets:
+            room_id = self.connection_info[websocket]["room_id"]
+            if self._remove(websocket, room_id):
+                rooms.add(room_id)
+        connections_dropped.inc(reason, amount=len(websockets))
+        log.warning("💀 Удалено соединений без ответа (%s): %d", reason, len(websockets))
+        
+        for room_id in rooms:
+            if room_id in self.active_connections:
+                await self.broadcast_to_room(room_id, self.left_message(room_id))
+        for websocket in websockets:
+            try:
+                await websocket.close(code=config.HEARTBEAT_CLOSE_CODE, reason="Heartbeat timeout")
+            except Exception:
+                pass
+    
+    async def send_personal_message(self, message: dict, websocket: WebSocket):
+        """Отправка личного сообщения (через очередь соединения, с сохранением порядка)"""
+        outbox = self.outboxes.get(websocket)
+        item = OutboundMessage(message, asyncio.get_running_loop().time())
+        if outbox is None:
+            try:
+                await websocket.send_text(item.text)
+            except Exception as e:
+                log.warning("Ошибка отправки сообщения: %s", e)
+            return
+        if not outbox.put(item):
+            await self.drop_slow_consumer(websocket, outbox.room_id)
     
     async def broadcast_to_room(self, room_id: str, message: dict, exclude: WebSocket = None):
-        """Рассылка сообщения всем участникам комнаты"""
+        """Рассылка сообщения всем участникам комнаты (exclude - отправитель)"""
+        if exclude is not None and (overload.controller.thinning or exclude in self.thinners):
+            if not await self._thin(room_id, message, exclude):
+                return
+        await self._fanout(room_id, message, exclude)
+    
+    async def _thin(self, room_id: str, message: dict, sender: WebSocket) -> bool:
+        """Режим "thin": рассылать ли сообщение отправителя (False - точка придержана или пропущена)"""
+        point = is_stroke_point(message)
+        thinner = self.thinners.get(sender)
+        if not point or not overload.controller.thinning:
+            # Штрих закончился (или режим выключен) - сначала досылается его последняя точка
+            if thinner is not None:
+                del self.thinners[sender]
+                held = thinner.release()
+                if held is not None:
+                    await self._fanout(room_id, held, sender)
+            return True
+        if thinner is None:
+            thinner = self.thinners[sender] = StrokeThinner()
+        thinner.count += 1
+        if thinner.count == 1 or thinner.count % config.OVERLOAD_THIN_EVERY == 0:
+            if thinner.release() is not None:
+                messages_dropped.inc("thinned")
+            return True
+        if thinner.held is not None:
+            messages_dropped.inc("thinned")
+        thinner.held = message
+        if thinner.handle is None:
+            thinner.handle = asyncio.get_running_loop().call_later(
+                config.OVERLOAD_THIN_HOLD, self._schedule_release, room_id, sender)
+        return False
+    
+    def _schedule_release(self, room_id: str, sender: WebSocket):
+        thinner = self.thinners.get(sender)
+        if thinner is None:
+            return
+        thinner.handle = None
+        held = thinner.release()
+        if held is not None:
+            asyncio.ensure_future(self._fanout(room_id, held, sender))
+    
+    async def _fanout(self, room_id: str, message: dict, exclude: WebSocket = None):
+        item = None
+        if self.streams is not None and room_id in self.streams.feeds:
+            # У комнаты есть зрители SSE - они получают сообщение даже без WebSocket-участников
+            item = OutboundMessage(message, asyncio.get_running_loop().time())
+            self.streams.publish(room_id, item)
+        
         if room_id not in self.active_connections:
             return
         
-        disconnected = set()
+        recipients = [conn for conn in self.active_connections[room_id] if conn != exclude]
+        if not recipients:
+            return
+        start = time.perf_counter()
         
-        for connection in self.active_connections[room_id].copy():
-            if connection == exclude:
-                continue
-                
-            try:
-                await connection.send_text(json.dumps(message))
-            except Exception as e:
-                print(f"Ошибка рассылки сообщения: {e}")
-                disconnected.add(connection)
+        with tracing.span("fanout", room=room_id, recipients=len(recipients)):
+            # Сообщение кодируется один раз для всех получателей
+            if item is None:
+                item = OutboundMessage(message, asyncio.get_running_loop().time())
+            overflowed = [conn for conn in recipients if not self.outboxes[conn].put(item)]
         
-        # Удаляем отключенные соединения
-        for connection in disconnected:
-            await self.disconnect(connection, room_id)
+        fanout_latency.observe(time.perf_counter() - start, room_id)
+        
+        for connection in overflowed:
+            await self.drop_slow_consumer(connection, room_id)
     
     def get_room_info(self, room_id: str) -> dict:
         """Информация о комнате"""
@@ -131,6 +592,10 @@ class ConnectionManager:
             ]
         }
     
+    def room_size(self, room_id: str) -> int:
+        """Количество клиентов в комнате"""
+        return len(self.active_connections.get(room_id, ()))
+    
     @property
     def rooms(self) -> Dict[str, int]:
         """Список всех активных комнат"""
@@ -139,6 +604,40 @@ class ConnectionManager:
             for room_id, connections in self.active_connections.items()
         }
 
+
+class LegacyConnectionManager(ConnectionManager):
+    """Кімнати старого endpoint /ws/old/{room}: спільний механізм розсилки, старий формат повідомлень"""
+    
+    endpoint = "ws_legacy"
+    # Комнаты областей не транслируются через SSE
+    streams = None
+    
+    def joined_message(self, room: str) -> dict:
+        return {
+            "type": "user_joined",
+            "room": room,
+            "users_count": len(self.active_connections[room])
+        }
+    
+    def left_message(self, room: str) -> dict:
+        return {
+            "type": "user_left",
+            "room": room,
+            "users_count": len(self.active_connections[room])
+        }
+    
+    def welcome_message(self, room: str) -> dict:
+        return {
+            "type": "room_joined",
+            "room": room,
+            "message": f"Підключено до кімнати: {room}"
+        }
+
+
+# Менеджер з'єднань старого endpoint (окремі кімнати: формат повідомлень відрізняється)
+legacy_manager = LegacyConnectionManager()
+
+
 async def handle_websocket_connection(websocket: WebSocket, room: str = None):
     """Обробка WebSocket підключення з вибором кімнати"""
     
@@ -147,63 +646,46 @@ async def handle_websocket_connection(websocket: WebSocket, room: str = None):
         await websocket.close(code=1003, reason="Invalid room")
         return
     
-    await websocket.accept()
-    
-    # Додаємо клієнта до відповідної кімнати
-    active_rooms[room].append(websocket)
+    # Додаємо клієнта до кімнати; інші користувачі отримують повідомлення про підключення
+    if not await legacy_manager.connect(websocket, room, heartbeat=websocket.query_params.get("heartbeat") == "1",
+                                        token=websocket.query_params.get("token")):
+        return
+    connection_id = legacy_manager.connection_info[websocket]["connection_id"]
+    capture.record_open(connection_id, capture.ENDPOINT_WS_OLD, room)
+    limiter = rate_limit.InboundLimiter(
+        room, "ws_legacy",
+        process=lambda data: legacy_manager.broadcast_to_room(room, data, exclude=websocket),
+        notify=lambda control: legacy_manager.send_personal_message(control, websocket),
+    )
     
     try:
-        # Відправляємо повідомлення про підключення до кімнати
-        await websocket.send_json({
-            "type": "room_joined",
-            "room": room,
-            "message": f"Підключено до кімнати: {room}"
-        })
-        
-        # Повідомляємо інших користувачів про нове підключення
-        await broadcast_to_room(room, {
-            "type": "user_joined",
-            "room": room,
-            "users_count": len(active_rooms[room])
-        }, exclude=websocket)
-        
         while True:
-            data = await websocket.receive_json()
-            
-            # Додаємо інформацію про кімнату до повідомлення
-            data["room"] = room
+            raw = await websocket.receive_text()
+            capture.record_message(connection_id, capture.ENDPOINT_WS_OLD, room, raw)
+            data = json.loads(raw)
+            if legacy_manager.record_inbound(websocket, data):
+                continue
             
-            # Пересилаємо повідомлення всім користувачам в кімнаті
-            await broadcast_to_room(room, data, exclude=websocket)
+            with tracing.trace("ws_legacy.message", room=room, type=data.get("type")):
+                set_activity(f"WS /ws/old/{room}: {data.get('type')}")
+                # Додаємо інформацію про кімнату до повідомлення
+                data["room"] = room
+                messages_in.inc(room, data.get("type", "unknown"), "ws_legacy")
+                room_directory.activity(room)
+                
+                # Пересилаємо повідомлення всім користувачам в кімнаті (з урахуванням ліміту частоти)
+                await limiter.submit(data)
             
     except WebSocketDisconnect:
         pass
     finally:
-        # Видаляємо клієнта з кімнати
-        if websocket in active_rooms[room]:
-            active_rooms[room].remove(websocket)
+        limiter.close()
+        capture.record_close(connection_id, capture.ENDPOINT_WS_OLD, room)
         
-        # Повідомляємо про відключення
-        await broadcast_to_room(room, {
-            "type": "user_left",
-            "room": room,
-            "users_count": len(active_rooms[room])
-        })
+        # Видаляємо клієнта з кімнати та повідомляємо про відключення
+        await legacy_manager.disconnect(websocket, room)
+
 
 async def broadcast_to_room(room: str, message: dict, exclude: WebSocket = None):
-    """Відправка повідомлення всім користувачам в кімнаті"""
-    if room not in active_rooms:
-        return
-    
-    disconnected = []
-    for websocket in active_rooms[room]:
-        if websocket != exclude:
-            try:
-                await websocket.send_json(message)
-            except:
-                disconnected.append(websocket)
-    
-    # Видаляємо відключені з'єднання
-    for ws in disconnected:
-        if ws in active_rooms[room]:
-            active_rooms[room].remove(ws)
+    """Відправка повідомлення всім користувачам в кімнаті старого endpoint"""
+    await legacy_manager.broadcast_to_room(room, message, exclude=exclude)